@@ -0,0 +1,93 @@
+"""
+Compare creating N expenses one request at a time against one bulk request.
+
+Runs against a throwaway test database, so it never touches real data.
+
+Usage (from the `fairkeep/` directory):
+    python benchmarks/bench_bulk_create.py [--sizes 10,100,500] [--participants 4]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fairkeep.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from itertools import combinations  # noqa: E402
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import CaptureQueriesContext, setup_test_environment  # noqa: E402
+
+from expenses.models import ContactRequest, Expense  # noqa: E402
+
+
+def make_users(n):
+    users = [User.objects.create_user(username=f'bench{i}', password='x') for i in range(n)]
+    ContactRequest.objects.bulk_create([
+        ContactRequest(from_user=a, to_user=b, status='accepted') for a, b in combinations(users, 2)
+    ])
+    return users
+
+
+def items(users, n):
+    ids = [u.id for u in users]
+    return [{
+        'name': f'Expense {i}', 'amount': '100.00', 'category': 'Food', 'expense_date': '2024-05-01',
+        'currency': 'ARS', 'paid_by': ids[i % len(ids)], 'split_method': 'equal',
+        'participants': ids, 'splits': [{'user': uid} for uid in ids],
+    } for i in range(n)]
+
+
+def timed(fn):
+    with CaptureQueriesContext(connection) as ctx:
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+    return elapsed, len(ctx.captured_queries)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='10,100,500')
+    parser.add_argument('--participants', type=int, default=4)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        users = make_users(args.participants)
+        client = Client()
+        client.force_login(users[0])
+
+        print(f"{'items':>6} {'single ms':>10} {'queries':>8} {'bulk ms':>9} {'queries':>8} {'speedup':>8}")
+        for n in [int(x) for x in args.sizes.split(',')]:
+            payload = items(users, n)
+
+            def single():
+                for item in payload:
+                    client.post('/api/expenses/', json.dumps(item), content_type='application/json')
+
+            def bulk():
+                client.post('/api/expenses/bulk/', json.dumps(payload), content_type='application/json')
+
+            single_s, single_q = timed(single)
+            Expense.objects.all().delete()
+            bulk_s, bulk_q = timed(bulk)
+            Expense.objects.all().delete()
+            print(f"{n:>6} {single_s * 1000:>10.1f} {single_q:>8} {bulk_s * 1000:>9.1f} {bulk_q:>8} "
+                  f"{single_s / bulk_s:>7.1f}x")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
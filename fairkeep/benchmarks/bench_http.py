@@ -0,0 +1,128 @@
+"""
+Concurrency benchmark for a running FairKeep deployment.
+
+Logs in once, then hammers the given API paths from N concurrent clients and
+reports requests/sec and latency percentiles. `--delay` makes every client
+pause between requests so many mostly-idle connections stay open, which is
+what exhausts a sync worker pool.
+
+Compare the sync and async deployments (from the `fairkeep/` directory):
+    gunicorn fairkeep.wsgi:application -w 2 --bind 127.0.0.1:8001
+    DJANGO_ASYNC_VIEWS=1 gunicorn fairkeep.asgi:application -w 2 \
+        -k uvicorn_worker.UvicornWorker --bind 127.0.0.1:8002
+
+    python benchmarks/bench_http.py --url http://127.0.0.1:8001 -u alice -p secret
+    python benchmarks/bench_http.py --url http://127.0.0.1:8002 -u alice -p secret
+"""
+import argparse
+import http.client
+import http.cookies
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+DEFAULT_PATHS = '/api/balances/,/api/activities/,/api/expenses/,/api/contacts/search/?q=a'
+
+
+def _connection(url):
+    parts = urlsplit(url)
+    cls = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    return cls(parts.hostname, parts.port, timeout=60)
+
+
+def login(url, username, password):
+    conn = _connection(url)
+    conn.request('GET', '/api/csrf/')
+    response = conn.getresponse()
+    response.read()
+    cookies = http.cookies.SimpleCookie()
+    for header in response.headers.get_all('Set-Cookie') or []:
+        cookies.load(header)
+    csrf = cookies['csrftoken'].value
+
+    body = json.dumps({'username': username, 'password': password})
+    conn.request('POST', '/api/login/', body=body, headers={
+        'Content-Type': 'application/json',
+        'X-CSRFToken': csrf,
+        'Cookie': f'csrftoken={csrf}',
+        'Referer': url,
+    })
+    response = conn.getresponse()
+    response.read()
+    if response.status != 200:
+        raise SystemExit(f'Login failed with status {response.status}')
+    for header in response.headers.get_all('Set-Cookie') or []:
+        cookies.load(header)
+    conn.close()
+    return '; '.join(f'{k}={v.value}' for k, v in cookies.items())
+
+
+def run(url, paths, cookie, concurrency, duration, delay):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(index):
+        nonlocal errors
+        conn = _connection(url)
+        i = index
+        while time.monotonic() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path, headers={'Cookie': cookie, 'Accept-Encoding': 'identity'})
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                ok = False
+                conn.close()
+                conn = _connection(url)
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+            if delay:
+                time.sleep(delay)
+        conn.close()
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    wall = time.monotonic() - started
+    return latencies, errors, wall
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('-u', '--username', required=True)
+    parser.add_argument('-p', '--password', required=True)
+    parser.add_argument('--paths', default=DEFAULT_PATHS)
+    parser.add_argument('--concurrency', default='1,10,50,200')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds each client idles between requests')
+    args = parser.parse_args()
+
+    cookie = login(args.url, args.username, args.password)
+    paths = [p.strip() for p in args.paths.split(',') if p.strip()]
+    print(f"{'clients':>8} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for concurrency in [int(c) for c in args.concurrency.split(',')]:
+        latencies, errors, wall = run(args.url, paths, cookie, concurrency, args.duration, args.delay)
+        if latencies:
+            q = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+            p50, p95, p99 = q[49] * 1000, q[94] * 1000, q[98] * 1000
+        else:
+            p50 = p95 = p99 = float('nan')
+        print(f"{concurrency:>8} {len(latencies) / wall:>9.1f} {p50:>8.1f} {p95:>8.1f} {p99:>8.1f} {errors:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Expense list serialization cost: full ExpenseSerializer vs the render cache
+(cold and warm) vs sparse fields vs the compact fast path.
+
+Runs against a throwaway test database seeded with --expenses rows visible
+to one user; each variant serializes the whole list, query included.
+
+Usage (from the `fairkeep/` directory):
+    python benchmarks/bench_list_serializers.py [--expenses 10000] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fairkeep.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.cache import caches  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+
+from expenses.models import Expense, ExpenseSplit  # noqa: E402
+from expenses.serializers import ExpenseSerializer  # noqa: E402
+from expenses.views import _sparse_list, _visible_expenses, _with_list_relations  # noqa: E402
+
+
+def seed(n_expenses):
+    alice = User.objects.create_user(username='alice')
+    bob = User.objects.create_user(username='bob')
+    start = date(2022, 1, 1)
+    expenses = Expense.objects.bulk_create([
+        Expense(
+            name=f'Expense {i}', amount=(100 + i % 900) * 10, category='Food',
+            paid_by=alice if i % 2 else bob, added_by=alice, split_method='equal',
+            expense_date=start + timedelta(days=i % 1000),
+        )
+        for i in range(n_expenses)
+    ], batch_size=2000)
+    ExpenseSplit.objects.bulk_create([
+        ExpenseSplit(expense=e, user=u, owed_amount=e.amount // 2)
+        for e in expenses for u in (alice, bob)
+    ], batch_size=2000)
+    return alice
+
+
+def full(user):
+    qs = _with_list_relations(_visible_expenses(user).order_by('-date'))
+    return ExpenseSerializer(qs, many=True).data
+
+
+def sparse(fields, cold=False):
+    def run(user):
+        if cold:
+            caches[settings.RENDER_CACHE_ALIAS].clear()
+        qs, serialize = _sparse_list(_visible_expenses(user).order_by('-date'), fields, user)
+        return serialize(list(qs))
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--expenses', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        user = seed(args.expenses)
+        variants = [
+            ('full', full),
+            ('full, render cache cold', sparse(None, cold=True)),
+            ('full, render cache warm', sparse(None)),
+            ('fields=id,name,amount,splits', sparse(['id', 'name', 'amount', 'splits'])),
+            ('compact (with net)', sparse(['id', 'name', 'amount', 'currency', 'expense_date', 'net'])),
+            ('compact (no net)', sparse(['id', 'name', 'amount', 'currency', 'expense_date'])),
+        ]
+        for label, run in variants:
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                rows = run(user)
+            ms = (time.perf_counter() - start) * 1000 / args.repeat
+            print(f"{label:<32} {ms:9.1f} ms  ({len(rows)} rows)")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Bytes on the wire and CPU per response for the expense and activity lists.
+
+Renders the serialized lists with DRF's stock JSONRenderer, FastJSONRenderer
+(orjson when installed, else its stdlib fallback) and compresses each with
+gzip and, when installed, brotli, at the levels the middleware uses.
+
+Runs against a throwaway test database.
+
+Usage (from the `fairkeep/` directory):
+    python benchmarks/bench_rendering.py [--expenses 1000] [--repeat 20]
+"""
+import argparse
+import gzip
+import os
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fairkeep.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from expenses import renderers  # noqa: E402
+from expenses.activity import log_activities  # noqa: E402
+from expenses.middleware import brotli  # noqa: E402
+from expenses.models import Expense, ExpenseSplit, FeedEntry  # noqa: E402
+from expenses.serializers import ExpenseSerializer, FeedEntrySerializer  # noqa: E402
+from expenses.views import _visible_expenses, _with_list_relations  # noqa: E402
+
+
+def seed(n_expenses):
+    alice = User.objects.create_user(username='alice', first_name='Alice')
+    bob = User.objects.create_user(username='bob', first_name='Bob')
+    start = date(2022, 1, 1)
+    expenses = Expense.objects.bulk_create([
+        Expense(
+            name=f'Groceries {i}', amount=(100 + i % 900) * 10, category='Food',
+            paid_by=alice if i % 2 else bob, added_by=alice, split_method='equal',
+            expense_date=start + timedelta(days=i % 1000),
+        )
+        for i in range(n_expenses)
+    ])
+    ExpenseSplit.objects.bulk_create([
+        ExpenseSplit(expense=e, user=u, owed_amount=e.amount // 2) for e in expenses for u in (alice, bob)
+    ])
+    log_activities('created', [(e, {alice.id, bob.id}) for e in expenses])
+    return alice
+
+
+def cpu_ms(fn, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        result = fn()
+    return (time.process_time() - start) * 1000 / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--expenses', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        user = seed(args.expenses)
+        payloads = {
+            'expenses': ExpenseSerializer(
+                _with_list_relations(_visible_expenses(user).order_by('-date')), many=True
+            ).data,
+            'activities': FeedEntrySerializer(
+                FeedEntry.objects.filter(user=user).order_by('-created_at', '-id')[:100], many=True
+            ).data,
+        }
+        fast = renderers.FastJSONRenderer()
+
+        def fallback(data):
+            with mock.patch.object(renderers, 'orjson', None):
+                return fast.render(data)
+
+        render_variants = [
+            ('drf JSONRenderer', JSONRenderer().render),
+            ('FastJSONRenderer' + (' (orjson)' if renderers.orjson else ' (stdlib)'), fast.render),
+            ('FastJSONRenderer (stdlib)', fallback),
+        ]
+        codings = [('gzip', lambda b: gzip.compress(b, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0))]
+        if brotli is not None:
+            codings.append(('br', lambda b: brotli.compress(b, quality=settings.COMPRESSION_BROTLI_QUALITY)))
+
+        for name, data in payloads.items():
+            print(f"{name} ({len(data)} items)")
+            for label, render in render_variants:
+                ms, body = cpu_ms(lambda: render(data), args.repeat)
+                print(f"  render {label:<30} {ms:8.2f} ms cpu  {len(body):>9} bytes")
+            for coding, compress in codings:
+                ms, compressed = cpu_ms(lambda: compress(body), args.repeat)
+                print(f"  {coding:<37} {ms:8.2f} ms cpu  {len(compressed):>9} bytes "
+                      f"({len(compressed) / len(body):.0%})")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Expense search latency against a synthetic dataset, per index backend.
+
+Runs against a throwaway test database. Expenses are spread over --users
+users in pairs; queries run as one user so they measure the scoped lookup.
+
+Usage (from the `fairkeep/` directory):
+    python benchmarks/bench_search.py [--expenses 200000] [--users 200] [--backends fts5,tokens]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fairkeep.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import override_settings, setup_test_environment  # noqa: E402
+
+from expenses import search  # noqa: E402
+from expenses.models import Expense, ExpenseSplit  # noqa: E402
+
+WORDS = ['supermarket', 'rent', 'taxi', 'dinner', 'pharmacy', 'cinema', 'groceries', 'coffee',
+         'internet', 'electricity', 'bakery', 'hardware', 'gym', 'bus', 'pizza', 'market']
+QUERIES = ['supermarket', 'super', 'rent march', 'taxi 2024', 'pizza friday', 'groceries']
+
+
+def seed(n_expenses, n_users, rng):
+    users = User.objects.bulk_create([User(username=f'bench{i}', first_name=f'Name{i}') for i in range(n_users)])
+    start = date(2022, 1, 1)
+    batch = 5000
+    for offset in range(0, n_expenses, batch):
+        expenses = []
+        pairs = []
+        for _ in range(min(batch, n_expenses - offset)):
+            a, b = rng.sample(users, 2)
+            expenses.append(Expense(
+                name=f"{rng.choice(WORDS)} {rng.choice(WORDS)}", amount=rng.randint(100, 50000),
+                category='Food', paid_by=a, added_by=a, split_method='equal',
+                expense_date=start + timedelta(days=rng.randint(0, 1000)),
+            ))
+            pairs.append((a, b))
+        expenses = Expense.objects.bulk_create(expenses)
+        ExpenseSplit.objects.bulk_create([
+            ExpenseSplit(expense=e, user=u, owed_amount=e.amount // 2)
+            for e, pair in zip(expenses, pairs) for u in pair
+        ])
+    return users
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--expenses', type=int, default=200000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--backends', default='fts5,tokens')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        users = seed(args.expenses, args.users, rng)
+        for name in args.backends.split(','):
+            with override_settings(SEARCH_BACKEND=name):
+                if name == 'fts5' and connection.vendor != 'sqlite':
+                    continue
+                start = time.perf_counter()
+                search.rebuild(batch_size=5000)
+                print(f"[{name}] indexed {args.expenses} expenses in {time.perf_counter() - start:.1f}s")
+                for q in QUERIES:
+                    start = time.perf_counter()
+                    for _ in range(args.repeat):
+                        ids = search.search(users[0], q, limit=20)
+                    ms = (time.perf_counter() - start) * 1000 / args.repeat
+                    print(f"[{name}] {q!r:<16} {ms:8.2f} ms  ({len(ids)} hits on page 1)")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
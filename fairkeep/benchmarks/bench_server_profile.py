@@ -0,0 +1,84 @@
+"""
+Requests/sec of the production gunicorn profile versus gunicorn defaults.
+
+Starts gunicorn twice against the database configured in the environment
+(set POSTGRES_* to measure connection pooling), first with stock defaults
+(one sync worker, no preload, a new DB connection per request), then with
+gunicorn.conf.py and DJANGO_PROFILE=production, and drives both with the
+load generator from bench_http.py.
+
+Usage (from the `fairkeep/` directory, with an existing user):
+    python benchmarks/bench_server_profile.py -u alice -p secret
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_http import DEFAULT_PATHS, login, run  # noqa: E402
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'{url}/api/csrf/', timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f'Server at {url} did not come up')
+
+
+def measure(label, cmd, env, url, args):
+    proc = subprocess.Popen(cmd, cwd=PROJECT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(url)
+        cookie = login(url, args.username, args.password)
+        paths = [p.strip() for p in args.paths.split(',') if p.strip()]
+        run(url, paths, cookie, args.concurrency, 1.0, 0)  # warm up
+        latencies, errors, wall = run(url, paths, cookie, args.concurrency, args.duration, 0)
+        print(f"{label:<12} {len(latencies) / wall:>9.1f} req/s  errors={errors}")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-u', '--username', required=True)
+    parser.add_argument('-p', '--password', required=True)
+    parser.add_argument('--paths', default=DEFAULT_PATHS)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=15.0)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    url = f'http://127.0.0.1:{args.port}'
+    bind = f'127.0.0.1:{args.port}'
+    base_env = {k: v for k, v in os.environ.items() if k not in ('DJANGO_PROFILE', 'DJANGO_ASYNC_VIEWS')}
+
+    with tempfile.NamedTemporaryFile('w', suffix='.py') as empty_config:
+        # An empty config file stops gunicorn from picking up ./gunicorn.conf.py
+        measure('defaults', [
+            'gunicorn', '-c', empty_config.name, 'fairkeep.wsgi:application', '--bind', bind,
+        ], base_env, url, args)
+
+    measure('production', ['gunicorn'], {
+        **base_env,
+        'DJANGO_PROFILE': 'production',
+        'DJANGO_ASYNC_VIEWS': 'True',
+        'GUNICORN_BIND': bind,
+        'GUNICORN_ACCESSLOG': '',
+    }, url, args)
+
+
+if __name__ == '__main__':
+    main()
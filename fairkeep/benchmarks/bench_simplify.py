@@ -0,0 +1,51 @@
+"""
+Benchmark the group debt-simplification engine.
+
+Usage (from the `fairkeep/` directory):
+    python benchmarks/bench_simplify.py [--sizes 10,100,1000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fairkeep.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from expenses.debts import simplify_debts  # noqa: E402
+
+
+def random_positions(n, rng):
+    # Minor units, as stored
+    positions = {uid: rng.randint(-50000, 50000) for uid in range(1, n)}
+    positions[n] = -sum(positions.values())
+    return positions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='10,100,1000')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'members':>8} {'pairwise':>9} {'transfers':>9} {'ms/run':>9}")
+    for n in [int(x) for x in args.sizes.split(',')]:
+        samples = [random_positions(n, rng) for _ in range(args.repeat)]
+        start = time.perf_counter()
+        transfers = 0
+        for positions in samples:
+            transfers += len(simplify_debts(positions))
+        elapsed = (time.perf_counter() - start) / args.repeat
+        print(f"{n:>8} {n * (n - 1) // 2:>9} {transfers // args.repeat:>9} {elapsed * 1000:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+Concurrent writers and readers on one SQLite file: stock settings vs the
+production profile (DJANGO_SQLITE_PRODUCTION: WAL, busy timeout,
+synchronous=NORMAL, mmap, cache size and BEGIN IMMEDIATE).
+
+Each mode runs in its own process against a fresh database file in a
+temporary directory. --writers threads create --expenses expenses each through
+POST /api/expenses/ while --readers threads keep reading balances and the
+compact expense list; every thread has its own connection, as worker threads
+do. Reports throughput, latency and requests that failed, e.g. with
+"database is locked".
+
+Usage (from the `fairkeep/` directory):
+    python benchmarks/bench_sqlite_concurrency.py [--writers 8] [--readers 4] [--expenses 50]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    return sorted(values)[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(args):
+    sys.path.insert(0, str(PROJECT_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fairkeep.settings')
+    import logging
+
+    import django
+
+    django.setup()
+
+    from itertools import combinations
+
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+
+    from expenses.models import ContactRequest, Expense
+
+    setup_test_environment()
+    # Failed requests are counted below; their tracebacks would drown the output
+    logging.disable(logging.CRITICAL)
+    call_command('migrate', verbosity=0)
+    users = [User.objects.create_user(username=f'bench{i}', password='x') for i in range(4)]
+    ContactRequest.objects.bulk_create([
+        ContactRequest(from_user=a, to_user=b, status='accepted') for a, b in combinations(users, 2)
+    ])
+    ids = [u.id for u in users]
+
+    def logged_in_client(n):
+        client = Client(raise_request_exception=False)
+        client.force_login(users[n % len(users)])
+        return client
+
+    # Logged in up front: only the expense requests run concurrently
+    write_clients = [logged_in_client(n) for n in range(args.writers)]
+    read_clients = [logged_in_client(n) for n in range(args.readers)]
+    connection.close()
+
+    writes, reads, failures = [], [], []
+    lock = threading.Lock()
+    writers_done = threading.Event()
+
+    def writer(n):
+        client = write_clients[n]
+        for i in range(args.expenses):
+            payload = {
+                'name': f'Expense {n}-{i}', 'amount': '100.00', 'category': 'Food', 'expense_date': '2024-05-01',
+                'currency': 'ARS', 'paid_by': ids[n % len(ids)], 'split_method': 'equal',
+                'participants': ids, 'splits': [{'user': uid} for uid in ids],
+            }
+            start = time.perf_counter()
+            try:
+                status = client.post('/api/expenses/', payload, content_type='application/json').status_code
+            except Exception as e:  # a failure inside the test client itself
+                status = repr(e)
+            elapsed = time.perf_counter() - start
+            with lock:
+                (writes if status == 201 else failures).append(elapsed if status == 201 else status)
+        connection.close()
+
+    def reader(n):
+        client = read_clients[n]
+        while not writers_done.is_set():
+            for path in ('/api/balances/', '/api/expenses/?view=compact'):
+                start = time.perf_counter()
+                status = client.get(path).status_code
+                elapsed = time.perf_counter() - start
+                with lock:
+                    (reads if status == 200 else failures).append(elapsed if status == 200 else status)
+        connection.close()
+
+    write_threads = [threading.Thread(target=writer, args=(n,)) for n in range(args.writers)]
+    read_threads = [threading.Thread(target=reader, args=(n,)) for n in range(args.readers)]
+    start = time.perf_counter()
+    for thread in read_threads + write_threads:
+        thread.start()
+    for thread in write_threads:
+        thread.join()
+    writers_done.set()
+    for thread in read_threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    created = Expense.objects.count()
+    print(
+        f"{args.label:<12} {len(writes) / elapsed:7.1f} writes/s  {len(reads) / elapsed:7.1f} reads/s"
+        f"  write p50 {statistics.median(writes or [0]) * 1000:6.1f} ms p95 {_percentile(writes, 0.95) * 1000:7.1f} ms"
+        f"  read p95 {_percentile(reads, 0.95) * 1000:6.1f} ms  failed {len(failures):4d}"
+        f"  ({created}/{args.writers * args.expenses} expenses saved)"
+    )
+    kinds = {}
+    for status in failures:
+        kinds[status] = kinds.get(status, 0) + 1
+    for status, count in sorted(kinds.items(), key=lambda item: -item[1])[:3]:
+        print(f"{'':<12}   {count} x {status}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--expenses', type=int, default=50, help='expenses per writer')
+    parser.add_argument('--label', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.label:
+        run(args)
+        return
+
+    for label, production in (('stock', 'False'), ('production', 'True')):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {
+                **os.environ, 'DJANGO_SQLITE_PATH': str(Path(tmp) / 'bench.sqlite3'),
+                'DJANGO_SQLITE_PRODUCTION': production, 'DJANGO_DEBUG': 'False',
+            }
+            env.pop('POSTGRES_DB', None)
+            env.pop('DJANGO_DB_REPLICAS', None)
+            subprocess.run(
+                [sys.executable, __file__, '--label', label, '--writers', str(args.writers),
+                 '--readers', str(args.readers), '--expenses', str(args.expenses)],
+                env=env, cwd=PROJECT_DIR, check=True,
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Worker cold start and memory per worker.
+
+Import budget: the self time of the project's own modules (expenses,
+fairkeep) during a production boot, from `python -X importtime`; exits
+non-zero above --budget-ms. It guards against eager heavy imports and is
+kept out of the unit tests, where a loaded machine would make it flaky.
+
+Cold start: boots the app (settings, apps, URLconf) in fresh interpreters,
+with the dev-only apps (DJANGO_DEV_APPS=True, as before they were split out)
+and with the production app set, and reports the median boot time and the
+peak RSS of the booted process.
+
+Memory: starts gunicorn from gunicorn.conf.py with --workers workers, once
+without preload, once with preload but no gc.freeze() and once with both,
+warms every worker up with --requests requests and reads each worker's
+/proc/<pid>/smaps_rollup. USS (private pages) is what a worker really adds;
+shared pages are the copy-on-write ones inherited from the master. Linux only.
+
+Usage (from the `fairkeep/` directory):
+    python benchmarks/bench_worker_startup.py [--boots 10] [--workers 4] [--requests 400] [--budget-ms 150]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+# Talk to the local server directly, whatever *_proxy says
+opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+BOOT = """
+import resource, time
+start = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+from fairkeep.wsgi import application
+print((time.perf_counter() - start) * 1000, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+IMPORT_BOOT = "from fairkeep.wsgi import application; from django.urls import get_resolver; get_resolver().url_patterns"
+
+
+def import_budget(budget_ms):
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'fairkeep.settings', 'DJANGO_DEBUG': 'False'}
+    env.pop('DJANGO_DEV_APPS', None)
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', IMPORT_BOOT],
+        cwd=PROJECT_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stderr
+    project_us = 0
+    for line in stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            own, _cumulative, name = line[len('import time:'):].split('|')
+            if own.strip().isdigit() and name.strip().split('.')[0] in ('expenses', 'fairkeep'):
+                project_us += int(own)
+    print(f"{'project import self time':<28} {project_us / 1000:7.1f} ms (budget {budget_ms} ms)")
+    return project_us / 1000 <= budget_ms
+
+
+def cold_start(label, extra_env, boots):
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'fairkeep.settings', 'DJANGO_DEBUG': 'False', **extra_env}
+    times, rss = [], []
+    for _ in range(boots):
+        out = subprocess.run(
+            [sys.executable, '-c', BOOT], cwd=PROJECT_DIR, env=env, capture_output=True, text=True, check=True,
+        ).stdout.split()
+        times.append(float(out[0]))
+        rss.append(int(out[1]))
+    print(f"{label:<28} boot {statistics.median(times):7.1f} ms (median of {boots})"
+          f"  peak RSS {statistics.median(rss) / 1024:6.1f} MiB")
+
+
+def _children(pid):
+    children = []
+    for entry in Path('/proc').iterdir():
+        if entry.name.isdigit():
+            try:
+                stat = (entry / 'stat').read_text()
+            except OSError:
+                continue
+            if int(stat.rsplit(')', 1)[1].split()[1]) == pid:
+                children.append(int(entry.name))
+    return children
+
+
+def _smaps(pid):
+    values = {}
+    for line in Path(f'/proc/{pid}/smaps_rollup').read_text().splitlines()[1:]:
+        key, value = line.split(':', 1)
+        values[key] = int(value.split()[0])
+    return values
+
+
+def worker_memory(label, extra_env, args, port):
+    url = f'http://127.0.0.1:{port}'
+    env = {
+        **os.environ, 'GUNICORN_BIND': f'127.0.0.1:{port}', 'GUNICORN_WORKERS': str(args.workers),
+        'GUNICORN_ACCESSLOG': '', 'GUNICORN_MAX_REQUESTS': '0', **extra_env,
+    }
+    proc = subprocess.Popen(['gunicorn'], cwd=PROJECT_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                opener.open(f'{url}/api/csrf/', timeout=1).read()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise SystemExit(f'{label}: gunicorn did not come up')
+                time.sleep(0.2)
+        for _ in range(args.requests):
+            opener.open(f'{url}/api/csrf/', timeout=5).read()
+        workers = [_smaps(pid) for pid in _children(proc.pid)]
+        uss = [w.get('Private_Clean', 0) + w.get('Private_Dirty', 0) for w in workers]
+        pss = [w.get('Pss', 0) for w in workers]
+        rss = [w.get('Rss', 0) for w in workers]
+        print(f"{label:<28} {len(workers)} workers  RSS {statistics.mean(rss) / 1024:6.1f}"
+              f"  PSS {statistics.mean(pss) / 1024:6.1f}  USS {statistics.mean(uss) / 1024:6.1f} MiB/worker")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--boots', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--port', type=int, default=8701)
+    parser.add_argument('--skip-gunicorn', action='store_true')
+    parser.add_argument('--budget-ms', type=float, default=150)
+    args = parser.parse_args()
+
+    within_budget = import_budget(args.budget_ms)
+
+    cold_start('with dev apps', {'DJANGO_DEV_APPS': 'True'}, args.boots)
+    cold_start('production app set', {'DJANGO_DEV_APPS': 'False'}, args.boots)
+    if not args.skip_gunicorn and Path('/proc/self/smaps_rollup').exists():
+        worker_memory('no preload', {'GUNICORN_PRELOAD': 'False'}, args, args.port)
+        worker_memory('preload', {'GUNICORN_PRELOAD': 'True', 'GUNICORN_GC_FREEZE': 'False'}, args, args.port + 1)
+        worker_memory('preload + gc.freeze', {'GUNICORN_PRELOAD': 'True', 'GUNICORN_GC_FREEZE': 'True'}, args, args.port + 2)
+    if not within_budget:
+        raise SystemExit(f"Project imports exceed the {args.budget_ms} ms budget.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Activity log writes. Every write stores the matching change events with the
+activity, so the SSE stream and sync see it in the same transaction, and
+queues the fan-out of one FeedEntry per involved user as a background task.
+Callers log inside the write's transaction; a failure to store the events or
+queue the task propagates and rolls the write back, so no change can be
+committed without the events clients sync from.
+"""
+from django.contrib.auth.models import User
+
+from . import events, tasks
+from .models import Activity, FeedEntry
+
+
+def _actor_name(actor):
+    if actor:
+        return actor.get_full_name() or actor.username
+    return "Unknown"
+
+
+def fan_out_feed(activities):
+    """
+    Task: write the FeedEntry rows for `activities`, a list of [activity id,
+    involved user ids, actor name]. Entries that already exist are skipped,
+    so a retried task does not duplicate them.
+    """
+    wanted = {activity_id: (user_ids, actor_name) for activity_id, user_ids, actor_name in activities}
+    FeedEntry.objects.bulk_create([
+        FeedEntry(
+            user_id=uid,
+            activity=activity,
+            action=activity.action,
+            created_at=activity.created_at,
+            expense_id=activity.expense_id,
+            expense_name=activity.expense_name,
+            expense_amount=activity.expense_amount,
+            split_method=activity.split_method,
+            expense_date=activity.expense_date,
+            currency=activity.currency,
+            actor_name=wanted[activity.id][1],
+        )
+        for activity in Activity.objects.filter(id__in=wanted)
+        for uid in set(wanted[activity.id][0])
+    ], ignore_conflicts=True)
+
+
+def _queue_fan_out(rows):
+    tasks.enqueue('expenses.activity.fan_out_feed', {'activities': rows})
+
+
+def log_activity(action, expense, actor, splits_data, participants_ids, payer_id):
+    activity = Activity.objects.create(
+        expense=expense if action != 'deleted' else None,
+        actor=actor,
+        action=action,
+        expense_name=expense.name,
+        expense_amount=expense.amount,
+        split_method=expense.split_method,
+        expense_date=expense.expense_date,
+        currency=expense.currency,
+    )
+    involved = set(int(p) for p in participants_ids)
+    involved.add(payer_id)
+    involved.add(expense.added_by_id)
+    for split in splits_data:
+        involved.add(int(split['user']))
+    activity.involved_users.set(User.objects.filter(id__in=involved))
+    _queue_fan_out([[activity.id, list(involved), _actor_name(actor)]])
+    events.emit(events.ACTIVITY_EVENT_KINDS[action], involved, events.expense_payload(expense, actor, user_ids=involved))
+
+
+def log_activities(action, entries, actor=None):
+    """
+    Bulk variant of log_activity. `entries` is a list of (expense,
+    involved_user_ids); without an `actor` each expense's added_by is used.
+    """
+    actors = [actor if actor is not None else expense.added_by for expense, _involved in entries]
+    created = Activity.objects.bulk_create([
+        Activity(
+            expense=expense if action != 'deleted' else None,
+            actor=entry_actor,
+            action=action,
+            expense_name=expense.name,
+            expense_amount=expense.amount,
+            split_method=expense.split_method,
+            expense_date=expense.expense_date,
+            currency=expense.currency,
+        )
+        for (expense, involved), entry_actor in zip(entries, actors)
+    ])
+    Through = Activity.involved_users.through
+    Through.objects.bulk_create([
+        Through(activity_id=activity.id, user_id=uid)
+        for activity, (_expense, involved) in zip(created, entries)
+        for uid in set(involved)
+    ])
+    _queue_fan_out([
+        [activity.id, list(set(involved)), _actor_name(entry_actor)]
+        for activity, (_expense, involved), entry_actor in zip(created, entries, actors)
+    ])
+    events.emit_many([
+        (
+            events.ACTIVITY_EVENT_KINDS[action], involved,
+            events.expense_payload(expense, entry_actor, user_ids=set(involved)),
+        )
+        for (expense, involved), entry_actor in zip(entries, actors)
+    ])
@@ -1,27 +1,181 @@
-from django.contrib import admin
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
 from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
-from .models import Expense, ExpenseSplit, ContactRequest, UserAvatar
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.functional import cached_property
+from . import search
+from .activity import log_activities
+from .models import Expense, ExpenseSplit, ContactRequest, UserAvatar, ExpenseGroup, RecurringExpense, BalanceCheckpoint, Task
+from .money import format_amount
+
+
+def _estimated_rows(model):
+    """Row estimate without a scan: planner statistics on PostgreSQL, the highest id elsewhere."""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [model._meta.db_table])
+            row = cursor.fetchone()
+        return row[0] if row else 0
+    return model.objects.aggregate(highest=Max('pk'))['highest'] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts exactly up to ADMIN_EXACT_COUNT_LIMIT rows and stops there. Past
+    the limit an unfiltered changelist shows an estimate of the table size and
+    a filtered one shows the limit, so no page load scans a whole table.
+    """
+
+    @cached_property
+    def count(self):
+        limit = settings.ADMIN_EXACT_COUNT_LIMIT
+        counted = self.object_list.order_by()[:limit + 1].count()
+        if counted <= limit or self.object_list.query.where:
+            return counted
+        return max(counted, _estimated_rows(self.object_list.model))
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist settings for tables with millions of rows."""
+    paginator = EstimatedCountPaginator
+    # Skips the second, unfiltered COUNT(*) behind "N results (M total)"
+    show_full_result_count = False
+
+
+def recategorize(queryset, category, actor, batch_size=None):
+    """
+    Move the expenses in `queryset` to `category`, `batch_size` expenses per
+    transaction, reindexing them for search and logging one 'updated'
+    activity each in bulk. Returns how many expenses changed.
+    """
+    batch_size = batch_size or settings.ADMIN_BULK_BATCH_SIZE
+    pending = queryset.exclude(category=category).order_by('pk').only(
+        'id', 'name', 'amount', 'currency', 'split_method', 'expense_date', 'added_by', 'paid_by',
+    )
+    changed = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            batch = list(pending.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            ids = [expense.pk for expense in batch]
+            last_id = ids[-1]
+            now = timezone.now()
+            Expense.objects.filter(pk__in=ids).update(category=category, updated_at=now)
+            involved = {expense.pk: {expense.paid_by_id, expense.added_by_id} for expense in batch}
+            for expense_id, user_id in ExpenseSplit.objects.filter(expense_id__in=ids).values_list('expense_id', 'user_id'):
+                involved[expense_id].add(user_id)
+            for expense in batch:
+                expense.category = category
+                expense.updated_at = now
+            search.index_expenses(ids)
+            log_activities('updated', [(expense, involved[expense.pk]) for expense in batch], actor=actor)
+        changed += len(batch)
+    return changed
+
+
+class RecategorizeActionForm(ActionForm):
+    category = forms.ChoiceField(choices=[("", "---------")] + Expense.CATEGORY_CHOICES, required=False)
 
 
 @admin.register(Expense)
-class ExpenseAdmin(admin.ModelAdmin):
-    list_display = ("name", "amount", "category", "expense_date", "date", "added_by", "paid_by", "split_method")
+class ExpenseAdmin(LargeTableAdmin):
+    list_display = ("name", "amount_display", "category", "expense_date", "date", "added_by", "paid_by", "split_method")
     list_filter = ("category", "split_method", "expense_date", "date")
+    list_select_related = ("added_by", "paid_by")
     search_fields = ("name", "added_by__username", "paid_by__username")
-    date_hierarchy = "date"
+    autocomplete_fields = ("added_by", "paid_by", "group", "recurring")
+    action_form = RecategorizeActionForm
+    actions = ["recategorize_selected"]
+
+    @admin.display(description="Amount", ordering="amount")
+    def amount_display(self, obj):
+        return f"{format_amount(obj.amount, obj.currency)} {obj.currency}"
+
+    @admin.action(description="Change category of selected expenses", permissions=["change"])
+    def recategorize_selected(self, request, queryset):
+        category = request.POST.get("category")
+        if category not in dict(Expense.CATEGORY_CHOICES):
+            self.message_user(request, "Choose the category to move the expenses to.", messages.WARNING)
+            return
+        changed = recategorize(queryset, category, request.user)
+        self.message_user(request, f"Moved {changed} expense(s) to {category}.", messages.SUCCESS)
+
+
+@admin.register(ExpenseGroup)
+class ExpenseGroupAdmin(admin.ModelAdmin):
+    list_display = ("name", "created_by", "created_at")
+    list_select_related = ("created_by",)
+    search_fields = ("name", "created_by__username")
+    autocomplete_fields = ("created_by",)
+    filter_horizontal = ("members",)
+
+
+@admin.register(RecurringExpense)
+class RecurringExpenseAdmin(admin.ModelAdmin):
+    list_display = ("name", "amount_display", "currency", "frequency", "interval", "next_date", "active", "added_by")
+    list_filter = ("frequency", "active", "currency")
+    list_select_related = ("added_by",)
+    search_fields = ("name", "added_by__username")
+    autocomplete_fields = ("added_by", "paid_by", "group")
+
+    @admin.display(description="Amount", ordering="amount")
+    def amount_display(self, obj):
+        return format_amount(obj.amount, obj.currency)
+
+
+@admin.register(BalanceCheckpoint)
+class BalanceCheckpointAdmin(admin.ModelAdmin):
+    list_display = ("as_of", "created_at")
 
 
 @admin.register(ExpenseSplit)
-class ExpenseSplitAdmin(admin.ModelAdmin):
-    list_display = ("expense", "user", "paid_amount", "owed_amount")
+class ExpenseSplitAdmin(LargeTableAdmin):
+    list_display = ("expense", "user", "paid_display", "owed_display")
+    list_select_related = ("expense", "user")
     search_fields = ("expense__name", "user__username")
+    autocomplete_fields = ("expense", "user")
+
+    @staticmethod
+    def _touch_expenses(expense_ids):
+        # Splits are part of the expense's cached rendering (expenses/render_cache.py)
+        Expense.objects.filter(pk__in=expense_ids).update(updated_at=timezone.now())
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self._touch_expenses({obj.expense_id, form.initial.get("expense")} - {None})
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self._touch_expenses([obj.expense_id])
+
+    def delete_queryset(self, request, queryset):
+        expense_ids = set(queryset.values_list("expense_id", flat=True))
+        super().delete_queryset(request, queryset)
+        self._touch_expenses(expense_ids)
+
+    @admin.display(description="Paid amount", ordering="paid_amount")
+    def paid_display(self, obj):
+        return format_amount(obj.paid_amount, obj.expense.currency)
+
+    @admin.display(description="Owed amount", ordering="owed_amount")
+    def owed_display(self, obj):
+        return format_amount(obj.owed_amount, obj.expense.currency)
 
 
 @admin.register(ContactRequest)
 class ContactRequestAdmin(admin.ModelAdmin):
     list_display = ("from_user", "to_user", "status", "created_at")
     list_filter = ("status", "created_at")
+    list_select_related = ("from_user", "to_user")
+    autocomplete_fields = ("from_user", "to_user")
     search_fields = (
         "from_user__username",
         "to_user__username",
@@ -35,12 +189,29 @@ class ContactRequestAdmin(admin.ModelAdmin):
 @admin.register(UserAvatar)
 class UserAvatarAdmin(admin.ModelAdmin):
     list_display = ("user", "has_data")
+    list_select_related = ("user",)
+    autocomplete_fields = ("user",)
     search_fields = ("user__username", "user__first_name", "user__last_name")
 
     @admin.display(boolean=True, description="Has avatar")
     def has_data(self, obj):
         return bool(obj.data)
 
+
+@admin.register(Task)
+class TaskAdmin(LargeTableAdmin):
+    list_display = ("id", "name", "status", "attempts", "run_after", "locked_by", "finished_at")
+    list_filter = ("status", "name")
+    readonly_fields = ("attempts", "locked_by", "locked_until", "last_error", "created_at", "finished_at")
+    actions = ("retry_selected",)
+
+    @admin.action(description="Retry selected tasks now")
+    def retry_selected(self, request, queryset):
+        retried = queryset.exclude(status=Task.RUNNING).update(
+            status=Task.QUEUED, run_after=timezone.now(), attempts=0, finished_at=None,
+        )
+        self.message_user(request, f"Queued {retried} tasks.")
+
 # Remove email from admin forms/list to avoid storing/editing redundant data
 admin.site.unregister(User)
 
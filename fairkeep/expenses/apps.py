@@ -1,6 +1,33 @@
+import logging
+
 from django.apps import AppConfig
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Caches that keep entries per process, so throttle buckets are not shared
+UNSHARED_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
 
 
 class ExpensesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'expenses'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from .metrics import install_query_timer
+
+        connection_created.connect(install_query_timer, dispatch_uid='expenses.metrics.query_timer')
+        self.warn_unshared_cache()
+
+    @staticmethod
+    def warn_unshared_cache():
+        backend = settings.CACHES['default']['BACKEND']
+        if settings.THROTTLE_ENABLED and settings.PRODUCTION_PROFILE and backend in UNSHARED_CACHES:
+            logger.warning(
+                "Throttle buckets are in a per-process cache (%s), so each worker enforces its own limits. "
+                "Set DJANGO_CACHE_BACKEND=redis or memcached.", backend,
+            )
@@ -0,0 +1,204 @@
+"""
+Async implementations of the read-heavy endpoints.
+
+They return the same payloads as their DRF counterparts in views.py but run on
+Django's async ORM, so under an ASGI worker a slow client or a long balance
+scan does not hold a worker thread. Enabled with DJANGO_ASYNC_VIEWS.
+"""
+import asyncio
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.db import models
+from django.http import StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import ValidationError
+
+from . import checkpoints, events, throttling
+from .filters import ExpenseFilterBackend
+from .models import ContactRequest
+from .renderers import FastJsonResponse as JsonResponse
+from .routing import replica_reads
+from .serializers import CompactExpenseSerializer, FeedEntrySerializer
+from .views import (
+    ExpenseViewSet,
+    _activity_feed,
+    _add_checkpoint_balances,
+    _add_to_balances,
+    _balance_expenses,
+    _balances_result,
+    _contact_search_queryset,
+    _contact_search_result,
+    _list_fields,
+    _pending_contact_requests,
+    _sparse_list,
+    _visible_expenses,
+)
+
+
+def async_login_required(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return JsonResponse({"detail": "Authentication credentials were not provided."}, status=403)
+        request.user = user
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def _method_not_allowed(request):
+    return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+
+
+async def _acontact_ids(user):
+    accepted = ContactRequest.objects.filter(
+        status='accepted'
+    ).filter(models.Q(from_user=user) | models.Q(to_user=user)).values_list('from_user_id', 'to_user_id')
+    contact_ids = set()
+    async for from_id, to_id in accepted:
+        contact_ids.add(from_id if to_id == user.id else to_id)
+    return contact_ids
+
+
+_expense_collection = ExpenseViewSet.as_view({'get': 'list', 'post': 'create'})
+
+
+@csrf_exempt  # writes are delegated to DRF, which enforces CSRF for session auth
+async def expense_list(request):
+    if request.method != 'GET':
+        return await sync_to_async(_expense_collection)(request)
+    return await _expense_list(request)
+
+
+@async_login_required
+@replica_reads
+async def _expense_list(request):
+    try:
+        qs = ExpenseFilterBackend().filter_queryset(request, _visible_expenses(request.user), None)
+        fields = _list_fields(request.GET)
+    except ValidationError as e:
+        return JsonResponse(e.detail, status=400)
+    qs, serialize = _sparse_list(qs.order_by('-date'), fields, request.user)
+    rows = [row async for row in qs]
+    if fields is not None and CompactExpenseSerializer.supports(fields):
+        return JsonResponse(serialize(rows), safe=False)
+    # The render cache reads the cache and loads misses synchronously
+    return JsonResponse(await sync_to_async(serialize)(rows), safe=False)
+
+
+@async_login_required
+@replica_reads
+async def balances(request):
+    if request.method != 'GET':
+        return _method_not_allowed(request)
+    current_user = request.user
+    balances_map = {}
+    checkpoint = await checkpoints.alatest_checkpoint()
+    if checkpoint:
+        rows = [row async for row in checkpoints.user_balances(checkpoint, current_user)]
+        _add_checkpoint_balances(balances_map, rows, current_user)
+    async for expense in _balance_expenses(current_user, after=checkpoint.as_of if checkpoint else None):
+        _add_to_balances(balances_map, expense, current_user)
+    return JsonResponse(_balances_result(balances_map), safe=False)
+
+
+@async_login_required
+@replica_reads
+async def activities(request):
+    if request.method != 'GET':
+        return _method_not_allowed(request)
+    items = [entry async for entry in _activity_feed(request.user)]
+    return JsonResponse(FeedEntrySerializer(items, many=True).data, safe=False)
+
+
+@async_login_required
+async def contact_search(request):
+    if request.method != 'GET':
+        return _method_not_allowed(request)
+    wait = await throttling.acheck(request, 'contact_search', request.user.id)
+    if wait:
+        return throttling.throttled_response(wait)
+    q = request.GET.get("q", "").strip()
+    if not q:
+        return JsonResponse([], safe=False)
+    contact_ids = await _acontact_ids(request.user)
+    pending_pairs = set()
+    async for from_id, to_id in _pending_contact_requests(request.user):
+        pending_pairs.add(from_id)
+        pending_pairs.add(to_id)
+
+    qs = _contact_search_queryset(request.user, q, contact_ids)
+    return JsonResponse([_contact_search_result(u, pending_pairs) async for u in qs], safe=False)
+
+
+def _last_event_id(request):
+    raw = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    try:
+        return int(raw) if raw else None
+    except ValueError:
+        return None
+
+
+async def _event_stream(user_id, last_id):
+    yield f"retry: {settings.SSE_RETRY_MS}\n\n"
+    key = events.latest_key(user_id)
+    now = time.monotonic()
+    deadline = now + settings.SSE_MAX_DURATION
+    next_db_poll = now
+    next_heartbeat = now + settings.SSE_HEARTBEAT_INTERVAL
+    while now < deadline:
+        # The cached id is a hint published by writers in any worker; the
+        # periodic DB poll covers per-process caches and evictions.
+        hint = await cache.aget(key)
+        if hint is None or hint > last_id or now >= next_db_poll:
+            ceiling = await events.avisible_ceiling()
+            batch = [event async for event in events.events_after(user_id, last_id, ceiling)]
+            for event in batch:
+                yield events.format_event(event)
+                last_id = event.id
+            if batch:
+                next_heartbeat = now + settings.SSE_HEARTBEAT_INTERVAL
+            elif hint is not None and hint > last_id and await events.apruned_through(hint):
+                # Skip the hint only once its events are gone; until then the
+                # row it names may simply not be visible here yet
+                last_id = hint
+            if hint is None:
+                await cache.aadd(key, last_id, timeout=settings.SSE_LATEST_TIMEOUT)
+            next_db_poll = now + settings.SSE_DB_POLL_INTERVAL
+        if now >= next_heartbeat:
+            yield ": keepalive\n\n"
+            next_heartbeat = now + settings.SSE_HEARTBEAT_INTERVAL
+        await asyncio.sleep(settings.SSE_POLL_INTERVAL)
+        now = time.monotonic()
+
+
+def _event_backlog(user_id, last_id):
+    # Sync servers cannot hold the connection cheaply: send what is pending
+    # and let EventSource reconnect with Last-Event-ID after `retry`.
+    yield f"retry: {settings.SSE_RETRY_MS}\n\n"
+    for event in events.events_after(user_id, last_id, events.visible_ceiling()):
+        yield events.format_event(event)
+
+
+@async_login_required
+async def event_stream(request):
+    if request.method != 'GET':
+        return _method_not_allowed(request)
+    user_id = request.user.id
+    last_id = _last_event_id(request)
+    if last_id is None:
+        last_id = await events.latest_event_id(user_id).afirst() or 0
+
+    if isinstance(request, ASGIRequest):
+        stream = _event_stream(user_id, last_id)
+    else:
+        stream = _event_backlog(user_id, last_id)
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
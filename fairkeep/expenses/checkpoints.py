@@ -0,0 +1,164 @@
+"""
+Balance checkpoints and archival of closed periods.
+
+A checkpoint stores, per group (or no group), currency and pair of users,
+the net amount one owes the other from every expense dated on or before its
+`as_of` date, in minor units. Each checkpoint is built from the previous one plus the
+expenses after it, so expenses covered by a checkpoint can be archived out
+of the live tables without changing any balance. Balance reads combine the
+latest checkpoint with the live expenses dated after it.
+
+A checkpoint and a write that adds, changes or removes splits must not
+interleave: a split committed after the checkpoint summed the period, but
+dated inside it, would be in neither the checkpoint nor the live sum. Write
+paths therefore check their dates against lock_open_period() inside their
+transaction. On PostgreSQL it takes a shared advisory lock held until commit,
+and create_checkpoint() takes it exclusively, so each waits for the other.
+SQLite runs one write transaction at a time: under BEGIN IMMEDIATE (the
+production profile) they simply queue, and otherwise the later one fails
+instead of committing on a stale read.
+"""
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import F, Q, Sum
+
+from . import search
+from .models import (
+    ArchivedExpense,
+    ArchivedExpenseSplit,
+    BalanceCheckpoint,
+    CheckpointBalance,
+    Expense,
+    ExpenseSplit,
+    RecurringExpense,
+)
+
+
+# pg_advisory_xact_lock key for closing periods ("fkcp")
+PERIOD_LOCK = 0x666b6370
+
+
+def _lock_periods(shared):
+    if connection.vendor == 'postgresql':
+        function = 'pg_advisory_xact_lock_shared' if shared else 'pg_advisory_xact_lock'
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT {function}(%s)", [PERIOD_LOCK])
+
+
+def latest_checkpoint():
+    return BalanceCheckpoint.objects.order_by('-as_of').first()
+
+
+async def alatest_checkpoint():
+    return await BalanceCheckpoint.objects.order_by('-as_of').afirst()
+
+
+def closed_through():
+    """Last closed expense date, or None when no checkpoint exists."""
+    return BalanceCheckpoint.objects.order_by('-as_of').values_list('as_of', flat=True).first()
+
+
+def lock_open_period():
+    """
+    closed_through() for a write in progress. Call it inside the write's
+    transaction: no checkpoint can be created until the write commits.
+    """
+    _lock_periods(shared=True)
+    return closed_through()
+
+
+def user_balances(checkpoint, user):
+    return CheckpointBalance.objects.filter(
+        Q(user_a=user) | Q(user_b=user), checkpoint=checkpoint
+    ).select_related('user_a', 'user_b')
+
+
+def signed_amount(row, user_id):
+    """The checkpoint amount from `user_id`'s side: positive when they are owed."""
+    return row.amount if row.user_a_id == user_id else -row.amount
+
+
+def create_checkpoint(as_of):
+    """
+    Close every expense dated on or before `as_of` into a new checkpoint.
+    Refused while an active recurring template has an occurrence due on or
+    before `as_of`, which could no longer be materialized once closed.
+    """
+    with transaction.atomic():
+        # Waits for writes in progress to commit, and holds new ones off
+        _lock_periods(shared=False)
+        previous = BalanceCheckpoint.objects.select_for_update().order_by('-as_of').first()
+        if previous and as_of <= previous.as_of:
+            raise ValueError(f"A checkpoint as of {previous.as_of} already exists.")
+        pending = RecurringExpense.objects.filter(active=True, next_date__lte=as_of).order_by('next_date').first()
+        if pending:
+            raise ValueError(
+                f"Recurring expense #{pending.id} has an occurrence due on {pending.next_date}; "
+                "run materialize_recurring first."
+            )
+
+        pairs = defaultdict(int)
+        if previous:
+            for row in previous.balances.values('group_id', 'currency', 'user_a_id', 'user_b_id', 'amount'):
+                pairs[(row['group_id'], row['currency'], row['user_a_id'], row['user_b_id'])] += row['amount']
+
+        splits = ExpenseSplit.objects.filter(expense__expense_date__lte=as_of).exclude(user=F('expense__paid_by'))
+        if previous:
+            splits = splits.filter(expense__expense_date__gt=previous.as_of)
+        rows = splits.values(
+            'expense__group', 'expense__currency', 'expense__paid_by', 'user'
+        ).annotate(owed=Sum('owed_amount'))
+        for row in rows:
+            payer, debtor, owed = row['expense__paid_by'], row['user'], row['owed'] or 0
+            group, currency = row['expense__group'], row['expense__currency']
+            if payer < debtor:
+                pairs[(group, currency, payer, debtor)] += owed
+            else:
+                pairs[(group, currency, debtor, payer)] -= owed
+
+        checkpoint = BalanceCheckpoint.objects.create(as_of=as_of)
+        CheckpointBalance.objects.bulk_create([
+            CheckpointBalance(
+                checkpoint=checkpoint, group_id=group, currency=currency,
+                user_a_id=user_a, user_b_id=user_b, amount=amount,
+            )
+            for (group, currency, user_a, user_b), amount in pairs.items()
+            if amount != 0
+        ], batch_size=1000)
+    return checkpoint
+
+
+def archive_closed(batch_size=1000):
+    """Move live expenses covered by the latest checkpoint to the archive; returns how many."""
+    as_of = closed_through()
+    if as_of is None:
+        return 0
+    archived = 0
+    while True:
+        with transaction.atomic():
+            expenses = list(
+                Expense.objects.filter(expense_date__lte=as_of)
+                .order_by('id')
+                .prefetch_related('expensesplit_set')[:batch_size]
+            )
+            if not expenses:
+                return archived
+            ArchivedExpense.objects.bulk_create([
+                ArchivedExpense(
+                    id=e.id, name=e.name, amount=e.amount, category=e.category, date=e.date,
+                    expense_date=e.expense_date, currency=e.currency, added_by_id=e.added_by_id,
+                    paid_by_id=e.paid_by_id, split_method=e.split_method, group_id=e.group_id,
+                )
+                for e in expenses
+            ])
+            ArchivedExpenseSplit.objects.bulk_create([
+                ArchivedExpenseSplit(
+                    expense_id=e.id, user_id=s.user_id, paid_amount=s.paid_amount, owed_amount=s.owed_amount,
+                )
+                for e in expenses
+                for s in e.expensesplit_set.all()
+            ])
+            search.remove_expenses([e.id for e in expenses])
+            Expense.objects.filter(id__in=[e.id for e in expenses]).delete()
+            archived += len(expenses)
@@ -0,0 +1,81 @@
+import heapq
+from collections import defaultdict
+
+from django.db.models import Sum
+
+from .checkpoints import latest_checkpoint
+from .models import ExpenseSplit
+
+
+def group_net_positions(group, currency=None):
+    """
+    Net position of every member of a group, per currency.
+
+    Positive amounts are owed to the user, negative amounts are owed by the
+    user. Mirrors the balances endpoint: the payer of an expense is owed every
+    split's owed amount, and each split user owes their own owed amount.
+    Starts from the latest balance checkpoint and adds the expenses after it.
+    Amounts are in minor units.
+    """
+    positions = defaultdict(lambda: defaultdict(int))
+    splits = ExpenseSplit.objects.filter(expense__group=group)
+    checkpoint = latest_checkpoint()
+    if checkpoint:
+        closed = checkpoint.balances.filter(group=group)
+        if currency:
+            closed = closed.filter(currency=currency)
+        for row in closed.values('currency', 'user_a', 'user_b', 'amount'):
+            positions[row['currency']][row['user_a']] += row['amount']
+            positions[row['currency']][row['user_b']] -= row['amount']
+        splits = splits.filter(expense__expense_date__gt=checkpoint.as_of)
+    if currency:
+        splits = splits.filter(expense__currency=currency)
+    rows = splits.values('expense__currency', 'expense__paid_by', 'user').annotate(owed=Sum('owed_amount'))
+
+    for row in rows:
+        owed = row['owed'] or 0
+        by_user = positions[row['expense__currency']]
+        by_user[row['user']] -= owed
+        by_user[row['expense__paid_by']] += owed
+
+    result = {}
+    for cur, by_user in positions.items():
+        non_zero = {uid: amount for uid, amount in by_user.items() if amount != 0}
+        if non_zero:
+            result[cur] = non_zero
+    return result
+
+
+def simplify_debts(net_positions):
+    """
+    Turn net positions into a short list of transfers that settles them.
+
+    Greedy: repeatedly match the largest creditor with the largest debtor.
+    Every step clears at least one side, so n users settle in at most n - 1
+    transfers, in O(n log n). Returns (debtor_id, creditor_id, amount) tuples.
+    """
+    creditors = [(-amount, uid) for uid, amount in net_positions.items() if amount > 0]
+    debtors = [(amount, uid) for uid, amount in net_positions.items() if amount < 0]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+
+    transfers = []
+    while creditors and debtors:
+        credit, creditor = heapq.heappop(creditors)
+        debt, debtor = heapq.heappop(debtors)
+        credit, debt = -credit, -debt
+        amount = min(credit, debt)
+        transfers.append((debtor, creditor, amount))
+        if credit > amount:
+            heapq.heappush(creditors, (amount - credit, creditor))
+        if debt > amount:
+            heapq.heappush(debtors, (amount - debt, debtor))
+    return transfers
+
+
+def simplify_group(group, currency=None):
+    """Settlement plan for a group: {currency: [(debtor_id, creditor_id, amount), ...]}."""
+    return {
+        cur: simplify_debts(positions)
+        for cur, positions in group_net_positions(group, currency).items()
+    }
@@ -0,0 +1,112 @@
+"""
+Per-user change events for the SSE stream.
+
+Write paths store one ChangeEvent row per affected user inside their own
+transaction, so events commit or roll back with the change itself. The
+autoincrement id doubles as the SSE event id. After commit the newest id per
+user is published to the shared cache; streams poll that key and only hit the
+database when it moved, which gives cross-worker fan-out without a broker.
+
+Readers (the stream and delta sync) remember the last id they sent and must
+never move past an event that has not committed yet. Ids are taken at insert
+but become visible at commit, so the events must commit in id order. SQLite
+has a single writer, which takes the write lock before the insert and keeps
+it until commit. On PostgreSQL, emit_many() takes a transaction-scoped
+advisory lock before inserting. The lock is held until commit, so a later
+writer cannot take an id until the earlier one's events are visible or rolled
+back. visible_ceiling() is therefore simply the largest id, read before the
+events it bounds.
+"""
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Max, Min
+
+from .models import ChangeEvent
+from .money import format_amount
+
+# pg_advisory_xact_lock key serializing event ids ("fkev")
+EVENT_ID_LOCK = 0x666b6576
+
+ACTIVITY_EVENT_KINDS = {
+    'created': 'expense_created',
+    'updated': 'expense_updated',
+    'deleted': 'expense_deleted',
+    'settled': 'settled',
+}
+
+
+def latest_key(user_id):
+    return f"fairkeep:events:latest:{user_id}"
+
+
+def expense_payload(expense, actor, expense_id=None, user_ids=()):
+    return {
+        "expense": expense_id if expense_id is not None else expense.id,
+        "name": expense.name,
+        "amount": format_amount(expense.amount, expense.currency),
+        "currency": expense.currency,
+        "actor": actor.id if actor else None,
+        # Everyone involved, so delta sync knows whose balances moved
+        "users": sorted(user_ids),
+    }
+
+
+def emit(kind, user_ids, payload):
+    emit_many([(kind, user_ids, payload)])
+
+
+def _lock_event_ids():
+    # Held until the outermost transaction ends (see the module docstring)
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [EVENT_ID_LOCK])
+
+
+def emit_many(items):
+    """Store events for `items`, a list of (kind, user_ids, payload)."""
+    # No savepoint: the events belong to the caller's transaction
+    with transaction.atomic(savepoint=False):
+        _lock_event_ids()
+        created = ChangeEvent.objects.bulk_create([
+            ChangeEvent(user_id=uid, kind=kind, payload=payload)
+            for kind, user_ids, payload in items
+            for uid in set(user_ids)
+        ])
+    latest = {}
+    for event in created:
+        latest[latest_key(event.user_id)] = max(event.id, latest.get(latest_key(event.user_id), 0))
+    if latest:
+        timeout = settings.SSE_LATEST_TIMEOUT
+        transaction.on_commit(lambda: cache.set_many(latest, timeout=timeout))
+
+
+def format_event(event):
+    data = json.dumps(event.payload, separators=(',', ':'))
+    return f"id: {event.id}\nevent: {event.kind}\ndata: {data}\n\n"
+
+
+def visible_ceiling():
+    """The last event id up to which every event has committed (0 when none has)."""
+    return ChangeEvent.objects.aggregate(last=Max('id'))['last'] or 0
+
+
+async def avisible_ceiling():
+    return (await ChangeEvent.objects.aaggregate(last=Max('id')))['last'] or 0
+
+
+def events_after(user_id, last_id, ceiling, limit=100):
+    """`user_id`'s events after `last_id`, up to the `ceiling` read before them."""
+    return ChangeEvent.objects.filter(user_id=user_id, id__gt=last_id, id__lte=ceiling).order_by('id')[:limit]
+
+
+async def apruned_through(event_id):
+    """Whether every event up to `event_id` has been pruned."""
+    oldest = (await ChangeEvent.objects.aaggregate(first=Min('id')))['first']
+    return oldest is None or oldest > event_id
+
+
+def latest_event_id(user_id):
+    return ChangeEvent.objects.filter(user_id=user_id).order_by('-id').values_list('id', flat=True)
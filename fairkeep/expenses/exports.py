@@ -0,0 +1,255 @@
+"""
+CSV export of a user's expenses, live and archived.
+
+write_csv() reads the rows of both tables in date order, EXPORT_CHUNK_SIZE at
+a time, so memory stays flat however long the history is. The synchronous
+GET /api/export-expenses/ writes straight into its response. For large
+histories there are export jobs. POST /api/exports/ queues run_export() as a
+background task, which writes the file, optionally gzipped, under
+EXPORT_ROOT and records its progress on the ExportJob. The finished file
+downloads with Range support, so an interrupted download can resume.
+
+A job's fingerprint covers the export options and the user's data as of the
+request: how many live and archived expenses involve them, the latest edit
+and the latest change event. A request with the fingerprint of a job that
+is not failed or expired reuses that job and its file. Renaming a user does
+not change any fingerprint.
+"""
+import csv
+import gzip
+import hashlib
+import heapq
+import json
+import os
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import models
+from django.utils import timezone
+
+from . import money
+from .models import ArchivedExpense, ArchivedExpenseSplit, ChangeEvent, Expense, ExpenseSplit, ExportJob
+
+# Bump when the file layout changes, so older files are not reused
+FORMAT_VERSION = 1
+HEADER = ["Date", "Description", "Category", "Amount", "Currency", "CreatedBy", "PaidBy", "SplitMethod", "SplitOptions"]
+READ_BLOCK_SIZE = 64 * 1024
+
+
+def _expenses(user):
+    return Expense.objects.filter(
+        models.Q(participants=user)
+        | models.Q(added_by=user)
+        | models.Q(paid_by=user)
+        | models.Q(expensesplit__user=user)
+    ).distinct()
+
+
+def _archived(user):
+    return ArchivedExpense.objects.filter(
+        models.Q(added_by=user)
+        | models.Q(paid_by=user)
+        | models.Q(splits__user=user)
+    ).distinct()
+
+
+def _display_name(user):
+    return user.get_full_name() or user.username
+
+
+def local_now(tz_offset):
+    # getTimezoneOffset is minutes to add to local to get UTC, so local = UTC - offset
+    return timezone.now() - timedelta(minutes=tz_offset)
+
+
+def export_filename(user, local_time):
+    return f"{user.username}_{local_time.strftime('%Y-%m-%dT%H-%M-%S')}.csv"
+
+
+def _people(user):
+    """The exporting user and everyone in their expenses, by id."""
+    user_ids = {user.id}
+    for queryset, splits in ((_expenses(user), ExpenseSplit), (_archived(user), ArchivedExpenseSplit)):
+        user_ids.update(splits.objects.filter(expense__in=queryset.values('id')).values_list('user_id', flat=True).distinct())
+        for added_by_id, paid_by_id in queryset.values_list('added_by_id', 'paid_by_id'):
+            user_ids.update((added_by_id, paid_by_id))
+    return {u.id: u for u in User.objects.filter(id__in=user_ids)}
+
+
+def _records(user, chunk_size):
+    """(expense, splits) for live and archived expenses, merged in date order."""
+    order = ('expense_date', 'date', 'id')
+    live = _expenses(user).order_by(*order).prefetch_related('expensesplit_set')
+    archived = _archived(user).order_by(*order).prefetch_related('splits')
+    return heapq.merge(
+        ((exp, list(exp.expensesplit_set.all())) for exp in live.iterator(chunk_size=chunk_size)),
+        ((exp, list(exp.splits.all())) for exp in archived.iterator(chunk_size=chunk_size)),
+        key=lambda record: (record[0].expense_date, record[0].date, record[0].id),
+    )
+
+
+def write_csv(user, out, local_time, progress=None):
+    """
+    Write `user`'s export to the text stream `out`, calling `progress(rows)`
+    after every EXPORT_CHUNK_SIZE expenses. Returns the number of expenses.
+    """
+    chunk_size = settings.EXPORT_CHUNK_SIZE
+    people = _people(user)
+    names = {uid: _display_name(u) for uid, u in people.items()}
+    other_ids = sorted([uid for uid in people if uid != user.id], key=lambda uid: names[uid].lower())
+    ordered_user_ids = [user.id] + other_ids
+    writer = csv.writer(out)
+    header = HEADER + [names[uid] for uid in ordered_user_ids]
+    writer.writerow(header)
+
+    written = 0
+    for exp, splits in _records(user, chunk_size):
+        net_by_user = {}
+        for s in splits:
+            net_by_user[s.user_id] = net_by_user.get(s.user_id, 0) + s.paid_amount - s.owed_amount
+
+        split_options = {}
+        if exp.split_method != 'equal':
+            for s in splits:
+                split_options[names[s.user_id]] = str(money.to_major(s.owed_amount, exp.currency))
+
+        row = [
+            exp.expense_date.isoformat(),
+            exp.name,
+            exp.category,
+            money.to_major(exp.amount, exp.currency),
+            exp.currency,
+            names[exp.added_by_id],
+            names[exp.paid_by_id],
+            exp.split_method.title() if exp.split_method else "",
+            json.dumps(split_options) if split_options else "",
+        ]
+        for uid in ordered_user_ids:
+            row.append(money.to_major(net_by_user.get(uid, 0), exp.currency))
+        writer.writerow(row)
+        written += 1
+        if progress is not None and written % chunk_size == 0:
+            progress(written)
+
+    # Append download timestamp row (and a spacer)
+    writer.writerow([])
+    writer.writerow([])
+    writer.writerow([local_time.strftime("%Y-%m-%d %H:%M:%S")] + [""] * (len(header) - 1))
+    return written
+
+
+def fingerprint(user, compress, tz_offset):
+    """(fingerprint, expense count) of an export of `user`'s data as it is now."""
+    live = _expenses(user).aggregate(count=models.Count('id'), updated=models.Max('updated_at'))
+    archived = _archived(user).aggregate(count=models.Count('id'), last=models.Max('id'))
+    last_event = ChangeEvent.objects.filter(user=user).aggregate(last=models.Max('id'))['last']
+    parts = [
+        FORMAT_VERSION, user.id, bool(compress), tz_offset,
+        live['count'], live['updated'] and live['updated'].isoformat(), archived['count'], archived['last'], last_event,
+    ]
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest(), live['count'] + archived['count']
+
+
+def reusable_job(user, fp):
+    """A job of `user`'s with fingerprint `fp` whose file is or will be available."""
+    cutoff = timezone.now() - timedelta(hours=settings.EXPORT_RETENTION_HOURS)
+    return (
+        ExportJob.objects.filter(user=user, fingerprint=fp, created_at__gte=cutoff)
+        .exclude(status=ExportJob.FAILED)
+        .order_by('-id')
+        .first()
+    )
+
+
+def file_path(job):
+    suffix = '.csv.gz' if job.compress else '.csv'
+    return Path(settings.EXPORT_ROOT) / f"{job.id}-{job.fingerprint[:16]}{suffix}"
+
+
+def run_export(job_id):
+    """
+    Task: write the file of ExportJob `job_id`. A retry starts the file over.
+    A failure leaves the job queued for the retry, with the error; only
+    export_failed() marks it failed, once the task has no attempts left.
+    """
+    job = ExportJob.objects.select_related('user').filter(id=job_id).first()
+    if job is None or job.status == ExportJob.DONE:
+        return
+    ExportJob.objects.filter(id=job.id).update(status=ExportJob.RUNNING, rows_written=0, error='')
+    path = file_path(job)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + '.part')
+    local_time = local_now(job.tz_offset)
+    filename = export_filename(job.user, local_time) + ('.gz' if job.compress else '')
+
+    def progress(rows):
+        ExportJob.objects.filter(id=job.id).update(rows_written=rows)
+
+    try:
+        if job.compress:
+            out = gzip.open(partial, 'wt', encoding='utf-8', newline='')
+        else:
+            out = open(partial, 'w', encoding='utf-8', newline='')
+        with out:
+            written = write_csv(job.user, out, local_time, progress=progress)
+        # The finished name only ever holds a complete file
+        os.replace(partial, path)
+    except Exception as e:
+        partial.unlink(missing_ok=True)
+        ExportJob.objects.filter(id=job.id).update(status=ExportJob.QUEUED, error=str(e))
+        raise
+    ExportJob.objects.filter(id=job.id).update(
+        status=ExportJob.DONE, filename=filename, rows_written=written, rows_total=written,
+        size=path.stat().st_size, finished_at=timezone.now(),
+    )
+
+
+def export_failed(job_id, error):
+    """on_failure of run_export: the task gave up, so the job will not finish."""
+    jobs = ExportJob.objects.filter(id=job_id).exclude(status=ExportJob.DONE)
+    jobs.update(status=ExportJob.FAILED, finished_at=timezone.now())
+    # Keep the error run_export recorded; a lost lease left none
+    jobs.filter(error='').update(error=error.strip().splitlines()[-1])
+
+
+run_export.on_failure = export_failed
+
+
+def parse_range(header, size):
+    """
+    The (start, end) byte positions, inclusive, of a single "bytes=" Range
+    `header` within a file of `size` bytes. Returns None to send the whole
+    file: no header, several ranges or a malformed one, any of which a server
+    may ignore. Raises ValueError when the range lies outside the file.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, sep, last = header[len('bytes='):].strip().partition('-')
+    if not sep or not (first or last) or not all(part.isdigit() for part in (first, last) if part):
+        return None
+    if not first:
+        # Suffix range: the last `last` bytes
+        if int(last) == 0:
+            raise ValueError(header)
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if last and end < start:
+        return None
+    if start >= size:
+        raise ValueError(header)
+    return start, min(end, size - 1)
+
+
+def read_file(path, start, length):
+    """Yield `length` bytes of `path` from `start`, in blocks."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(READ_BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
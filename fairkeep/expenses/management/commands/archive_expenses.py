@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from expenses.checkpoints import archive_closed
+
+
+class Command(BaseCommand):
+    help = "Move expenses closed by the latest balance checkpoint into the archive tables, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        archived = archive_closed(batch_size=options['batch_size'])
+        self.stdout.write(f"Archived {archived} expenses.")
@@ -0,0 +1,38 @@
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from expenses.checkpoints import create_checkpoint
+
+
+def end_of_month_before(today, months):
+    """The last day before the `months` full months preceding `today`'s month, e.g. January 31 for 1 in March."""
+    month_start = today.replace(day=1)
+    for _ in range(months):
+        month_start = (month_start - timedelta(days=1)).replace(day=1)
+    return month_start - timedelta(days=1)
+
+
+class Command(BaseCommand):
+    help = (
+        "Snapshot per-pair balances as of a date, closing all expenses dated on or before it "
+        "for every user: creating, editing or deleting them is refused from then on."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--as-of', type=date.fromisoformat, default=None,
+                            help="Last closed date (default: the end of the month CHECKPOINT_OPEN_MONTHS "
+                                 "full months before last month, i.e. last month stays open by default).")
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        as_of = options['as_of'] or end_of_month_before(today, settings.CHECKPOINT_OPEN_MONTHS)
+        if as_of >= today:
+            raise CommandError("The checkpoint date must be in the past.")
+        try:
+            checkpoint = create_checkpoint(as_of)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(f"Created checkpoint as of {as_of} with {checkpoint.balances.count()} balances.")
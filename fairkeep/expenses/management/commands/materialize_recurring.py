@@ -0,0 +1,18 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from expenses.recurring import materialize_due
+
+
+class Command(BaseCommand):
+    help = "Create the expenses for all due recurring expense occurrences. Safe to run repeatedly."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--date', type=date.fromisoformat, default=None,
+                            help="Materialize occurrences due on or before this date (default: today).")
+
+    def handle(self, *args, **options):
+        created = materialize_due(today=options['date'], batch_size=options['batch_size'])
+        self.stdout.write(f"Materialized {created} recurring expenses.")
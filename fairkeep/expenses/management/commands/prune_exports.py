@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from expenses.exports import file_path
+from expenses.models import ExportJob
+
+
+class Command(BaseCommand):
+    help = "Delete export jobs older than the retention window, with their files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=settings.EXPORT_RETENTION_HOURS)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        deleted = 0
+        for job in ExportJob.objects.filter(created_at__lt=cutoff).iterator():
+            file_path(job).unlink(missing_ok=True)
+            job.delete()
+            deleted += 1
+        self.stdout.write(f"Deleted {deleted} export jobs older than {options['hours']} hours.")
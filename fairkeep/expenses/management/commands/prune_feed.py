@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from expenses.models import Activity, FeedEntry
+
+
+class Command(BaseCommand):
+    help = "Delete feed entries and activities older than the retention window, in short batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.FEED_RETENTION_DAYS)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def _prune(self, model, cutoff, batch_size):
+        deleted = 0
+        while True:
+            # Small id batches keep each delete's transaction and locks short
+            ids = list(
+                model.objects.filter(created_at__lt=cutoff)
+                .order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                return deleted
+            model.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        entries = self._prune(FeedEntry, cutoff, options['batch_size'])
+        activities = self._prune(Activity, cutoff, options['batch_size'])
+        self.stdout.write(
+            f"Deleted {entries} feed entries and {activities} activities older than {options['days']} days."
+        )
@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from expenses.models import Task
+
+
+class Command(BaseCommand):
+    help = "Delete finished tasks older than the retention window, in batches. Failed tasks are kept."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.TASK_RETENTION_DAYS)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        deleted = 0
+        while True:
+            ids = list(
+                Task.objects.filter(status=Task.DONE, finished_at__lt=cutoff)
+                .order_by('id')
+                .values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            deleted += Task.objects.filter(id__in=ids).delete()[0]
+        self.stdout.write(f"Deleted {deleted} finished tasks older than {options['days']} days.")
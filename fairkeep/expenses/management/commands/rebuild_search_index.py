@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from expenses import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the expense search index from scratch, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        indexed = search.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(f"Indexed {indexed} expenses ({search.backend()}).")
@@ -0,0 +1,31 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the SQLite primary into every SQLite replica in DJANGO_DB_REPLICAS. "
+        "Stands in for replication when trying replica routing locally; replicas "
+        "stay as stale as the last run."
+    )
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES['default']
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("The primary database is not SQLite.")
+        if not settings.DB_REPLICAS:
+            raise CommandError("No replicas configured (DJANGO_DB_REPLICAS).")
+        source = sqlite3.connect(primary['NAME'])
+        try:
+            for alias in settings.DB_REPLICAS:
+                target = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+                try:
+                    # Online backup: consistent even while the primary is being written
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(f"Refreshed {alias} ({settings.DATABASES[alias]['NAME']}).")
+        finally:
+            source.close()
@@ -0,0 +1,51 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from expenses.tasks import default_worker_id, work
+
+
+def _serve(burst, max_tasks):
+    stopping = []
+    # Finish the task at hand, then exit
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    signal.signal(signal.SIGINT, lambda *_: stopping.append(True))
+    return work(default_worker_id(), burst=burst, max_tasks=max_tasks, should_stop=lambda: bool(stopping))
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background tasks from the task table. Run as many copies as needed, "
+        "on one host or several; --processes forks that many workers from one command."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1)
+        parser.add_argument('--burst', action='store_true', help="Exit once the queue is empty.")
+        parser.add_argument('--max-tasks', type=int, default=None, help="Exit after this many tasks (per process).")
+
+    def handle(self, *args, **options):
+        burst, max_tasks = options['burst'], options['max_tasks']
+        if options['processes'] <= 1:
+            processed = _serve(burst, max_tasks)
+            self.stdout.write(f"Ran {processed} tasks.")
+            return
+        # Children must not share the parent's database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        children = [context.Process(target=_serve, args=(burst, max_tasks)) for _ in range(options['processes'])]
+        for child in children:
+            child.start()
+
+        def stop(*_):
+            for child in children:
+                if child.is_alive():
+                    child.terminate()  # SIGTERM: they finish their current task
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        for child in children:
+            child.join()
+        self.stdout.write(f"{len(children)} workers stopped.")
@@ -0,0 +1,178 @@
+"""
+In-process request metrics rendered in the Prometheus text format.
+
+Each worker process keeps its own registry (series carry a `pid` label). All
+label sets are bounded: views beyond MAX_VIEWS collapse into "<other>", so
+memory stays flat no matter how many requests are served.
+"""
+import os
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+MAX_VIEWS = 200
+MAX_COUNTER_SERIES = 500
+MAX_STATEMENTS = 1000
+OTHER = '<other>'
+
+
+class QueryStats:
+    __slots__ = ('count', 'duration', 'statements')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        # Set to a list to keep (sql, seconds) pairs, e.g. by the profiler
+        self.statements = None
+
+
+_query_stats = ContextVar('fairkeep_query_stats', default=None)
+
+
+def start_request():
+    stats = QueryStats()
+    return stats, _query_stats.set(stats)
+
+
+def end_request(token):
+    _query_stats.reset(token)
+
+
+def current_request_stats():
+    return _query_stats.get()
+
+
+def query_timer(execute, sql, params, many, context):
+    """Connection execute wrapper accumulating DB time for the current request."""
+    stats = _query_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = perf_counter() - start
+        stats.count += 1
+        stats.duration += elapsed
+        if stats.statements is not None and len(stats.statements) < MAX_STATEMENTS:
+            stats.statements.append((sql, elapsed))
+
+
+def install_query_timer(sender, connection, **kwargs):
+    # connection_created fires again when a wrapper reconnects
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_timer)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum:.6f}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+class ViewStats:
+    __slots__ = ('duration', 'db_duration', 'queries', 'responses')
+
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.db_duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.responses = {}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+        self._counters = {}
+
+    def observe_request(self, view, status_code, duration, db_duration, queries):
+        code_class = f'{status_code // 100}xx'
+        with self._lock:
+            stats = self._views.get(view)
+            if stats is None:
+                if len(self._views) >= MAX_VIEWS:
+                    view = OTHER
+                stats = self._views.setdefault(view, ViewStats())
+            stats.duration.observe(duration)
+            stats.db_duration.observe(db_duration)
+            stats.queries.observe(queries)
+            stats.responses[code_class] = stats.responses.get(code_class, 0) + 1
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._counters and len(self._counters) >= MAX_COUNTER_SERIES:
+                return
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def counter_value(self, name, **labels):
+        return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def render(self):
+        pid = os.getpid()
+        lines = []
+        with self._lock:
+            views = sorted(self._views.items())
+            counters = sorted(self._counters.items())
+            if views:
+                for name, help_text in (
+                    ('fairkeep_request_duration_seconds', 'Wall time per request.'),
+                    ('fairkeep_request_db_seconds', 'Database time per request.'),
+                    ('fairkeep_request_queries', 'Database queries per request.'),
+                ):
+                    lines.append(f'# HELP {name} {help_text}')
+                    lines.append(f'# TYPE {name} histogram')
+                    for view, stats in views:
+                        histogram = {
+                            'fairkeep_request_duration_seconds': stats.duration,
+                            'fairkeep_request_db_seconds': stats.db_duration,
+                            'fairkeep_request_queries': stats.queries,
+                        }[name]
+                        lines.extend(histogram.render(name, f'view="{_escape(view)}",pid="{pid}"'))
+                lines.append('# HELP fairkeep_responses_total Responses by view and status class.')
+                lines.append('# TYPE fairkeep_responses_total counter')
+                for view, stats in views:
+                    for code_class, count in sorted(stats.responses.items()):
+                        lines.append(
+                            f'fairkeep_responses_total{{view="{_escape(view)}",code="{code_class}",pid="{pid}"}} {count}'
+                        )
+            seen = set()
+            for (name, labels), value in counters:
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f'# TYPE {name} counter')
+                label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+                label_text = f'{label_text},pid="{pid}"' if label_text else f'pid="{pid}"'
+                lines.append(f'{name}{{{label_text}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
@@ -0,0 +1,196 @@
+import gzip
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+from . import metrics, profiling
+
+
+def _view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unmatched>'
+    return match.view_name
+
+
+class RequestTimingMiddleware:
+    """
+    Records wall time, DB time and query count per request, reports them in
+    a Server-Timing header and aggregates them per URL name for /metrics.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats, token = metrics.start_request()
+        start = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        self._record(request, response, stats, perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        stats, token = metrics.start_request()
+        start = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        self._record(request, response, stats, perf_counter() - start)
+        return response
+
+    def _record(self, request, response, stats, duration):
+        metrics.registry.observe_request(
+            _view_label(request), response.status_code, duration, stats.duration, stats.count
+        )
+        if settings.SERVER_TIMING_HEADER:
+            response['Server-Timing'] = (
+                f'app;dur={duration * 1000:.1f}, '
+                f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"'
+            )
+
+
+class RequestProfilerMiddleware:
+    """
+    Captures a request's profile, SQL log and peak allocation sites when a
+    staff user asks for it (`X-Profile: 1` header or `?_profile=1`), and the
+    SQL log of any request slower than SLOW_REQUEST_THRESHOLD_MS (with the
+    profile too when SLOW_REQUEST_PROFILE is on). Must come after
+    AuthenticationMiddleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _flagged(request):
+        return request.headers.get('X-Profile') == '1' or request.GET.get('_profile') == '1'
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        requested = self._flagged(request) and request.user.is_staff
+        if not requested and not settings.SLOW_REQUEST_THRESHOLD_MS:
+            return self.get_response(request)
+        with profiling.Capture(profile=requested or settings.SLOW_REQUEST_PROFILE) as capture:
+            response = self.get_response(request)
+        if self._should_store(capture, requested):
+            self._store(request, response, capture, requested, request.user)
+        return response
+
+    async def __acall__(self, request):
+        requested = False
+        if self._flagged(request):
+            requested = (await request.auser()).is_staff
+        if not requested and not settings.SLOW_REQUEST_THRESHOLD_MS:
+            return await self.get_response(request)
+        with profiling.Capture(profile=requested or settings.SLOW_REQUEST_PROFILE) as capture:
+            response = await self.get_response(request)
+        if self._should_store(capture, requested):
+            self._store(request, response, capture, requested, await request.auser())
+        return response
+
+    @staticmethod
+    def _should_store(capture, requested):
+        threshold = settings.SLOW_REQUEST_THRESHOLD_MS
+        return requested or (bool(threshold) and capture.duration * 1000 >= threshold)
+
+    @staticmethod
+    def _store(request, response, capture, requested, user):
+        user_id = user.id if user.is_authenticated else None
+        name = capture.save(request, response, 'requested' if requested else 'slow', user_id)
+        if requested:
+            response['X-Profile-Id'] = name
+
+
+def _accepted_encodings(header):
+    """Codings the client accepts (q > 0) from an Accept-Encoding header."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if coding and q > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class CompressionMiddleware:
+    """
+    Compresses non-streaming responses of at least COMPRESSION_MIN_SIZE bytes
+    whose type is in COMPRESSION_CONTENT_TYPES, with brotli when it is
+    installed and the client accepts it, else gzip. Streaming responses (SSE,
+    files served by WhiteNoise) pass through untouched.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self._compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self._compress(request, await self.get_response(request))
+
+    @staticmethod
+    def _compress(request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if content_type not in settings.COMPRESSION_CONTENT_TYPES:
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+        accepted = _accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        if brotli is not None and 'br' in accepted:
+            coding, content = 'br', brotli.compress(response.content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+        elif 'gzip' in accepted:
+            coding = 'gzip'
+            content = gzip.compress(response.content, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+        else:
+            return response
+        if len(content) >= len(response.content):
+            return response
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = coding
+        # The representation changed, so a strong ETag no longer matches it
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0014_personal_split'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='expense',
+            name='split_method',
+            field=models.CharField(choices=[('equal', 'Split Equally'), ('personal', 'Personal'), ('manual', 'Manual Amount Entry'), ('percentage', 'Percentage-Based'), ('ratio', 'Ratio-Based'), ('shares', 'Shares-Based'), ('excess', 'Excess Adjustment'), ('full_owed', 'You are owed full amount'), ('full_owe', 'You owe full amount')], max_length=50),
+        ),
+        migrations.CreateModel(
+            name='ExpenseGroup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='created_expense_groups', to=settings.AUTH_USER_MODEL)),
+                ('members', models.ManyToManyField(related_name='expense_groups', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='group',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='expenses', to='expenses.expensegroup'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0016_changeevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='period_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='RecurringExpense',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('category', models.CharField(choices=[('Home Supplies', 'Home Supplies'), ('Food', 'Food'), ('Transport', 'Transport'), ('Entertainment', 'Entertainment'), ('Periodic Expenses', 'Periodic Expenses'), ('Health', 'Health'), ('Other', 'Other')], default='Periodic Expenses', max_length=20)),
+                ('currency', models.CharField(choices=[('ARS', 'Peso Argentino'), ('UYU', 'Peso Uruguayo'), ('CLP', 'Peso Chileno'), ('MXN', 'Peso Mexicano'), ('BRL', 'Real Brasilero'), ('USD', 'Dolar EEUU'), ('EUR', 'Euro'), ('GBP', 'Libras'), ('JPY', 'Yenes'), ('PYG', 'Guaranies Paraguayos'), ('AUD', 'Dolar Australiano'), ('KRW', 'Won Coreano')], default='ARS', max_length=3)),
+                ('split_method', models.CharField(choices=[('equal', 'Split Equally'), ('personal', 'Personal'), ('manual', 'Manual Amount Entry'), ('percentage', 'Percentage-Based'), ('ratio', 'Ratio-Based'), ('shares', 'Shares-Based'), ('excess', 'Excess Adjustment'), ('full_owed', 'You are owed full amount'), ('full_owe', 'You owe full amount')], max_length=50)),
+                ('splits', models.JSONField(default=list)),
+                ('frequency', models.CharField(choices=[('daily', 'Daily'), ('weekly', 'Weekly'), ('monthly', 'Monthly'), ('yearly', 'Yearly')], default='monthly', max_length=10)),
+                ('interval', models.PositiveSmallIntegerField(default=1)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('occurrence_count', models.PositiveIntegerField(default=0)),
+                ('next_date', models.DateField()),
+                ('active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('added_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurring_expenses', to=settings.AUTH_USER_MODEL)),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='recurring_expenses', to='expenses.expensegroup')),
+                ('paid_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='paid_recurring_expenses', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='recurring',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='occurrences', to='expenses.recurringexpense'),
+        ),
+        migrations.AddConstraint(
+            model_name='expense',
+            constraint=models.UniqueConstraint(fields=('recurring', 'period_date'), name='unique_recurring_period'),
+        ),
+        migrations.AddIndex(
+            model_name='recurringexpense',
+            index=models.Index(fields=['active', 'next_date'], name='recurring_due_idx'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0017_recurring_expenses'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateField(unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedExpense',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=50)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('category', models.CharField(choices=[('Home Supplies', 'Home Supplies'), ('Food', 'Food'), ('Transport', 'Transport'), ('Entertainment', 'Entertainment'), ('Periodic Expenses', 'Periodic Expenses'), ('Health', 'Health'), ('Other', 'Other')], max_length=20)),
+                ('date', models.DateTimeField()),
+                ('expense_date', models.DateField(db_index=True)),
+                ('currency', models.CharField(choices=[('ARS', 'Peso Argentino'), ('UYU', 'Peso Uruguayo'), ('CLP', 'Peso Chileno'), ('MXN', 'Peso Mexicano'), ('BRL', 'Real Brasilero'), ('USD', 'Dolar EEUU'), ('EUR', 'Euro'), ('GBP', 'Libras'), ('JPY', 'Yenes'), ('PYG', 'Guaranies Paraguayos'), ('AUD', 'Dolar Australiano'), ('KRW', 'Won Coreano')], max_length=3)),
+                ('split_method', models.CharField(choices=[('equal', 'Split Equally'), ('personal', 'Personal'), ('manual', 'Manual Amount Entry'), ('percentage', 'Percentage-Based'), ('ratio', 'Ratio-Based'), ('shares', 'Shares-Based'), ('excess', 'Excess Adjustment'), ('full_owed', 'You are owed full amount'), ('full_owe', 'You owe full amount')], max_length=50)),
+                ('added_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='expenses.expensegroup')),
+                ('paid_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedExpenseSplit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('paid_amount', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('owed_amount', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('expense', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='splits', to='expenses.archivedexpense')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CheckpointBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(choices=[('ARS', 'Peso Argentino'), ('UYU', 'Peso Uruguayo'), ('CLP', 'Peso Chileno'), ('MXN', 'Peso Mexicano'), ('BRL', 'Real Brasilero'), ('USD', 'Dolar EEUU'), ('EUR', 'Euro'), ('GBP', 'Libras'), ('JPY', 'Yenes'), ('PYG', 'Guaranies Paraguayos'), ('AUD', 'Dolar Australiano'), ('KRW', 'Won Coreano')], max_length=3)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('checkpoint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='expenses.balancecheckpoint')),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='expenses.expensegroup')),
+                ('user_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['checkpoint', 'user_a'], name='checkpoint_user_a_idx'), models.Index(fields=['checkpoint', 'user_b'], name='checkpoint_user_b_idx'), models.Index(fields=['checkpoint', 'group'], name='checkpoint_group_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_feed(apps, schema_editor):
+    Activity = apps.get_model('expenses', 'Activity')
+    FeedEntry = apps.get_model('expenses', 'FeedEntry')
+    Through = Activity.involved_users.through
+
+    last_id = 0
+    while True:
+        batch = list(Activity.objects.filter(id__gt=last_id).select_related('actor').order_by('id')[:1000])
+        if not batch:
+            break
+        last_id = batch[-1].id
+        involved = {}
+        for activity_id, user_id in Through.objects.filter(
+            activity_id__in=[a.id for a in batch]
+        ).values_list('activity_id', 'user_id'):
+            involved.setdefault(activity_id, []).append(user_id)
+        entries = []
+        for a in batch:
+            actor_name = "Unknown"
+            if a.actor:
+                actor_name = f"{a.actor.first_name} {a.actor.last_name}".strip() or a.actor.username
+            for user_id in involved.get(a.id, []):
+                entries.append(FeedEntry(
+                    user_id=user_id, activity_id=a.id, action=a.action, created_at=a.created_at,
+                    expense_id=a.expense_id, expense_name=a.expense_name, expense_amount=a.expense_amount,
+                    split_method=a.split_method, expense_date=a.expense_date, currency=a.currency,
+                    actor_name=actor_name,
+                ))
+        FeedEntry.objects.bulk_create(entries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0018_balance_checkpoints'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('deleted', 'Deleted'), ('settled', 'Settled')], max_length=20)),
+                ('created_at', models.DateTimeField()),
+                ('expense_name', models.CharField(max_length=100)),
+                ('expense_amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('split_method', models.CharField(blank=True, max_length=50)),
+                ('expense_date', models.DateField(blank=True, null=True)),
+                ('currency', models.CharField(choices=[('ARS', 'Peso Argentino'), ('UYU', 'Peso Uruguayo'), ('CLP', 'Peso Chileno'), ('MXN', 'Peso Mexicano'), ('BRL', 'Real Brasilero'), ('USD', 'Dolar EEUU'), ('EUR', 'Euro'), ('GBP', 'Libras'), ('JPY', 'Yenes'), ('PYG', 'Guaranies Paraguayos'), ('AUD', 'Dolar Australiano'), ('KRW', 'Won Coreano')], default='ARS', max_length=3)),
+                ('actor_name', models.CharField(max_length=300)),
+                ('activity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='expenses.activity')),
+                ('expense', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='expenses.expense')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-created_at'], name='feedentry_user_created_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_feed, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='activity',
+            name='participants_snapshot',
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.4 on 2026-10-19 13:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import OperationalError, migrations, models
+
+
+FTS_TABLE = 'expenses_search_fts'
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "body, tokenize=\"unicode61 remove_diacritics 2 tokenchars '.'\")"
+        )
+    except OperationalError:
+        # SQLite built without FTS5; expenses/search.py falls back to SearchToken
+        pass
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0019_feed_entries'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=40)),
+                ('expense', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='expenses.expense')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'token', 'expense'], name='searchtoken_lookup_idx')],
+            },
+        ),
+        migrations.RunPython(create_fts, drop_fts),
+    ]
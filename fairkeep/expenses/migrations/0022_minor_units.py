@@ -0,0 +1,152 @@
+# Generated by Django 5.1.4 on 2026-10-19 14:20
+
+from decimal import Decimal, ROUND_HALF_UP
+from itertools import groupby
+from operator import attrgetter
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Round
+
+from expenses.money import allocate
+
+# Currencies without a minor unit (expenses.money.EXPONENTS); all others have two decimals
+ZERO_DECIMAL = ['CLP', 'JPY', 'KRW', 'PYG']
+
+# (model, amount fields, path to the currency)
+MONEY_FIELDS = [
+    ('Expense', ['amount'], 'currency'),
+    ('RecurringExpense', ['amount'], 'currency'),
+    ('ExpenseSplit', ['paid_amount', 'owed_amount'], 'expense__currency'),
+    ('CheckpointBalance', ['amount'], 'currency'),
+    ('ArchivedExpense', ['amount'], 'currency'),
+    ('ArchivedExpenseSplit', ['paid_amount', 'owed_amount'], 'expense__currency'),
+    ('Activity', ['expense_amount'], 'currency'),
+    ('FeedEntry', ['expense_amount'], 'currency'),
+]
+
+
+def _scale(value, currency, up):
+    factor = 1 if currency in ZERO_DECIMAL else 100
+    if up:
+        return int((Decimal(str(value)) * factor).to_integral_value())
+    return Decimal(int(value)) / factor
+
+
+def _whole_parts(values):
+    """
+    Whole units for the parts `values` of a zero-decimal amount. Rounding each
+    part on its own can lose units (333.33 x 3 -> 999), so the parts' rounded
+    sum is allocated in proportion to them instead.
+    """
+    values = [Decimal(str(value)) for value in values]
+    total = int(sum(values).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    if not any(values):
+        return [0] * len(values)
+    return allocate(total, values)
+
+
+def _reallocate_zero_decimal_splits(apps, split_model):
+    Split = apps.get_model('expenses', split_model)
+    splits = Split.objects.filter(expense__currency__in=ZERO_DECIMAL).order_by('expense_id', 'pk')
+    updated = []
+    for _expense_id, group in groupby(splits.iterator(chunk_size=2000), key=attrgetter('expense_id')):
+        group = list(group)
+        for field in ('paid_amount', 'owed_amount'):
+            for split, part in zip(group, _whole_parts([getattr(split, field) for split in group])):
+                setattr(split, field, part)
+        updated.extend(group)
+    Split.objects.bulk_update(updated, ['paid_amount', 'owed_amount'], batch_size=2000)
+
+
+def to_minor_units(apps, schema_editor):
+    # Before the per-row rounding below, which then leaves these whole values as they are
+    _reallocate_zero_decimal_splits(apps, 'ExpenseSplit')
+    _reallocate_zero_decimal_splits(apps, 'ArchivedExpenseSplit')
+    for model_name, fields, currency in MONEY_FIELDS:
+        Model = apps.get_model('expenses', model_name)
+        Model.objects.exclude(**{f'{currency}__in': ZERO_DECIMAL}).update(
+            **{field: Round(F(field) * 100) for field in fields}
+        )
+        Model.objects.filter(**{f'{currency}__in': ZERO_DECIMAL}).update(
+            **{field: Round(F(field)) for field in fields}
+        )
+    RecurringExpense = apps.get_model('expenses', 'RecurringExpense')
+    for template in RecurringExpense.objects.exclude(splits=[]):
+        fields = {
+            field: [_scale(split.get(field, 0), template.currency, up=True) for split in template.splits]
+            for field in ('paid_amount', 'owed_amount')
+        }
+        if template.currency in ZERO_DECIMAL:
+            fields = {
+                field: _whole_parts([split.get(field, 0) for split in template.splits])
+                for field in fields
+            }
+        template.splits = [
+            {**split, 'paid_amount': paid, 'owed_amount': owed}
+            for split, paid, owed in zip(template.splits, fields['paid_amount'], fields['owed_amount'])
+        ]
+        template.save(update_fields=['splits'])
+
+
+def to_major_units(apps, schema_editor):
+    # Row by row: integer division would truncate on some backends
+    for model_name, fields, currency in MONEY_FIELDS:
+        Model = apps.get_model('expenses', model_name)
+        rows = Model.objects.values_list('pk', currency, *fields)
+        updated = []
+        for pk, code, *values in rows.iterator(chunk_size=2000):
+            obj = Model(pk=pk)
+            for field, value in zip(fields, values):
+                setattr(obj, field, _scale(value, code, up=False))
+            updated.append(obj)
+            if len(updated) >= 2000:
+                Model.objects.bulk_update(updated, fields)
+                updated = []
+        if updated:
+            Model.objects.bulk_update(updated, fields)
+    RecurringExpense = apps.get_model('expenses', 'RecurringExpense')
+    for template in RecurringExpense.objects.exclude(splits=[]):
+        template.splits = [
+            {
+                **split,
+                'paid_amount': str(_scale(split.get('paid_amount', 0), template.currency, up=False)),
+                'owed_amount': str(_scale(split.get('owed_amount', 0), template.currency, up=False)),
+            }
+            for split in template.splits
+        ]
+        template.save(update_fields=['splits'])
+
+
+def _alter(field_factory):
+    return [
+        migrations.AlterField(model_name=model_name.lower(), name=field, field=field_factory(field))
+        for model_name, fields, _currency in MONEY_FIELDS
+        for field in fields
+    ]
+
+
+def _wide_decimal(field):
+    # Room for the scaled values while the column is still a decimal
+    if field in ('paid_amount', 'owed_amount'):
+        return models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    return models.DecimalField(max_digits=20, decimal_places=2)
+
+
+def _big_integer(field):
+    if field in ('paid_amount', 'owed_amount'):
+        return models.BigIntegerField(default=0)
+    return models.BigIntegerField()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0021_list_filter_indexes'),
+    ]
+
+    operations = [
+        *_alter(_wide_decimal),
+        migrations.RunPython(to_minor_units, to_major_units),
+        *_alter(_big_integer),
+    ]
@@ -3,7 +3,19 @@ from django.contrib.auth.models import User
 from django.utils import timezone
 from django.db.models import Q
 
+from .money import format_amount
+
 # Create your models here.
+class ExpenseGroup(models.Model):
+    name = models.CharField(max_length=50)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_expense_groups')
+    members = models.ManyToManyField(User, related_name='expense_groups')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
 class Expense(models.Model):
     CATEGORY_CHOICES = [
         ('Home Supplies', 'Home Supplies'),
@@ -43,7 +55,7 @@ class Expense(models.Model):
     ]
 
     name = models.CharField(max_length=50)
-    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    amount = models.BigIntegerField()  # minor units of `currency`, see expenses/money.py
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES)
     date = models.DateTimeField(auto_now_add=True)
     expense_date = models.DateField(default=timezone.now)
@@ -54,18 +66,159 @@ class Expense(models.Model):
     paid_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='paid_expenses')
     split_method = models.CharField(max_length=50, choices=SPLIT_METHODS)
     split_details = models.JSONField(null=True, blank=True)
+    group = models.ForeignKey(ExpenseGroup, on_delete=models.SET_NULL, null=True, blank=True, related_name='expenses')
+    recurring = models.ForeignKey(
+        'RecurringExpense', on_delete=models.SET_NULL, null=True, blank=True, related_name='occurrences'
+    )
+    period_date = models.DateField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # One materialized expense per template and period
+            models.UniqueConstraint(fields=['recurring', 'period_date'], name='unique_recurring_period'),
+        ]
+        # For the list filters (expenses/filters.py), combined with date ranges
+        indexes = [
+            models.Index(fields=['paid_by', 'expense_date'], name='expense_payer_date_idx'),
+            models.Index(fields=['currency', 'expense_date'], name='expense_currency_date_idx'),
+            models.Index(fields=['category', 'expense_date'], name='expense_category_date_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.name} - {self.amount}"
+        return f"{self.name} - {format_amount(self.amount, self.currency)}"
+
+
+class SearchToken(models.Model):
+    """
+    Portable search index: one row per (user who can see the expense, token).
+    Used where SQLite FTS5 is not available; see expenses/search.py.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', db_index=False)
+    token = models.CharField(max_length=40)
+    expense = models.ForeignKey(Expense, on_delete=models.CASCADE, related_name='search_tokens')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'token', 'expense'], name='searchtoken_lookup_idx'),
+        ]
+
+
+class RecurringExpense(models.Model):
+    FREQUENCY_CHOICES = [
+        ('daily', 'Daily'),
+        ('weekly', 'Weekly'),
+        ('monthly', 'Monthly'),
+        ('yearly', 'Yearly'),
+    ]
+
+    name = models.CharField(max_length=50)
+    amount = models.BigIntegerField()
+    category = models.CharField(max_length=20, choices=Expense.CATEGORY_CHOICES, default='Periodic Expenses')
+    currency = models.CharField(max_length=3, choices=Expense.CURRENCY_CHOICES, default='ARS')
+    added_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recurring_expenses')
+    paid_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='paid_recurring_expenses')
+    split_method = models.CharField(max_length=50, choices=Expense.SPLIT_METHODS)
+    # Resolved splits copied into every occurrence: [{"user", "paid_amount", "owed_amount"}] in minor units
+    splits = models.JSONField(default=list)
+    group = models.ForeignKey(
+        ExpenseGroup, on_delete=models.SET_NULL, null=True, blank=True, related_name='recurring_expenses'
+    )
+    frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES, default='monthly')
+    interval = models.PositiveSmallIntegerField(default=1)
+    start_date = models.DateField()
+    end_date = models.DateField(null=True, blank=True)
+    # Occurrences are counted from start_date so month-end dates do not drift
+    occurrence_count = models.PositiveIntegerField(default=0)
+    next_date = models.DateField()
+    active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['active', 'next_date'], name='recurring_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.frequency})"
 
 class ExpenseSplit(models.Model):
     expense = models.ForeignKey(Expense, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    paid_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
-    owed_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # Minor units of the expense's currency
+    paid_amount = models.BigIntegerField(default=0)
+    owed_amount = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Covers "expenses this user is part of" without touching the table
+            models.Index(fields=['user', 'expense'], name='expensesplit_user_expense_idx'),
+        ]
+
+    def __str__(self):
+        # Only uses relations that are already loaded: delete confirmations and
+        # admin logs render many splits and must not query per row
+        if not (self._meta.get_field('user').is_cached(self) and self._meta.get_field('expense').is_cached(self)):
+            return f"Split of expense {self.expense_id} for user {self.user_id}"
+        return f"{self.user.username} owes {format_amount(self.owed_amount, self.expense.currency)} for {self.expense.name}"
+
+
+class BalanceCheckpoint(models.Model):
+    """
+    Net positions of every pair of users as of the end of `as_of`. Expenses
+    dated on or before the latest checkpoint are closed: they can no longer
+    change, and balance reads only replay the expenses after it.
+    """
+    as_of = models.DateField(unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Checkpoint as of {self.as_of}"
+
+
+class CheckpointBalance(models.Model):
+    """What `user_b` owes `user_a` (negative: `user_a` owes `user_b`); user_a_id < user_b_id."""
+    checkpoint = models.ForeignKey(BalanceCheckpoint, on_delete=models.CASCADE, related_name='balances')
+    group = models.ForeignKey(ExpenseGroup, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    user_a = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    user_b = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    currency = models.CharField(max_length=3, choices=Expense.CURRENCY_CHOICES)
+    amount = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['checkpoint', 'user_a'], name='checkpoint_user_a_idx'),
+            models.Index(fields=['checkpoint', 'user_b'], name='checkpoint_user_b_idx'),
+            models.Index(fields=['checkpoint', 'group'], name='checkpoint_group_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_b_id} owes {self.user_a_id} {format_amount(self.amount, self.currency)} {self.currency}"
+
+
+class ArchivedExpense(models.Model):
+    """Compact copy of an expense moved out of the live tables by `archive_expenses`."""
+    id = models.BigIntegerField(primary_key=True)  # the original expense id
+    name = models.CharField(max_length=50)
+    amount = models.BigIntegerField()
+    category = models.CharField(max_length=20, choices=Expense.CATEGORY_CHOICES)
+    date = models.DateTimeField()
+    expense_date = models.DateField(db_index=True)
+    currency = models.CharField(max_length=3, choices=Expense.CURRENCY_CHOICES)
+    added_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    paid_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    split_method = models.CharField(max_length=50, choices=Expense.SPLIT_METHODS)
+    group = models.ForeignKey(ExpenseGroup, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
 
     def __str__(self):
-        return f"{self.user.username} owes {self.owed_amount} for {self.expense.name}"
+        return f"{self.name} - {format_amount(self.amount, self.currency)} (archived)"
+
+
+class ArchivedExpenseSplit(models.Model):
+    expense = models.ForeignKey(ArchivedExpense, on_delete=models.CASCADE, related_name='splits')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    paid_amount = models.BigIntegerField(default=0)
+    owed_amount = models.BigIntegerField(default=0)
 
 
 class Activity(models.Model):
@@ -81,17 +234,140 @@ class Activity(models.Model):
     action = models.CharField(max_length=20, choices=ACTION_CHOICES)
     created_at = models.DateTimeField(auto_now_add=True)
     expense_name = models.CharField(max_length=100)
-    expense_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    expense_amount = models.BigIntegerField()
     split_method = models.CharField(max_length=50, blank=True)
     expense_date = models.DateField(null=True, blank=True)
     currency = models.CharField(max_length=3, choices=Expense.CURRENCY_CHOICES, default='ARS')
     involved_users = models.ManyToManyField(User, related_name='activities_involved')
-    participants_snapshot = models.JSONField(default=list, blank=True)
 
     def __str__(self):
         return f"{self.action} - {self.expense_name}"
 
 
+class FeedEntry(models.Model):
+    """
+    One row per involved user per activity, written with the activity and
+    carrying everything the feed shows, so reading a feed is a single index
+    range scan on (user, created_at).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='feed_entries')
+    activity = models.ForeignKey(Activity, on_delete=models.CASCADE, related_name='feed_entries')
+    action = models.CharField(max_length=20, choices=Activity.ACTION_CHOICES)
+    created_at = models.DateTimeField()
+    expense = models.ForeignKey(Expense, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    expense_name = models.CharField(max_length=100)
+    expense_amount = models.BigIntegerField()
+    split_method = models.CharField(max_length=50, blank=True)
+    expense_date = models.DateField(null=True, blank=True)
+    currency = models.CharField(max_length=3, choices=Expense.CURRENCY_CHOICES, default='ARS')
+    actor_name = models.CharField(max_length=300)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='feedentry_user_created_idx'),
+        ]
+        constraints = [
+            # Lets a retried fan-out task skip the entries it already wrote
+            models.UniqueConstraint(fields=['activity', 'user'], name='feedentry_activity_user_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.action} - {self.expense_name} for {self.user_id}"
+
+
+class ChangeEvent(models.Model):
+    KIND_CHOICES = [
+        ('expense_created', 'Expense created'),
+        ('expense_updated', 'Expense updated'),
+        ('expense_deleted', 'Expense deleted'),
+        ('settled', 'Settled'),
+        ('contact_accepted', 'Contact accepted'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='change_events')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    payload = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='changeevent_user_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} for {self.user_id} (#{self.id})"
+
+
+class Task(models.Model):
+    """
+    A background job for `run_worker` (expenses/tasks.py). `name` is the
+    dotted path of the function to call with `payload` as keyword arguments.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=200)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    run_after = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    # Set while running; a worker that dies leaves the lease to expire
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='task_status_run_after_idx'),
+            models.Index(fields=['status', 'locked_until'], name='task_status_locked_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status}, #{self.id})"
+
+
+class ExportJob(models.Model):
+    """A CSV export of a user's expenses, written to disk by a background task (expenses/exports.py)."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = Task.STATUS_CHOICES
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='export_jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    compress = models.BooleanField(default=False)
+    tz_offset = models.IntegerField(default=0)  # minutes, as JavaScript's getTimezoneOffset()
+    # Covers the user's data and the options; equal fingerprints mean an equal file
+    fingerprint = models.CharField(max_length=64)
+    filename = models.CharField(max_length=200, blank=True)
+    rows_total = models.PositiveIntegerField(default=0)
+    rows_written = models.PositiveIntegerField(default=0)
+    size = models.BigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'fingerprint'], name='exportjob_user_fp_idx'),
+        ]
+
+    def __str__(self):
+        return f"Export #{self.id} for {self.user_id} ({self.status})"
+
+
 class ContactRequest(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
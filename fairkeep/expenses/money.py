@@ -0,0 +1,82 @@
+"""
+Money amounts as integer minor units.
+
+Every amount column stores a BigInteger count of the currency's minor unit
+(cents for USD, whole yen for JPY), so sums and comparisons are exact integer
+arithmetic in the database and in Python. Conversion to and from major units
+(the Decimal strings the API speaks) happens only at the edges, with the
+exponent from EXPONENTS.
+"""
+from decimal import Decimal, InvalidOperation, ROUND_CEILING, ROUND_FLOOR
+
+DEFAULT_EXPONENT = 2
+
+# ISO 4217 minor-unit exponents that differ from the default
+EXPONENTS = {
+    'CLP': 0,
+    'JPY': 0,
+    'KRW': 0,
+    'PYG': 0,
+}
+
+
+# Largest absolute amount accepted, in major units. At two decimals it is
+# 10**14 minor units, so sums of up to ~90,000 of them still fit a BigInteger.
+MAX_AMOUNT = Decimal('999999999999.99')
+
+
+def exponent(currency):
+    return EXPONENTS.get(currency, DEFAULT_EXPONENT)
+
+
+def to_minor(amount, currency):
+    """
+    Minor units for a major-unit amount (Decimal, int or numeric string).
+    Raises ValueError when the amount is not a number, is larger than
+    MAX_AMOUNT or has more decimal places than the currency allows.
+    """
+    try:
+        major = Decimal(str(amount))
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount: {amount!r}")
+    if major.is_finite() and abs(major) > MAX_AMOUNT:
+        raise ValueError(f"{amount} is larger than the maximum amount, {MAX_AMOUNT}.")
+    minor = major.scaleb(exponent(currency))
+    if not minor.is_finite() or minor != minor.to_integral_value():
+        raise ValueError(f"{amount} has more decimal places than {currency} allows.")
+    return int(minor)
+
+
+def to_minor_bound(amount, currency, upper):
+    """Minor units for a filter bound, rounded inwards instead of rejected."""
+    minor = Decimal(str(amount)).scaleb(exponent(currency))
+    return int(minor.to_integral_value(rounding=ROUND_FLOOR if upper else ROUND_CEILING))
+
+
+def to_major(minor, currency):
+    """Decimal major units with exactly the currency's decimal places."""
+    return Decimal(int(minor)).scaleb(-exponent(currency))
+
+
+def format_amount(minor, currency):
+    """Major-unit string, e.g. 1050 USD -> "10.50", 1050 JPY -> "1050"."""
+    return str(to_major(minor, currency))
+
+
+def allocate(total, weights):
+    """
+    Split `total` minor units in proportion to `weights` so the parts add up
+    to `total` exactly: each part is rounded down and the leftover units go to
+    the largest remainders, earliest first on ties.
+    """
+    weights = [Decimal(str(w)) for w in weights]
+    weight_sum = sum(weights)
+    if not weights or weight_sum == 0:
+        raise ValueError("Weights must not all be zero.")
+    exact = [total * w / weight_sum for w in weights]
+    parts = [int(x.to_integral_value(rounding=ROUND_FLOOR)) for x in exact]
+    leftover = total - sum(parts)
+    by_remainder = sorted(range(len(parts)), key=lambda i: (parts[i] - exact[i], i))
+    for i in by_remainder[:leftover]:
+        parts[i] += 1
+    return parts
@@ -0,0 +1,118 @@
+"""
+Per-request profiling captures stored in a bounded on-disk ring buffer.
+
+A capture always records the SQL log and timings; a full capture also runs
+the request under cProfile and tracemalloc. tracemalloc is process-wide, so
+only one full capture runs at a time per process; a request that finds the
+profiler busy is captured without it. For async requests cProfile only sees
+the event-loop thread, not the threads that run ORM queries.
+"""
+import io
+import json
+import os
+import shutil
+import threading
+import tracemalloc
+from pathlib import Path
+from time import perf_counter
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import metrics
+
+_profiler_lock = threading.Lock()
+
+
+class Capture:
+    def __init__(self, profile):
+        self.profile = profile
+        self.profiler = None
+        self.snapshot = None
+        self.peak_memory = None
+        self.duration = None
+        self.stats = None
+        self._token = None
+        self._locked = False
+
+    def __enter__(self):
+        self.stats = metrics.current_request_stats()
+        if self.stats is None:
+            self.stats, self._token = metrics.start_request()
+        self.stats.statements = []
+        if self.profile and _profiler_lock.acquire(blocking=False):
+            self._locked = True
+            # Imported here: cProfile and pstats add ~20 ms to every worker's boot
+            import cProfile
+
+            tracemalloc.start(10)
+            self.profiler = cProfile.Profile()
+            try:
+                self.profiler.enable()
+            except ValueError:
+                # Another profiler (e.g. a debugger) is already active
+                self.profiler = None
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = perf_counter() - self._start
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self._locked:
+            self.snapshot = tracemalloc.take_snapshot()
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            _profiler_lock.release()
+        if self._token is not None:
+            metrics.end_request(self._token)
+        return False
+
+    def save(self, request, response, trigger, user_id=None):
+        """Write the capture to the ring buffer and return its id."""
+        root = Path(settings.REQUEST_PROFILE_DIR)
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match else 'unmatched').replace(':', '.').replace('/', '_')
+        name = f"{timezone.now().strftime('%Y%m%dT%H%M%S%f')}-{os.getpid()}-{view}"
+        target = root / name
+        target.mkdir(parents=True, exist_ok=True)
+
+        statements = self.stats.statements or []
+        meta = {
+            "id": name,
+            "trigger": trigger,
+            "method": request.method,
+            "path": request.get_full_path(),
+            "view": view,
+            "user_id": user_id,
+            "status": response.status_code,
+            "duration_ms": round(self.duration * 1000, 3),
+            "db_ms": round(self.stats.duration * 1000, 3),
+            "queries": self.stats.count,
+            "peak_memory_bytes": self.peak_memory,
+        }
+        (target / 'meta.json').write_text(json.dumps(meta, indent=2))
+        (target / 'sql.json').write_text(json.dumps(
+            [{"sql": sql, "ms": round(seconds * 1000, 3)} for sql, seconds in statements], indent=2
+        ))
+        if self.profiler is not None:
+            self.profiler.dump_stats(target / 'profile.prof')
+            import pstats
+
+            out = io.StringIO()
+            pstats.Stats(self.profiler, stream=out).sort_stats('cumulative').print_stats(50)
+            (target / 'profile.txt').write_text(out.getvalue())
+        if self.snapshot is not None:
+            top = self.snapshot.statistics('lineno')[:25]
+            (target / 'memory.txt').write_text(
+                f"peak: {self.peak_memory} bytes\n\n" + "\n".join(str(stat) for stat in top) + "\n"
+            )
+        _trim(root, settings.REQUEST_PROFILE_MAX_ENTRIES)
+        return name
+
+
+def _trim(root, keep):
+    # Names start with a sortable timestamp, so the oldest captures sort first
+    entries = sorted(p for p in root.iterdir() if p.is_dir())
+    for old in entries[:max(len(entries) - keep, 0)]:
+        shutil.rmtree(old, ignore_errors=True)
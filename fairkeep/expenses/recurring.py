@@ -0,0 +1,148 @@
+"""
+Recurring expense schedules and their materialization into expenses.
+
+`materialize_due` walks due templates in id order, a batch at a time, and
+creates every missed occurrence (up to MAX_CATCH_UP per template per run)
+with bulk inserts. Each occurrence carries its template and period date,
+which are unique together, so a period is never materialized twice even if
+runs overlap: on databases with SKIP LOCKED concurrent runs split the work,
+elsewhere a conflicting batch rolls back and is retried by the next run.
+
+An occurrence dated within a period already closed by a balance checkpoint
+cannot be added without changing the checkpoint, so it is skipped, logged
+and counted as fairkeep_recurring_skipped_total. create_checkpoint() refuses
+to close a period while an active template still has an occurrence due in it.
+"""
+import calendar
+import logging
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import metrics, search
+from .activity import log_activities
+from .checkpoints import lock_open_period
+from .models import Expense, ExpenseSplit, RecurringExpense
+
+logger = logging.getLogger(__name__)
+
+MAX_CATCH_UP = 60
+
+
+def occurrence_date(start, frequency, interval, n):
+    """Date of the n-th occurrence (0-based) of a schedule starting at `start`."""
+    step = interval * n
+    if frequency == 'daily':
+        return start + timedelta(days=step)
+    if frequency == 'weekly':
+        return start + timedelta(weeks=step)
+    month_index = start.month - 1 + step * (12 if frequency == 'yearly' else 1)
+    year, month = start.year + month_index // 12, month_index % 12 + 1
+    # Clamp to the month's last day, e.g. the 31st falls on Feb 28/29
+    return start.replace(year=year, month=month, day=min(start.day, calendar.monthrange(year, month)[1]))
+
+
+def advance(template):
+    template.occurrence_count += 1
+    template.next_date = occurrence_date(
+        template.start_date, template.frequency, template.interval, template.occurrence_count
+    )
+    if template.end_date and template.next_date > template.end_date:
+        template.active = False
+
+
+def schedule(template, not_before=None):
+    """Restart a template's schedule at its first occurrence on or after `not_before`."""
+    template.occurrence_count = 0
+    template.next_date = template.start_date
+    template.active = not template.end_date or template.start_date <= template.end_date
+    while not_before and template.active and template.next_date < not_before:
+        advance(template)
+
+
+def involved_user_ids(template):
+    involved = {int(split['user']) for split in template.splits}
+    involved.update((template.paid_by_id, template.added_by_id))
+    return involved
+
+
+def materialize_due(today=None, batch_size=500):
+    """Create the expenses for every occurrence due on or before `today`; returns how many."""
+    today = today or timezone.localdate()
+    created = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            qs = RecurringExpense.objects.filter(
+                active=True, next_date__lte=today, id__gt=last_id,
+            ).select_related('added_by').order_by('id')
+            if connection.features.has_select_for_update_skip_locked:
+                qs = qs.select_for_update(skip_locked=True, of=('self',))
+            templates = list(qs[:batch_size])
+            if not templates:
+                return created
+            last_id = templates[-1].id
+            created += _materialize_batch(templates, today, batch_size)
+
+
+def _materialize_batch(templates, today, batch_size):
+    closed = lock_open_period()
+    periods = []
+    skipped = 0
+    for template in templates:
+        for _ in range(MAX_CATCH_UP):
+            if not template.active or template.next_date > today:
+                break
+            # Periods closed by a balance checkpoint can no longer be added
+            if not closed or template.next_date > closed:
+                periods.append((template, template.next_date))
+            else:
+                logger.warning(
+                    "Skipped recurring expense #%s occurrence on %s: closed by the checkpoint as of %s",
+                    template.id, template.next_date, closed,
+                )
+                skipped += 1
+            advance(template)
+    if skipped:
+        metrics.registry.increment('fairkeep_recurring_skipped_total', skipped)
+
+    if periods:
+        existing = set(Expense.objects.filter(
+            recurring__in=templates,
+            period_date__gte=min(period for _template, period in periods),
+        ).values_list('recurring_id', 'period_date'))
+        periods = [(t, period) for t, period in periods if (t.id, period) not in existing]
+
+    expenses = Expense.objects.bulk_create([
+        Expense(
+            name=t.name,
+            amount=t.amount,
+            category=t.category,
+            currency=t.currency,
+            added_by=t.added_by,
+            paid_by_id=t.paid_by_id,
+            split_method=t.split_method,
+            group_id=t.group_id,
+            expense_date=period,
+            recurring=t,
+            period_date=period,
+        )
+        for t, period in periods
+    ], batch_size=batch_size)
+    ExpenseSplit.objects.bulk_create([
+        ExpenseSplit(
+            expense=expense,
+            user_id=int(split['user']),
+            paid_amount=int(split.get('paid_amount', 0)),
+            owed_amount=int(split.get('owed_amount', 0)),
+        )
+        for expense, (t, _period) in zip(expenses, periods)
+        for split in t.splits
+    ], batch_size=batch_size)
+    log_activities('created', [
+        (expense, involved_user_ids(t)) for expense, (t, _period) in zip(expenses, periods)
+    ])
+    search.index_expenses([expense.id for expense in expenses])
+    RecurringExpense.objects.bulk_update(templates, ['occurrence_count', 'next_date', 'active'], batch_size=batch_size)
+    return len(expenses)
@@ -0,0 +1,109 @@
+"""
+Render cache for serialized expenses.
+
+An expense's ExpenseSerializer output only changes when the expense is saved,
+so the rendered fragment is stored in the `render` cache alias under the
+expense's (id, updated_at) and reused for every caller and every list. A list
+first reads the few columns it needs per row, fetches all fragments with one
+get_many, serializes only the misses (loading their splits) and stores them
+with set_many. A saved expense gets a new key; the old fragment is never read
+again and falls out through the alias's size-bounded eviction (MAX_ENTRIES
+for locmem, the server's maxmemory policy for redis/memcached).
+
+Fields that can change without touching updated_at are not cached but read
+per request: the creator's and payer's names (users rename themselves), the
+group and template links (cleared by SET_NULL) and `net`, which depends on
+the caller. Hits and misses are counted as fairkeep_render_cache_total.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+
+from . import metrics
+from .models import Expense
+from .money import format_amount
+from .serializers import ExpenseSerializer
+
+# Bump when ExpenseSerializer's output changes, so old fragments are not reused
+FRAGMENT_VERSION = 1
+
+# Output field -> row column, filled in on every render
+LIVE_FIELDS = {
+    'added_by': 'added_by_id',
+    'added_by_display': 'added_by_id',
+    'paid_by': 'paid_by_id',
+    'paid_by_username': 'paid_by_id',
+    'paid_by_display': 'paid_by_id',
+    'group': 'group_id',
+    'recurring': 'recurring_id',
+}
+CACHED_FIELDS = [name for name in ExpenseSerializer.Meta.fields if name not in LIVE_FIELDS]
+
+
+def _key(expense_id, updated_at):
+    return f"expense:{expense_id}:{updated_at.isoformat()}"
+
+
+def rows(queryset, fields=None):
+    """The columns render() needs; `queryset` may carry a `net` annotation."""
+    columns = ['id', 'updated_at', 'currency', *dict.fromkeys(LIVE_FIELDS.values())]
+    if fields is not None and 'net' in fields:
+        columns.append('net')
+    return queryset.values(*columns)
+
+
+def _people(user_ids):
+    people = {}
+    for user in User.objects.filter(id__in=user_ids).only('username', 'first_name', 'last_name'):
+        people[user.id] = (user.username, user.get_full_name() or user.username)
+    return people
+
+
+def fragments(rows):
+    """{id: cached fields} for the evaluated `rows`, serializing and storing the misses."""
+    cache = caches[settings.RENDER_CACHE_ALIAS]
+    keys = {row['id']: _key(row['id'], row['updated_at']) for row in rows}
+    cached = cache.get_many(keys.values(), version=FRAGMENT_VERSION)
+    found = {expense_id: cached[key] for expense_id, key in keys.items() if key in cached}
+    missing = [expense_id for expense_id in keys if expense_id not in found]
+    metrics.registry.increment('fairkeep_render_cache_total', len(found), result='hit')
+    metrics.registry.increment('fairkeep_render_cache_total', len(missing), result='miss')
+    if missing:
+        expenses = Expense.objects.filter(id__in=missing).prefetch_related('expensesplit_set', 'participants')
+        rendered = {}
+        for expense, data in zip(expenses, ExpenseSerializer(expenses, many=True, fields=CACHED_FIELDS).data):
+            found[expense.id] = dict(data)
+            rendered[_key(expense.id, expense.updated_at)] = found[expense.id]
+        cache.set_many(rendered, version=FRAGMENT_VERSION)
+    return found
+
+
+def render(rows, fields=None):
+    """
+    ExpenseSerializer output for `rows` (from rows()), in order, optionally
+    restricted to `fields` as with ExpenseSerializer(fields=...).
+    """
+    rows = list(rows)
+    cached = fragments(rows)
+    people = _people({row[column] for row in rows for column in ('added_by_id', 'paid_by_id')})
+    names = list(fields) if fields is not None else ExpenseSerializer.Meta.fields
+    result = []
+    for row in rows:
+        fragment = cached.get(row['id'])
+        if fragment is None or row['added_by_id'] not in people or row['paid_by_id'] not in people:
+            # Deleted between the reads
+            continue
+        added_by, paid_by = people[row['added_by_id']], people[row['paid_by_id']]
+        live = {
+            'added_by': added_by[0],
+            'added_by_display': added_by[1],
+            'paid_by': row['paid_by_id'],
+            'paid_by_username': paid_by[0],
+            'paid_by_display': paid_by[1],
+            'group': row['group_id'],
+            'recurring': row['recurring_id'],
+        }
+        if 'net' in names:
+            live['net'] = None if row['net'] is None else format_amount(row['net'], row['currency'])
+        result.append({name: live[name] if name in live else fragment[name] for name in names})
+    return result
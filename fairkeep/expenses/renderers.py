@@ -0,0 +1,63 @@
+"""
+JSON rendering for API responses.
+
+FastJSONRenderer and FastJsonResponse use orjson when it is installed and
+fall back to the standard library otherwise. Either way Decimals render as
+strings (never through float) and dates and datetimes as ISO 8601, the same
+values DRF's serializer fields produce.
+"""
+import json
+from decimal import Decimal
+
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+class DecimalJSONEncoder(JSONEncoder):
+    """DRF's encoder, but Decimals become strings instead of floats."""
+
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return str(obj)
+        return super().default(obj)
+
+
+_fallback_encoder = DecimalJSONEncoder()
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+
+def dumps(data):
+    """`data` as compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(data, default=_fallback_encoder.default, option=ORJSON_OPTIONS)
+    return json.dumps(
+        data, cls=DecimalJSONEncoder, ensure_ascii=False, separators=(',', ':'), allow_nan=False,
+    ).encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+    encoder_class = DecimalJSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # Indented output (?format=json with `indent=` in Accept) keeps the stock path
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class FastJsonResponse(HttpResponse):
+    """Drop-in for JsonResponse that renders with dumps()."""
+
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError('In order to allow non-dict objects to be serialized set the safe parameter to False.')
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
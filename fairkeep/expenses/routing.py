@@ -0,0 +1,121 @@
+"""
+Read-replica routing.
+
+Writes always go to `default`. Reads go to a replica (settings.DB_REPLICAS,
+one alias each) only inside views wrapped with @replica_reads, the read-only
+endpoints, so a replica that lags behind never serves the reads a write path
+depends on. The replica is picked once per request, so all of its reads see
+the same snapshot.
+
+After a user writes (any successful unsafe request, marked by
+PrimaryStickinessMiddleware) their reads stay on `default` for
+DB_STICKY_SECONDS, so they see their own changes immediately. The mark lives
+in the default cache, which must be shared between workers for it to hold
+across them; settings refuse replicas with a per-process cache.
+"""
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+
+# The replica alias the current request reads from, if any
+_replica = ContextVar('fairkeep_replica', default=None)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def _sticky_key(user_id):
+    return f"fairkeep:db:sticky:{user_id}"
+
+
+def choose_replica():
+    return random.choice(settings.DB_REPLICAS)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _replica.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema from the primary (or refresh_sqlite_replicas)
+        return False if db in settings.DB_REPLICAS else None
+
+
+def _user_id(request):
+    user = getattr(request, 'user', None)
+    return user.id if user is not None and user.is_authenticated else None
+
+
+def replica_reads(view):
+    """Route the reads of `view` to a replica unless its user wrote recently."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            user_id = _user_id(request)
+            if not settings.DB_REPLICAS or (user_id and await cache.aget(_sticky_key(user_id))):
+                return await view(request, *args, **kwargs)
+            token = _replica.set(choose_replica())
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _replica.reset(token)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        user_id = _user_id(request)
+        if not settings.DB_REPLICAS or (user_id and cache.get(_sticky_key(user_id))):
+            return view(request, *args, **kwargs)
+        token = _replica.set(choose_replica())
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _replica.reset(token)
+    return wrapper
+
+
+class PrimaryStickinessMiddleware:
+    """
+    Keeps a user's reads on the primary for DB_STICKY_SECONDS after each
+    successful write request. Must come after AuthenticationMiddleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _wrote(request, response):
+        return bool(settings.DB_REPLICAS) and request.method not in SAFE_METHODS and response.status_code < 400
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if self._wrote(request, response):
+            user_id = _user_id(request)
+            if user_id:
+                cache.set(_sticky_key(user_id), True, timeout=settings.DB_STICKY_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self._wrote(request, response):
+            user = await request.auser()
+            if user.is_authenticated:
+                await cache.aset(_sticky_key(user.id), True, timeout=settings.DB_STICKY_SECONDS)
+        return response
@@ -0,0 +1,182 @@
+"""
+Full-text search over expenses.
+
+Each expense is indexed as a list of tokens: its name, category, currency,
+amount, the month and year of its date, and the usernames and names of its
+payer, creator and split users. The index is scoped per user, so a query
+only ever touches the caller's own entries:
+
+- On SQLite with FTS5 (created by migration 0020) every expense is one row
+  whose rowid is the expense id; the body carries a marker token per user
+  who can see it and queries AND that marker in. Results are ranked by bm25.
+- Elsewhere the SearchToken table holds (user, token, expense) rows behind a
+  (user, token, expense) index; every query term narrows the candidate set
+  by an indexed lookup and results are ranked by recency.
+
+All query terms must match; the last one also matches as a prefix, so
+results update while the user types. Write paths call index_expenses() and
+remove_expenses() inside their transaction; `rebuild_search_index` rebuilds
+everything.
+"""
+import re
+import unicodedata
+from datetime import date
+
+from django.conf import settings
+from django.db import connection, connections, router
+
+from .models import Expense, SearchToken
+from .money import to_major
+
+FTS_TABLE = 'expenses_search_fts'
+MAX_TOKEN_LENGTH = 40
+MAX_QUERY_TOKENS = 8
+
+MONTHS = [
+    ('january', 'enero'), ('february', 'febrero'), ('march', 'marzo'), ('april', 'abril'),
+    ('may', 'mayo'), ('june', 'junio'), ('july', 'julio'), ('august', 'agosto'),
+    ('september', 'septiembre'), ('october', 'octubre'), ('november', 'noviembre'), ('december', 'diciembre'),
+]
+
+_TOKEN_RE = re.compile(r'\d+(?:\.\d+)?|[^\W_]+')
+_fts_available = {}
+
+
+def tokenize(text):
+    """Lowercase, accent-free word and number tokens of `text`."""
+    text = unicodedata.normalize('NFKD', str(text).lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    # 1.500,50 and 1500,50 style amounts both become 1500.50
+    text = re.sub(r'(?<=\d)\.(?=\d{3}\b)', '', text)
+    text = re.sub(r'(?<=\d),(?=\d)', '.', text)
+    return [token[:MAX_TOKEN_LENGTH] for token in _TOKEN_RE.findall(text)]
+
+
+def _user_marker(user_id):
+    return f'fkuser{user_id}'
+
+
+def backend():
+    """'fts5' or 'tokens', from SEARCH_BACKEND ('auto' picks FTS5 when the table exists)."""
+    choice = settings.SEARCH_BACKEND
+    if choice != 'auto':
+        return choice
+    if connection.vendor != 'sqlite':
+        return 'tokens'
+    name = connection.settings_dict['NAME']
+    if name not in _fts_available:
+        _fts_available[name] = FTS_TABLE in connection.introspection.table_names()
+    return 'fts5' if _fts_available[name] else 'tokens'
+
+
+def _document(expense):
+    """(tokens, visible user ids) for an expense with splits and users loaded."""
+    users = {expense.paid_by_id: expense.paid_by, expense.added_by_id: expense.added_by}
+    for split in expense.expensesplit_set.all():
+        users[split.user_id] = split.user
+    amount = to_major(expense.amount, expense.currency)
+    parts = [expense.name, expense.category, expense.currency, str(amount)]
+    if int(amount) == amount:
+        parts.append(str(int(amount)))
+    if isinstance(expense.expense_date, date):
+        parts.extend(MONTHS[expense.expense_date.month - 1])
+        parts.append(str(expense.expense_date.year))
+    for user in users.values():
+        parts.extend([user.username, user.first_name, user.last_name])
+    tokens = []
+    for part in parts:
+        tokens.extend(tokenize(part))
+    return list(dict.fromkeys(tokens)), set(users)
+
+
+def remove_expenses(expense_ids):
+    expense_ids = list(expense_ids)
+    if not expense_ids:
+        return
+    if backend() == 'fts5':
+        with connection.cursor() as cursor:
+            for start in range(0, len(expense_ids), 500):
+                chunk = expense_ids[start:start + 500]
+                cursor.execute(
+                    f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(chunk))})", chunk
+                )
+    else:
+        SearchToken.objects.filter(expense_id__in=expense_ids).delete()
+
+
+def index_expenses(expense_ids):
+    """(Re)index the given expenses; ids that no longer exist are dropped from the index."""
+    expense_ids = list(expense_ids)
+    remove_expenses(expense_ids)
+    expenses = Expense.objects.filter(id__in=expense_ids).select_related(
+        'paid_by', 'added_by'
+    ).prefetch_related('expensesplit_set__user')
+    documents = [(expense.id, *_document(expense)) for expense in expenses]
+    if not documents:
+        return
+    if backend() == 'fts5':
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, body) VALUES (%s, %s)",
+                [
+                    (expense_id, ' '.join(tokens + [_user_marker(uid) for uid in user_ids]))
+                    for expense_id, tokens, user_ids in documents
+                ],
+            )
+    else:
+        SearchToken.objects.bulk_create([
+            SearchToken(user_id=uid, token=token, expense_id=expense_id)
+            for expense_id, tokens, user_ids in documents
+            for uid in user_ids
+            for token in tokens
+        ], batch_size=2000)
+
+
+def _fts_query(user_id, tokens):
+    terms = [f'"{_user_marker(user_id)}"'] + [f'"{token}"' for token in tokens[:-1]] + [f'"{tokens[-1]}"*']
+    return ' AND '.join(terms)
+
+
+def search(user, query, offset=0, limit=20):
+    """Ids of the caller's expenses matching `query`, best first."""
+    tokens = tokenize(query)[:MAX_QUERY_TOKENS]
+    if not tokens:
+        return []
+    if backend() == 'fts5':
+        # Same database as the ORM reads, a replica under routing.replica_reads
+        with connections[router.db_for_read(Expense)].cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f"ORDER BY bm25({FTS_TABLE}), rowid DESC LIMIT %s OFFSET %s",
+                [_fts_query(user.id, tokens), limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    qs = Expense.objects.all()
+    for token in tokens[:-1]:
+        qs = qs.filter(id__in=SearchToken.objects.filter(user=user, token=token).values('expense_id'))
+    prefix = tokens[-1]
+    # A range rather than LIKE so every backend can use the (user, token) index
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    qs = qs.filter(id__in=SearchToken.objects.filter(
+        user=user, token__gte=prefix, token__lt=upper
+    ).values('expense_id'))
+    return list(qs.order_by('-expense_date', '-id').values_list('id', flat=True)[offset:offset + limit])
+
+
+def rebuild(batch_size=1000):
+    """Rebuild the whole index; returns the number of expenses indexed."""
+    if backend() == 'fts5':
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    else:
+        SearchToken.objects.all().delete()
+    indexed = 0
+    last_id = 0
+    while True:
+        ids = list(Expense.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return indexed
+        index_expenses(ids)
+        indexed += len(ids)
+        last_id = ids[-1]
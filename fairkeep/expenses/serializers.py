@@ -1,12 +1,76 @@
 from rest_framework import serializers
-from .models import Expense, ExpenseSplit, ContactRequest
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from django.utils import timezone
+from .models import Expense, ExpenseSplit, ContactRequest, ExpenseGroup, RecurringExpense
 from django.contrib.auth.models import User
-from .models import Activity
+from django.urls import reverse
+from .models import Activity, ExportJob, FeedEntry
+from . import money
+
+
+class MoneyField(serializers.Field):
+    """
+    A minor-unit integer column read and written as a major-unit string.
+
+    Reads format the value in the currency found at `currency_source` on the
+    instance. Writes only parse a Decimal: the serializer turns it into minor
+    units with to_minor_units() once the currency is known.
+    """
+    default_error_messages = {
+        'invalid': 'A valid number is required.',
+        'min_value': 'Ensure this value is greater than or equal to {min_value}.',
+        'max_value': 'Ensure this value is between -{max_value} and {max_value}.',
+    }
+
+    def __init__(self, currency_source='currency', min_value=None, **kwargs):
+        self.currency_source = currency_source.split('.')
+        self.min_value = min_value
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        currency = instance
+        for attr in self.currency_source:
+            currency = currency[attr] if isinstance(currency, dict) else getattr(currency, attr)
+        return super().get_attribute(instance), currency
+
+    def to_representation(self, value):
+        minor, currency = value
+        return None if minor is None else money.format_amount(minor, currency)
+
+    def to_internal_value(self, data):
+        try:
+            value = Decimal(str(data).strip())
+        except InvalidOperation:
+            self.fail('invalid')
+        if not value.is_finite():
+            self.fail('invalid')
+        if self.min_value is not None and value < self.min_value:
+            self.fail('min_value', min_value=self.min_value)
+        if abs(value) > money.MAX_AMOUNT:
+            self.fail('max_value', max_value=money.MAX_AMOUNT)
+        return value
+
+
+def to_minor_units(attrs, instance=None, field='amount'):
+    """Convert attrs[field] from major to minor units in the validated (or current) currency."""
+    currency = attrs.get('currency') or getattr(instance, 'currency', None) or 'ARS'
+    if field not in attrs:
+        if instance is not None and money.exponent(currency) != money.exponent(instance.currency):
+            raise serializers.ValidationError({field: ["Required when the currency's decimal places change."]})
+        return attrs
+    try:
+        attrs[field] = money.to_minor(attrs[field], currency)
+    except ValueError as e:
+        raise serializers.ValidationError({field: [str(e)]})
+    return attrs
 
 
 class ExpenseSplitSerializer(serializers.ModelSerializer):
     value = serializers.FloatField(required=False, default=0)
     user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
+    paid_amount = MoneyField(currency_source='expense.currency', required=False)
+    owed_amount = MoneyField(currency_source='expense.currency', required=False)
 
     class Meta:
         model = ExpenseSplit
@@ -14,12 +78,18 @@ class ExpenseSplitSerializer(serializers.ModelSerializer):
 
 
 class ExpenseSerializer(serializers.ModelSerializer):
+    """
+    Full expense representation. Pass `fields` to keep only those fields;
+    `net` (the caller's net for the expense) is available when the queryset
+    was annotated with it.
+    """
     splits = ExpenseSplitSerializer(many=True, required=False, source='expensesplit_set')
     added_by = serializers.ReadOnlyField(source='added_by.username')
     added_by_display = serializers.SerializerMethodField()
     participants = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(), many=True)
     paid_by_username = serializers.ReadOnlyField(source='paid_by.username')
     paid_by_display = serializers.SerializerMethodField()
+    amount = MoneyField()
 
     class Meta:
         model = Expense
@@ -40,7 +110,21 @@ class ExpenseSerializer(serializers.ModelSerializer):
             'split_method',
             'updated_at',
             'currency',
+            'group',
+            'recurring',
         ]
+        read_only_fields = ['recurring']
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+            if 'net' in fields:
+                self.fields['net'] = MoneyField(read_only=True)
+
+    def validate(self, attrs):
+        return to_minor_units(attrs, self.instance)
 
     def get_added_by_display(self, obj):
         full = obj.added_by.get_full_name()
@@ -67,9 +151,171 @@ class ExpenseSerializer(serializers.ModelSerializer):
         return instance
 
 
+def _datetime(value):
+    # Same output as DRF's DateTimeField
+    value = timezone.localtime(value).isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+def _optional(convert):
+    return lambda value: None if value is None else convert(value)
+
+
+class CompactExpenseSerializer:
+    """
+    List fast path for scalar fields. Reads `.values()` rows and converts each
+    column with a plain function, skipping DRF field objects entirely. Values
+    match ExpenseSerializer's for the same field names.
+    """
+    MONEY_FIELDS = {'amount', 'net'}
+    FIELDS = {
+        'id': ('id', None),
+        'name': ('name', None),
+        'amount': ('amount', None),
+        'category': ('category', None),
+        'currency': ('currency', None),
+        'expense_date': ('expense_date', _optional(date.isoformat)),
+        'date': ('date', _optional(_datetime)),
+        'updated_at': ('updated_at', _optional(_datetime)),
+        'paid_by': ('paid_by_id', None),
+        'paid_by_username': ('paid_by__username', None),
+        'added_by': ('added_by__username', None),
+        'split_method': ('split_method', None),
+        'group': ('group_id', None),
+        'recurring': ('recurring_id', None),
+        'net': ('net', None),
+    }
+    DEFAULT_FIELDS = ('id', 'name', 'amount', 'currency', 'expense_date', 'net')
+
+    def __init__(self, fields=None):
+        self.field_names = list(fields or self.DEFAULT_FIELDS)
+
+    @classmethod
+    def supports(cls, fields):
+        return set(fields) <= cls.FIELDS.keys()
+
+    def values(self, queryset):
+        columns = [self.FIELDS[name][0] for name in self.field_names]
+        if self.MONEY_FIELDS.intersection(self.field_names):
+            columns.append('currency')
+        return queryset.values(*dict.fromkeys(columns))
+
+    def to_representation(self, rows):
+        plan = [(name, *self.FIELDS[name]) for name in self.field_names if name not in self.MONEY_FIELDS]
+        money_plan = [(name, self.FIELDS[name][0]) for name in self.field_names if name in self.MONEY_FIELDS]
+        result = []
+        for row in rows:
+            item = {name: (convert(row[column]) if convert else row[column]) for name, column, convert in plan}
+            for name, column in money_plan:
+                item[name] = None if row[column] is None else money.format_amount(row[column], row['currency'])
+            result.append({name: item[name] for name in self.field_names})
+        return result
+
+
+class ExpenseBulkItemSerializer(serializers.Serializer):
+    """
+    Validates one item of a bulk create. Plain fields only, so a batch is
+    checked without a query per participant; membership is checked in the view.
+    """
+    name = serializers.CharField(max_length=50)
+    amount = MoneyField(min_value=Decimal('0'))
+    category = serializers.ChoiceField(choices=Expense.CATEGORY_CHOICES)
+    expense_date = serializers.DateField()
+    currency = serializers.ChoiceField(choices=Expense.CURRENCY_CHOICES, default='ARS')
+    paid_by = serializers.IntegerField()
+    split_method = serializers.ChoiceField(choices=Expense.SPLIT_METHODS, default='equal')
+    participants = serializers.ListField(child=serializers.IntegerField(), default=list)
+    splits = serializers.ListField(child=serializers.DictField(), default=list)
+    group = serializers.IntegerField(required=False, allow_null=True)
+
+    def validate(self, attrs):
+        return to_minor_units(attrs)
+
+
+class RecurringExpenseSerializer(serializers.ModelSerializer):
+    added_by = serializers.ReadOnlyField(source='added_by.username')
+    participants = serializers.ListField(child=serializers.IntegerField(), write_only=True, required=False)
+    splits = serializers.ListField(child=serializers.DictField(), required=False)
+    amount = MoneyField()
+
+    class Meta:
+        model = RecurringExpense
+        fields = [
+            'id',
+            'name',
+            'amount',
+            'category',
+            'currency',
+            'added_by',
+            'paid_by',
+            'split_method',
+            'participants',
+            'splits',
+            'group',
+            'frequency',
+            'interval',
+            'start_date',
+            'end_date',
+            'next_date',
+            'active',
+            'created_at',
+            'updated_at',
+        ]
+        read_only_fields = ['next_date', 'created_at', 'updated_at']
+
+    def validate_interval(self, value):
+        if value < 1:
+            raise serializers.ValidationError("Interval must be at least 1.")
+        return value
+
+    def validate(self, attrs):
+        start = attrs.get('start_date', getattr(self.instance, 'start_date', None))
+        end = attrs.get('end_date', getattr(self.instance, 'end_date', None))
+        if start and end and end < start:
+            raise serializers.ValidationError({"end_date": "End date must not be before the start date."})
+        return to_minor_units(attrs, self.instance)
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data['splits'] = [
+            {
+                **split,
+                'paid_amount': money.format_amount(split.get('paid_amount', 0), instance.currency),
+                'owed_amount': money.format_amount(split.get('owed_amount', 0), instance.currency),
+            }
+            for split in instance.splits
+        ]
+        return data
+
+    def create(self, validated_data):
+        validated_data.pop('participants', None)  # resolved into splits in the view
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        validated_data.pop('participants', None)
+        return super().update(instance, validated_data)
+
+
+CURRENCY_SYMBOLS = {
+    "ARS": "$",
+    "UYU": "$",
+    "CLP": "$",
+    "MXN": "$",
+    "BRL": "$",
+    "USD": "$",
+    "EUR": "€",
+    "GBP": "£",
+    "JPY": "¥",
+    "PYG": "₲",
+    "AUD": "$",
+    "KRW": "₩",
+}
+
+
 class ActivitySerializer(serializers.ModelSerializer):
     actor_name = serializers.SerializerMethodField()
     currency_symbol = serializers.SerializerMethodField()
+    expense_amount = MoneyField(read_only=True)
 
     class Meta:
         model = Activity
@@ -94,21 +340,31 @@ class ActivitySerializer(serializers.ModelSerializer):
         return "Unknown"
 
     def get_currency_symbol(self, obj):
-        mapping = {
-            "ARS": "$",
-            "UYU": "$",
-            "CLP": "$",
-            "MXN": "$",
-            "BRL": "$",
-            "USD": "$",
-            "EUR": "€",
-            "GBP": "£",
-            "JPY": "¥",
-            "PYG": "₲",
-            "AUD": "$",
-            "KRW": "₩",
-        }
-        return mapping.get(obj.currency, obj.currency)
+        return CURRENCY_SYMBOLS.get(obj.currency, obj.currency)
+
+
+class FeedEntrySerializer(serializers.ModelSerializer):
+    """Same payload as ActivitySerializer, read from the denormalized feed."""
+    id = serializers.ReadOnlyField(source='activity_id')
+    expense = serializers.ReadOnlyField(source='expense_id')
+    currency_symbol = serializers.SerializerMethodField()
+    expense_amount = MoneyField(read_only=True)
+
+    class Meta:
+        model = FeedEntry
+        fields = ActivitySerializer.Meta.fields
+
+    def get_currency_symbol(self, obj):
+        return CURRENCY_SYMBOLS.get(obj.currency, obj.currency)
+
+
+class ExpenseGroupSerializer(serializers.ModelSerializer):
+    created_by = serializers.ReadOnlyField(source='created_by.username')
+    members = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(), many=True, required=False)
+
+    class Meta:
+        model = ExpenseGroup
+        fields = ['id', 'name', 'created_by', 'members', 'created_at']
 
 
 class UserPublicSerializer(serializers.ModelSerializer):
@@ -130,3 +386,25 @@ class ContactRequestSerializer(serializers.ModelSerializer):
     class Meta:
         model = ContactRequest
         fields = ["id", "from_user", "to_user", "status", "created_at", "updated_at"]
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ExportJob
+        fields = [
+            "id", "status", "compress", "rows_written", "rows_total", "progress",
+            "size", "filename", "error", "created_at", "finished_at", "download_url",
+        ]
+
+    def get_progress(self, obj):
+        if obj.status == ExportJob.DONE:
+            return 1.0
+        return round(obj.rows_written / obj.rows_total, 3) if obj.rows_total else 0.0
+
+    def get_download_url(self, obj):
+        if obj.status != ExportJob.DONE:
+            return None
+        return reverse('export_job_download', args=[obj.id])
@@ -0,0 +1,91 @@
+"""
+Delta sync for offline clients (GET /api/sync/).
+
+The change sequence is the ChangeEvent id: every write stores one event per
+affected user in the write's own transaction (expenses/events.py), so the
+caller's events after a token are exactly the changes the client missed.
+changes_since() folds them into expenses to refetch, expense ids to drop
+(tombstones) and the counterparties whose balances moved, so a sync costs
+in proportion to the changes, not to the user's history.
+
+Tokens are opaque to clients; they carry the last event id covered. Events
+are pruned after CHANGE_EVENT_RETENTION_DAYS, and a token from before the
+oldest retained event cannot be replayed: the client gets `reset` and a full
+snapshot instead, as on its first sync.
+
+A token never passes an event that has not committed: the ceiling comes from
+events.visible_ceiling(), which relies on events committing in id order.
+"""
+from django.db.models import Min
+
+from .events import visible_ceiling
+from .models import ChangeEvent
+
+EXPENSE_KINDS = {'expense_created', 'expense_updated', 'expense_deleted', 'settled'}
+
+
+class Changes:
+    def __init__(self, token, reset=False, has_more=False):
+        self.token = token
+        self.reset = reset
+        self.has_more = has_more
+        self.changed = []  # expense ids to (re)fetch
+        self.deleted = []  # expense ids to drop
+        # Counterparties whose balance rows moved; None means any of them may have
+        self.counterparties = set()
+
+
+def parse_token(value):
+    """The event id in a sync token (None when absent); ValueError when malformed."""
+    if value in (None, ''):
+        return None
+    token = int(value)
+    if token < 0:
+        raise ValueError(value)
+    return token
+
+
+def _expired(since):
+    """Whether events after `since` may already have been pruned."""
+    oldest = ChangeEvent.objects.aggregate(first=Min('id'))['first']
+    if oldest is None:
+        return since > 0
+    return since < oldest - 1
+
+
+def changes_since(user, since, limit):
+    """`user`'s changes after the token `since` (None for a first sync), at most `limit` events of them."""
+    # The ceiling is read first: anything committed later is left for the next sync
+    ceiling = visible_ceiling()
+    if since is None or since > ceiling or _expired(since):
+        changes = Changes(ceiling, reset=True)
+        changes.counterparties = None
+        return changes
+
+    events = list(
+        ChangeEvent.objects.filter(user=user, id__gt=since, id__lte=ceiling)
+        .order_by('id')
+        .values_list('id', 'kind', 'payload')[:limit + 1]
+    )
+    has_more = len(events) > limit
+    events = events[:limit]
+    # With nothing left to read the token can jump to the ceiling, which keeps
+    # an idle client's token ahead of pruning
+    changes = Changes(events[-1][0] if has_more else max(since, ceiling), has_more=has_more)
+
+    latest = {}
+    for _event_id, kind, payload in events:
+        if kind not in EXPENSE_KINDS:
+            continue
+        latest[payload['expense']] = kind
+        users = payload.get('users')
+        if users is None:
+            # Written before events carried their users
+            changes.counterparties = None
+        elif changes.counterparties is not None:
+            changes.counterparties.update(users)
+    changes.changed = [expense_id for expense_id, kind in latest.items() if kind != 'expense_deleted']
+    changes.deleted = [expense_id for expense_id, kind in latest.items() if kind == 'expense_deleted']
+    if changes.counterparties is not None:
+        changes.counterparties.discard(user.id)
+    return changes
@@ -0,0 +1,204 @@
+"""
+Database-backed background tasks.
+
+enqueue() stores a Task row, in the caller's transaction, so a task only
+becomes visible to workers once the write that queued it commits. The
+`run_worker` command claims and runs tasks; any number of worker processes
+(on one host or several) can share the table, since claiming is atomic:
+
+- PostgreSQL: SELECT ... FOR UPDATE SKIP LOCKED, so workers never wait on
+  each other's rows.
+- SQLite and others: a conditional UPDATE of the candidate row; of several
+  workers racing for it exactly one matches.
+
+A claim is a lease of TASK_LEASE_SECONDS. A failed task is retried with
+exponential backoff until it has used max_attempts; a worker that dies
+mid-task leaves the lease to expire and the task is claimed again. Tasks
+therefore run at least once and handlers must be idempotent. Handlers are
+not wrapped in a transaction (under SQLite's BEGIN IMMEDIATE that would hold
+the write lock for the whole task); they open their own where they need one.
+
+A task's name is the dotted path of its handler, called with the payload as
+keyword arguments. A handler may carry an `on_failure(error, **payload)`
+attribute, called once its task has failed for good (not between retries),
+e.g. to mark what it was working on as failed.
+
+With TASKS_EAGER (the default, until a deployment runs a worker) enqueue()
+runs the handler in the calling process instead, so nothing waits on a
+worker that does not exist: once the caller's transaction commits, or at
+once outside one, so the handler sees what queued it and never runs inside
+the caller's transaction. An eager task gets one attempt; its error is
+logged and passed to on_failure rather than raised into the caller. Such
+work, exports included, only leaves the request once a worker is deployed.
+"""
+import logging
+import os
+import socket
+import traceback
+from datetime import timedelta
+from functools import lru_cache, partial
+from time import perf_counter, sleep
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import metrics
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+# Rows a worker tries per claim when it has to race other workers for them
+CLAIM_CANDIDATES = 10
+MAX_BACKOFF_SECONDS = 3600
+
+
+@lru_cache(maxsize=None)
+def _handler(name):
+    return import_string(name)
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue(name, payload=None, *, delay=None, max_attempts=None):
+    """
+    Queue the handler at dotted path `name` to run with `payload` (JSON
+    serializable keyword arguments). Returns the Task, or None when it ran
+    eagerly.
+    """
+    payload = payload or {}
+    if settings.TASKS_EAGER:
+        transaction.on_commit(partial(_run_eagerly, name, payload))
+        return None
+    task = Task(name=name, payload=payload, max_attempts=max_attempts or settings.TASK_MAX_ATTEMPTS)
+    if delay:
+        task.run_after = timezone.now() + timedelta(seconds=delay)
+    task.save()
+    return task
+
+
+def _ready(now):
+    """Tasks due to run: queued ones whose time has come and ones whose lease expired."""
+    return Task.objects.filter(
+        Q(status=Task.QUEUED, run_after__lte=now) | Q(status=Task.RUNNING, locked_until__lt=now)
+    )
+
+
+def claim(worker_id):
+    """Lease the next due task to `worker_id`; None when there is nothing to do."""
+    now = timezone.now()
+    lease = now + timedelta(seconds=settings.TASK_LEASE_SECONDS)
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            task = _ready(now).order_by('run_after', 'id').select_for_update(skip_locked=True).first()
+            if task is None:
+                return None
+            task.status, task.locked_by, task.locked_until = Task.RUNNING, worker_id, lease
+            task.attempts += 1
+            task.save(update_fields=['status', 'locked_by', 'locked_until', 'attempts'])
+            return task
+    candidates = list(_ready(now).order_by('run_after', 'id').values_list('id', flat=True)[:CLAIM_CANDIDATES])
+    for task_id in candidates:
+        claimed = _ready(now).filter(id=task_id).update(
+            status=Task.RUNNING, locked_by=worker_id, locked_until=lease, attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Task.objects.get(id=task_id)
+    return None
+
+
+def _backoff(attempts):
+    return min(settings.TASK_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+
+
+def _finish(task, worker_id, **fields):
+    # A worker that overran its lease may have lost the task to another one
+    return Task.objects.filter(id=task.id, status=Task.RUNNING, locked_by=worker_id).update(
+        locked_by='', locked_until=None, **fields,
+    )
+
+
+def _failed(name, payload, error):
+    on_failure = getattr(_handler(name), 'on_failure', None)
+    if on_failure is None:
+        return
+    try:
+        on_failure(error=error, **payload)
+    except Exception:
+        logger.exception("on_failure of task %s failed", name)
+
+
+def _run_eagerly(name, payload):
+    try:
+        _handler(name)(**payload)
+    except Exception:
+        logger.exception("Task %s failed (eager)", name)
+        _failed(name, payload, traceback.format_exc())
+        result = 'failed'
+    else:
+        result = 'done'
+    metrics.registry.increment('fairkeep_tasks_total', task=name, result=result)
+
+
+def execute(task, worker_id):
+    """Run a claimed task and record the outcome: done, queued for a retry, or failed."""
+    now = timezone.now()
+    if task.attempts > task.max_attempts:
+        # The worker running its last attempt died holding the lease
+        error = task.last_error or "Lease expired on the last attempt."
+        if _finish(task, worker_id, status=Task.FAILED, finished_at=now, last_error=error):
+            _failed(task.name, task.payload, error)
+        result = 'failed'
+    else:
+        start = perf_counter()
+        try:
+            _handler(task.name)(**task.payload)
+        except Exception:
+            logger.exception("Task %s #%s failed (attempt %s/%s)", task.name, task.id, task.attempts, task.max_attempts)
+            error = traceback.format_exc()
+            if task.attempts < task.max_attempts:
+                _finish(task, worker_id, status=Task.QUEUED, last_error=error,
+                        run_after=timezone.now() + timedelta(seconds=_backoff(task.attempts)))
+                result = 'retried'
+            else:
+                if _finish(task, worker_id, status=Task.FAILED, last_error=error, finished_at=timezone.now()):
+                    _failed(task.name, task.payload, error)
+                result = 'failed'
+        else:
+            _finish(task, worker_id, status=Task.DONE, finished_at=timezone.now())
+            result = 'done'
+        logger.debug("Task %s #%s %s in %.3fs", task.name, task.id, result, perf_counter() - start)
+    metrics.registry.increment('fairkeep_tasks_total', task=task.name, result=result)
+    return result
+
+
+def _recycle_connections():
+    # As between requests: drop connections past CONN_MAX_AGE or broken ones.
+    # Not while the caller holds a transaction open (as tests do).
+    if not connection.in_atomic_block:
+        close_old_connections()
+
+
+def work(worker_id=None, burst=False, max_tasks=None, should_stop=lambda: False):
+    """
+    Claim and run tasks until `should_stop()` is true, or with `burst` until
+    the queue is empty. Returns the number of tasks run.
+    """
+    worker_id = worker_id or default_worker_id()
+    processed = 0
+    while not should_stop() and (max_tasks is None or processed < max_tasks):
+        _recycle_connections()
+        task = claim(worker_id)
+        if task is None:
+            if burst:
+                break
+            sleep(settings.TASK_POLL_INTERVAL)
+            continue
+        execute(task, worker_id)
+        processed += 1
+    _recycle_connections()
+    return processed
@@ -1,6 +1,39 @@
-from django.test import TestCase, Client
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+import asyncio
+from itertools import combinations
+import gzip
+import json
+import os
+import subprocess
+import sys
+import time
+from io import StringIO
+import tempfile
+import threading
+from unittest import mock, skipUnless
+from pathlib import Path
+from asgiref.sync import sync_to_async
+from datetime import date, timedelta
+from django.test import TestCase, TransactionTestCase, Client, AsyncRequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.utils import timezone
 from django.contrib.auth.models import User
-from expenses.models import Expense
+from expenses.models import Expense, ExpenseSplit, ExpenseGroup, ContactRequest, Activity, ChangeEvent, RecurringExpense, ArchivedExpense, FeedEntry, SearchToken, Task, ExportJob
+from expenses.apps import ExpensesConfig
+from expenses.debts import simplify_debts, group_net_positions
+from expenses import async_views, checkpoints, events, exports, metrics, money, renderers, routing, search, tasks, throttling
+from expenses.serializers import ExpenseSerializer
+from expenses.activity import log_activities
+from expenses.recurring import materialize_due, occurrence_date
 
 class AuthTests(TestCase):
     def setUp(self):
@@ -66,3 +99,1401 @@ class AuthTests(TestCase):
             content_type='application/json'
         )
         self.assertEqual(response.status_code, 201)
+
+
+class GroupSettlementTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'user{i}', password='testpass') for i in range(4)]
+        self.group = ExpenseGroup.objects.create(name='House', created_by=self.users[0])
+        self.group.members.set(self.users)
+        for a, b in combinations(self.users, 2):
+            ContactRequest.objects.create(from_user=a, to_user=b, status='accepted')
+
+    def _expense(self, payer, amount, owed_by, currency='ARS'):
+        expense = Expense.objects.create(
+            name='Groceries', amount=amount, category='Food', paid_by=payer,
+            added_by=payer, split_method='manual', currency=currency, group=self.group,
+        )
+        for user, owed in owed_by.items():
+            ExpenseSplit.objects.create(expense=expense, user=user, owed_amount=owed)
+        return expense
+
+    def test_simplify_debts_settles_positions(self):
+        positions = {1: 3000, 2: -1000, 3: -2500, 4: 500}
+        transfers = simplify_debts(positions)
+        self.assertLessEqual(len(transfers), len(positions) - 1)
+        for debtor, creditor, amount in transfers:
+            positions[debtor] += amount
+            positions[creditor] -= amount
+        self.assertTrue(all(v == 0 for v in positions.values()))
+
+    def test_settle_group_zeroes_positions_per_currency(self):
+        u0, u1, u2, u3 = self.users
+        self._expense(u0, 9000, {u0: 3000, u1: 3000, u2: 3000})
+        self._expense(u1, 4000, {u2: 2000, u3: 2000})
+        self._expense(u3, 1000, {u0: 1000}, currency='USD')
+
+        self.client.login(username='user0', password='testpass')
+        plan = self.client.get(f'/api/groups/{self.group.id}/simplify/').json()
+        self.assertEqual({t['currency'] for t in plan}, {'ARS', 'USD'})
+
+        response = self.client.post(f'/api/groups/{self.group.id}/settle/', {}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(group_net_positions(self.group), {})
+        self.assertEqual(Activity.objects.filter(action='settled').count(), len(plan))
+
+
+class AsyncReadViewTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='testpass', first_name='Alice')
+        self.bob = User.objects.create_user(username='bob', password='testpass')
+        ContactRequest.objects.create(from_user=self.alice, to_user=self.bob, status='accepted')
+        expense = Expense.objects.create(
+            name='Dinner', amount=5000, category='Food', paid_by=self.alice,
+            added_by=self.alice, split_method='equal', currency='USD',
+        )
+        ExpenseSplit.objects.create(expense=expense, user=self.alice, owed_amount=2500)
+        ExpenseSplit.objects.create(expense=expense, user=self.bob, owed_amount=2500)
+        log_activities('created', [(expense, [self.alice.id, self.bob.id])], self.alice)
+
+    async def _get_async(self, view, path, user):
+        request = AsyncRequestFactory().get(path)
+
+        async def auser():
+            return user
+        request.auser = auser
+        response = await view(request)
+        return response.status_code, json.loads(response.content)
+
+    async def test_async_views_match_sync_payloads(self):
+        await self.async_client.aforce_login(self.bob)
+        cases = [
+            (async_views.expense_list, '/api/expenses/'),
+            (async_views.balances, '/api/balances/'),
+            (async_views.activities, '/api/activities/'),
+        ]
+        for view, path in cases:
+            sync_response = await self.async_client.get(path)
+            status_code, payload = await self._get_async(view, path, self.bob)
+            self.assertEqual(status_code, 200)
+            self.assertEqual(payload, sync_response.json())
+
+    async def test_async_view_requires_authentication(self):
+        from django.contrib.auth.models import AnonymousUser
+        status_code, _payload = await self._get_async(async_views.balances, '/api/balances/', AnonymousUser())
+        self.assertEqual(status_code, 403)
+
+
+@override_settings(SSE_MAX_DURATION=0.3, SSE_POLL_INTERVAL=0.05)
+class ChangeEventTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='testpass')
+        self.bob = User.objects.create_user(username='bob', password='testpass')
+        ContactRequest.objects.create(from_user=self.alice, to_user=self.bob, status='accepted')
+
+    def _create_expense(self):
+        self.client.force_login(self.alice)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/expenses/', {
+                'name': 'Taxi', 'amount': '30.00', 'category': 'Transport', 'currency': 'USD', 'expense_date': '2026-01-15',
+                'paid_by': self.alice.id, 'participants': [self.alice.id, self.bob.id], 'split_method': 'equal',
+                'splits': [{'user': self.alice.id}, {'user': self.bob.id}],
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def test_write_paths_emit_events_for_involved_users(self):
+        expense_id = self._create_expense()
+        self.client.delete(f'/api/expenses/{expense_id}/')
+        kinds = list(ChangeEvent.objects.filter(user=self.bob).order_by('id').values_list('kind', flat=True))
+        self.assertEqual(kinds, ['expense_created', 'expense_deleted'])
+        self.assertEqual(ChangeEvent.objects.filter(user=self.bob).last().payload['expense'], expense_id)
+
+    async def test_stream_resumes_after_last_event_id(self):
+        await sync_to_async(self._create_expense)()
+        first = await ChangeEvent.objects.filter(user=self.bob).afirst()
+        await self.async_client.aforce_login(self.bob)
+
+        response = await self.async_client.get('/api/events/stream/', headers={'Last-Event-ID': '0'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertIn(f'id: {first.id}\nevent: expense_created\n', body)
+
+        response = await self.async_client.get('/api/events/stream/', headers={'Last-Event-ID': str(first.id)})
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertNotIn('event: expense_created', body)
+
+    @override_settings(SSE_POLL_INTERVAL=0.01, SSE_DB_POLL_INTERVAL=60, SSE_MAX_DURATION=1)
+    async def test_stream_waits_for_hinted_events_to_become_visible(self):
+        await sync_to_async(self._create_expense)()
+        first = await ChangeEvent.objects.filter(user=self.bob).afirst()
+        # A writer's hint can name an id this stream cannot read yet
+        await cache.aset(events.latest_key(self.bob.id), first.id + 50)
+
+        async def read():
+            return ''.join([chunk async for chunk in async_views._event_stream(self.bob.id, first.id)])
+
+        reader = asyncio.ensure_future(read())
+        await asyncio.sleep(0.2)
+        await sync_to_async(self._create_expense)()
+        body = await reader
+        second = await ChangeEvent.objects.filter(user=self.bob).alast()
+        self.assertLess(second.id, first.id + 50)
+        self.assertIn(f'id: {second.id}\nevent: expense_created\n', body)
+
+    def test_backlog_stops_at_the_visible_ceiling(self):
+        self._create_expense()
+        first = ChangeEvent.objects.filter(user=self.bob).first()
+        self._create_expense()
+        with mock.patch('expenses.events.visible_ceiling', return_value=first.id):
+            body = ''.join(async_views._event_backlog(self.bob.id, 0))
+        self.assertIn(f'id: {first.id}\n', body)
+        self.assertEqual(body.count('event: expense_created'), 1)
+
+    def test_failed_event_write_rolls_back_the_expense(self):
+        with mock.patch('expenses.events.emit', side_effect=RuntimeError("events table unavailable")):
+            with self.assertRaises(RuntimeError), self.assertLogs('django.request', 'ERROR'):
+                self._create_expense()
+        self.assertFalse(Expense.objects.exists())
+        self.assertFalse(Activity.objects.exists())
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='staff', password='testpass', is_staff=True)
+        self.client.force_login(self.user)
+
+    def test_server_timing_header_reports_db_time(self):
+        response = self.client.get('/api/balances/')
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="[1-9]\d* queries"$')
+
+    def test_metrics_endpoint_exposes_histograms_per_view(self):
+        self.client.get('/api/activities/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('fairkeep_request_duration_seconds_bucket{view="activities"', response.content.decode())
+
+    def test_metrics_endpoint_requires_staff(self):
+        self.client.force_login(User.objects.create_user(username='plain', password='testpass'))
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+
+class RequestProfilerTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.staff = User.objects.create_user(username='staff', password='testpass', is_staff=True)
+
+    def test_staff_can_request_a_profile(self):
+        self.client.force_login(self.staff)
+        with self.settings(REQUEST_PROFILE_DIR=self.tmp.name):
+            response = self.client.get('/api/balances/', headers={'X-Profile': '1'})
+        capture = Path(self.tmp.name) / response['X-Profile-Id']
+        self.assertEqual(
+            sorted(p.name for p in capture.iterdir()),
+            ['memory.txt', 'meta.json', 'profile.prof', 'profile.txt', 'sql.json'],
+        )
+        self.assertTrue(json.loads((capture / 'sql.json').read_text()))
+
+    def test_non_staff_flag_is_ignored(self):
+        self.client.force_login(User.objects.create_user(username='plain', password='testpass'))
+        with self.settings(REQUEST_PROFILE_DIR=self.tmp.name):
+            response = self.client.get('/api/balances/?_profile=1')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(list(Path(self.tmp.name).iterdir()), [])
+
+    def test_slow_requests_fill_a_bounded_ring_buffer(self):
+        self.client.force_login(self.staff)
+        with self.settings(REQUEST_PROFILE_DIR=self.tmp.name, SLOW_REQUEST_THRESHOLD_MS=1,
+                           REQUEST_PROFILE_MAX_ENTRIES=2):
+            for _ in range(4):
+                self.client.get('/api/balances/')
+        captures = list(Path(self.tmp.name).iterdir())
+        self.assertEqual(len(captures), 2)
+        self.assertEqual(json.loads((captures[0] / 'meta.json').read_text())['trigger'], 'slow')
+
+
+class SessionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='testpass', first_name='Alice')
+
+    def test_check_session_answers_without_user_lookup(self):
+        self.client.post('/api/login/', {'username': 'alice', 'password': 'testpass'}, content_type='application/json')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/check-session/')
+        self.assertEqual(response.json()['display_name'], 'Alice')
+        self.assertFalse([q for q in ctx.captured_queries if 'auth_user' in q['sql']])
+
+    def test_check_session_redirects_when_logged_out(self):
+        response = self.client.get('/api/check-session/')
+        self.assertEqual(response.status_code, 302)
+
+    def test_prune_sessions_deletes_only_expired(self):
+        now = timezone.now()
+        for i in range(5):
+            Session.objects.create(session_key=f'expired{i}', session_data='', expire_date=now - timedelta(days=1))
+        Session.objects.create(session_key='live', session_data='', expire_date=now + timedelta(days=1))
+        call_command('prune_sessions', batch_size=2, stdout=StringIO())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['live'])
+
+    def test_cached_sessions_require_a_shared_cache(self):
+        env = {**os.environ, 'DJANGO_SESSION_MODE': 'cached_db'}
+        env.pop('DJANGO_CACHE_BACKEND', None)
+        load = [sys.executable, '-c', 'import fairkeep.settings']
+        cwd = Path(__file__).resolve().parent.parent
+        result = subprocess.run(load, cwd=cwd, env=env, capture_output=True, text=True)
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn('ImproperlyConfigured', result.stderr)
+        env['DJANGO_CACHE_BACKEND'] = 'db'
+        subprocess.run(load, cwd=cwd, env=env, capture_output=True, check=True)
+
+
+class BulkExpenseTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='testpass')
+        self.bob = User.objects.create_user(username='bob', password='testpass')
+        self.carol = User.objects.create_user(username='carol', password='testpass')
+        ContactRequest.objects.create(from_user=self.alice, to_user=self.bob, status='accepted')
+        self.client.login(username='alice', password='testpass')
+
+    def _item(self, **overrides):
+        item = {
+            'name': 'Dinner', 'amount': '30.00', 'category': 'Food', 'expense_date': '2024-05-01',
+            'currency': 'ARS', 'paid_by': self.alice.id, 'split_method': 'equal',
+            'participants': [self.alice.id, self.bob.id],
+            'splits': [{'user': self.alice.id}, {'user': self.bob.id}],
+        }
+        item.update(overrides)
+        return item
+
+    def test_bulk_create_reports_per_item_results(self):
+        items = [self._item() for _ in range(20)]
+        items[3] = self._item(participants=[self.alice.id, self.carol.id])
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/expenses/bulk/', items, content_type='application/json')
+        self.assertEqual(response.status_code, 207)
+        body = response.json()
+        self.assertEqual((body['created'], body['failed']), (19, 1))
+        self.assertEqual(body['results'][3]['status'], 400)
+        self.assertEqual(Expense.objects.count(), 19)
+        self.assertEqual(ExpenseSplit.objects.filter(user=self.bob).count(), 19)
+        self.assertEqual(ExpenseSplit.objects.first().owed_amount, 1500)
+        self.assertEqual(Activity.objects.filter(action='created').count(), 19)
+        # Query count does not grow with the batch
+        self.assertLess(len(ctx.captured_queries), 21)
+
+    def test_malformed_group_is_an_item_error(self):
+        items = [self._item(), self._item(group=[1]), self._item(group={'id': 1}), self._item(group='x')]
+        response = self.client.post('/api/expenses/bulk/', items, content_type='application/json')
+        self.assertEqual(response.status_code, 207, response.content)
+        results = response.json()['results']
+        self.assertEqual([r['status'] for r in results], [201, 400, 400, 400])
+        self.assertIn('group', results[1]['errors'])
+
+    def test_bulk_create_matches_single_create_balances(self):
+        self.client.post('/api/expenses/bulk/', [self._item(paid_by=self.bob.id)], content_type='application/json')
+        balances = self.client.get('/api/balances/').json()
+        self.assertEqual(balances[0]['amount'], -15.0)
+
+
+class RecurringExpenseTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='testpass')
+        self.bob = User.objects.create_user(username='bob', password='testpass')
+        ContactRequest.objects.create(from_user=self.alice, to_user=self.bob, status='accepted')
+        self.client.login(username='alice', password='testpass')
+
+    def _create(self, **overrides):
+        payload = {
+            'name': 'Rent', 'amount': '1000.00', 'currency': 'ARS', 'paid_by': self.alice.id,
+            'split_method': 'equal', 'participants': [self.alice.id, self.bob.id],
+            'splits': [{'user': self.alice.id}, {'user': self.bob.id}],
+            'frequency': 'monthly', 'start_date': '2024-01-31',
+        }
+        payload.update(overrides)
+        return self.client.post('/api/recurring-expenses/', payload, content_type='application/json')
+
+    def test_occurrence_dates_clamp_to_month_end(self):
+        start = date(2024, 1, 31)
+        self.assertEqual(
+            [occurrence_date(start, 'monthly', 1, n) for n in range(4)],
+            [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30)],
+        )
+
+    def test_materialize_is_idempotent(self):
+        response = self._create()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['category'], 'Periodic Expenses')
+        call_command('materialize_recurring', '--date', '2024-04-15', stdout=StringIO())
+        call_command('materialize_recurring', '--date', '2024-04-15', stdout=StringIO())
+        self.assertEqual(
+            list(Expense.objects.order_by('period_date').values_list('expense_date', flat=True)),
+            [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31)],
+        )
+        self.assertEqual(ExpenseSplit.objects.filter(user=self.bob, owed_amount=50000).count(), 3)
+        self.assertEqual(Activity.objects.filter(action='created', actor=self.alice).count(), 3)
+        self.assertEqual(RecurringExpense.objects.get().next_date, date(2024, 4, 30))
+
+    def test_end_date_deactivates_template(self):
+        self._create(frequency='weekly', start_date='2024-01-01', end_date='2024-01-10')
+        self.assertEqual(materialize_due(today=date(2024, 3, 1)), 2)
+        self.assertFalse(RecurringExpense.objects.get().active)
+
+    def test_participants_must_be_contacts(self):
+        carol = User.objects.create_user(username='carol', password='testpass')
+        response = self._create(participants=[self.alice.id, carol.id], splits=[])
+        self.assertEqual(response.status_code, 400)
+
+    def test_checkpoint_waits_for_due_occurrences(self):
+        self._create()
+        with self.assertRaisesMessage(CommandError, 'run materialize_recurring first'):
+            call_command('create_balance_checkpoint', '--as-of', '2024-02-29', stdout=StringIO())
+        materialize_due(today=date(2024, 2, 29))
+        call_command('create_balance_checkpoint', '--as-of', '2024-02-29', stdout=StringIO())
+
+    def test_closed_occurrences_are_counted(self):
+        self._create()
+        RecurringExpense.objects.update(active=False)
+        call_command('create_balance_checkpoint', '--as-of', '2024-02-29', stdout=StringIO())
+        RecurringExpense.objects.update(active=True)
+        skipped = metrics.registry.counter_value('fairkeep_recurring_skipped_total')
+        with self.assertLogs('expenses.recurring', 'WARNING'):
+            self.assertEqual(materialize_due(today=date(2024, 3, 31)), 1)
+        self.assertEqual(metrics.registry.counter_value('fairkeep_recurring_skipped_total'), skipped + 2)
+
+
+class BalanceCheckpointTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='testpass')
+        self.bob = User.objects.create_user(username='bob', password='testpass')
+        ContactRequest.objects.create(from_user=self.alice, to_user=self.bob, status='accepted')
+        self.group = ExpenseGroup.objects.create(name='Flat', created_by=self.alice)
+        self.group.members.set([self.alice, self.bob])
+        self.client.login(username='alice', password='testpass')
+
+    def _expense(self, payer, debtor, owed, expense_date, group=None):
+        expense = Expense.objects.create(
+            name='Dinner', amount=owed * 2, category='Food', paid_by=payer, added_by=payer,
+            split_method='equal', expense_date=expense_date, group=group,
+        )
+        ExpenseSplit.objects.create(expense=expense, user=payer, owed_amount=owed)
+        ExpenseSplit.objects.create(expense=expense, user=debtor, owed_amount=owed)
+        return expense
+
+    def test_balances_unchanged_by_checkpoint_and_archive(self):
+        self._expense(self.alice, self.bob, 3000, date(2024, 1, 5), group=self.group)
+        self._expense(self.bob, self.alice, 1000, date(2024, 1, 20))
+        self._expense(self.alice, self.bob, 500, date(2024, 3, 1))
+        before = self.client.get('/api/balances/').json()
+        group_before = group_net_positions(self.group)
+
+        call_command('create_balance_checkpoint', '--as-of', '2024-01-31', stdout=StringIO())
+        call_command('archive_expenses', stdout=StringIO())
+
+        self.assertEqual(Expense.objects.count(), 1)
+        self.assertEqual(ArchivedExpense.objects.count(), 2)
+        self.assertEqual(self.client.get('/api/balances/').json(), before)
+        self.assertEqual(before[0]['amount'], 25.0)
+        self.assertEqual(group_net_positions(self.group), group_before)
+
+        export = self.client.get('/api/export-expenses/').content.decode()
+        self.assertEqual(export.count('Dinner'), 3)
+
+    def test_closed_period_rejects_writes(self):
+        expense = self._expense(self.alice, self.bob, 3000, date(2024, 1, 5))
+        call_command('create_balance_checkpoint', '--as-of', '2024-01-31', stdout=StringIO())
+        response = self.client.delete(f'/api/expenses/{expense.id}/')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/expenses/', {
+            'name': 'Late', 'amount': '10.00', 'category': 'Food', 'expense_date': '2024-01-15',
+            'paid_by': self.alice.id, 'split_method': 'equal', 'participants': [self.alice.id, self.bob.id],
+            'splits': [{'user': self.alice.id}, {'user': self.bob.id}],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+    def test_default_checkpoint_leaves_last_month_open(self):
+        command = 'expenses.management.commands.create_balance_checkpoint.timezone.localdate'
+        with mock.patch(command, return_value=date(2024, 3, 15)):
+            call_command('create_balance_checkpoint', stdout=StringIO())
+        self.assertEqual(checkpoints.closed_through(), date(2024, 1, 31))
+
+    def test_bulk_checks_the_period_under_the_lock(self):
+        item = {
+            'name': 'Dinner', 'amount': '10.00', 'category': 'Food', 'paid_by': self.alice.id,
+            'split_method': 'equal', 'participants': [self.alice.id, self.bob.id],
+            'splits': [{'user': self.alice.id}, {'user': self.bob.id}],
+        }
+        checkpoints.create_checkpoint(date(2024, 1, 31))
+        with mock.patch('expenses.checkpoints._lock_periods') as lock:
+            response = self.client.post('/api/expenses/bulk/', [
+                {**item, 'expense_date': '2024-01-15'}, {**item, 'expense_date': '2024-02-15'},
+            ], content_type='application/json')
+        lock.assert_called_once_with(shared=True)
+        self.assertEqual(response.status_code, 207, response.content)
+        self.assertEqual([r['status'] for r in response.json()['results']], [400, 201])
+        self.assertEqual(list(Expense.objects.values_list('expense_date', flat=True)), [date(2024, 2, 15)])
+
+
+class FeedTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='testpass', first_name='Alice')
+        self.bob = User.objects.create_user(username='bob', password='testpass')
+
+    def _log(self, name):
+        expense = Expense.objects.create(
+            name=name, amount=2000, category='Food', paid_by=self.alice,
+            added_by=self.alice, split_method='equal', expense_date=date(2024, 5, 1),
+        )
+        # Eager tasks run once the write commits
+        with self.captureOnCommitCallbacks(execute=True):
+            log_activities('created', [(expense, [self.alice.id, self.bob.id])], self.alice)
+        return expense
+
+    def test_feed_reads_denormalized_entries(self):
+        self._log('Lunch')
+        self._log('Dinner')
+        self.client.login(username='bob', password='testpass')
+        with CaptureQueriesContext(connection) as ctx:
+            feed = self.client.get('/api/activities/').json()
+        self.assertEqual([item['expense_name'] for item in feed], ['Dinner', 'Lunch'])
+        self.assertEqual(feed[0]['actor_name'], 'Alice')
+        self.assertEqual(feed[0]['id'], Activity.objects.get(expense_name='Dinner').id)
+        self.assertFalse([q for q in ctx.captured_queries if 'expenses_activity' in q['sql']])
+
+    def test_prune_feed_deletes_old_entries(self):
+        self._log('Old')
+        self._log('New')
+        old = timezone.now() - timedelta(days=400)
+        FeedEntry.objects.filter(expense_name='Old').update(created_at=old)
+        Activity.objects.filter(expense_name='Old').update(created_at=old)
+        call_command('prune_feed', days=365, batch_size=1, stdout=StringIO())
+        self.assertEqual(set(FeedEntry.objects.values_list('expense_name', flat=True)), {'New'})
+        self.assertEqual(list(Activity.objects.values_list('expense_name', flat=True)), ['New'])
+
+
+def failing_task(message):
+    raise RuntimeError(message)
+
+
+@override_settings(TASKS_EAGER=False)
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='testpass', first_name='Alice')
+        self.bob = User.objects.create_user(username='bob', password='testpass')
+
+    def test_feed_fan_out_runs_in_the_worker(self):
+        expense = Expense.objects.create(
+            name='Lunch', amount=2000, category='Food', paid_by=self.alice,
+            added_by=self.alice, split_method='equal', expense_date=date(2024, 5, 1),
+        )
+        log_activities('created', [(expense, [self.alice.id, self.bob.id])], self.alice)
+        self.assertFalse(FeedEntry.objects.exists())
+        task = Task.objects.get()
+        self.assertEqual(task.name, 'expenses.activity.fan_out_feed')
+        self.assertEqual(tasks.work('w1', burst=True), 1)
+        self.assertEqual(FeedEntry.objects.filter(actor_name='Alice').count(), 2)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts, task.locked_by), (Task.DONE, 1, ''))
+        # A retried fan-out does not duplicate the entries
+        tasks.enqueue(task.name, task.payload)
+        tasks.work('w1', burst=True)
+        self.assertEqual(FeedEntry.objects.count(), 2)
+
+    def test_claims_are_exclusive_until_the_lease_expires(self):
+        task = tasks.enqueue('expenses.tests.failing_task', {'message': 'boom'})
+        self.assertEqual(tasks.claim('w1').id, task.id)
+        self.assertIsNone(tasks.claim('w2'))
+        Task.objects.filter(id=task.id).update(locked_until=timezone.now() - timedelta(seconds=1))
+        reclaimed = tasks.claim('w2')
+        self.assertEqual((reclaimed.id, reclaimed.locked_by, reclaimed.attempts), (task.id, 'w2', 2))
+        # The first worker lost the task and cannot record an outcome for it
+        self.assertEqual(tasks._finish(task, 'w1', status=Task.DONE), 0)
+
+    def test_failures_retry_with_backoff_then_fail(self):
+        task = tasks.enqueue('expenses.tests.failing_task', {'message': 'boom'}, max_attempts=2)
+        with self.assertLogs('expenses.tasks', 'ERROR'):
+            self.assertEqual(tasks.execute(tasks.claim('w1'), 'w1'), 'retried')
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.QUEUED, 1))
+        self.assertIn('RuntimeError: boom', task.last_error)
+        self.assertGreater(task.run_after, timezone.now())
+        self.assertIsNone(tasks.claim('w1'))
+
+        Task.objects.filter(id=task.id).update(run_after=timezone.now())
+        with self.assertLogs('expenses.tasks', 'ERROR'):
+            self.assertEqual(tasks.execute(tasks.claim('w1'), 'w1'), 'failed')
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.FAILED, 2))
+        self.assertEqual(metrics.registry.counter_value('fairkeep_tasks_total', task=task.name, result='failed'), 1)
+
+    def test_run_worker_burst_drains_the_queue(self):
+        for _ in range(3):
+            tasks.enqueue('expenses.activity.fan_out_feed', {'activities': []})
+        out = StringIO()
+        call_command('run_worker', burst=True, stdout=out)
+        self.assertIn('Ran 3 tasks.', out.getvalue())
+        self.assertEqual(Task.objects.filter(status=Task.DONE).count(), 3)
+
+
+class ExportJobTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='testpass', first_name='Alice')
+        self.bob = User.objects.create_user(username='bob', password='testpass')
+        for day in range(1, 6):
+            self._expense(date(2024, 5, day))
+        self.client.login(username='alice', password='testpass')
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        overrides = override_settings(EXPORT_ROOT=tmp.name, EXPORT_CHUNK_SIZE=2)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def _expense(self, expense_date):
+        expense = Expense.objects.create(
+            name=f'Dinner {expense_date.day}', amount=3000, category='Food', paid_by=self.alice,
+            added_by=self.alice, split_method='equal', expense_date=expense_date,
+        )
+        ExpenseSplit.objects.create(expense=expense, user=self.alice, paid_amount=3000, owed_amount=1500)
+        ExpenseSplit.objects.create(expense=expense, user=self.bob, owed_amount=1500)
+        return expense
+
+    @staticmethod
+    def _rows(content):
+        # Without the trailing timestamp row
+        return content.splitlines()[:-1]
+
+    def test_job_file_matches_direct_export_and_supports_ranges(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/exports/', {'tz_offset': 180}, content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        job = self.client.get(f"/api/exports/{response.json()['id']}/").json()
+        self.assertEqual((job['status'], job['rows_written'], job['progress']), ('done', 5, 1.0))
+        download = self.client.get(job['download_url'])
+        self.assertEqual(download['Accept-Ranges'], 'bytes')
+        body = b''.join(download.streaming_content)
+        self.assertEqual(len(body), job['size'])
+        direct = self.client.get('/api/export-expenses/?tz_offset=180').content.decode()
+        self.assertEqual(self._rows(body.decode()), self._rows(direct))
+        self.assertIn('Dinner 5', self._rows(direct)[5])
+
+        partial = self.client.get(job['download_url'], HTTP_RANGE='bytes=10-')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial['Content-Range'], f"bytes 10-{len(body) - 1}/{len(body)}")
+        self.assertEqual(b''.join(partial.streaming_content), body[10:])
+        stale = self.client.get(job['download_url'], HTTP_RANGE='bytes=10-', HTTP_IF_RANGE='"other"')
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(self.client.get(job['download_url'], HTTP_RANGE=f'bytes={len(body)}-').status_code, 416)
+
+        self.client.login(username='bob', password='testpass')
+        self.assertEqual(self.client.get(job['download_url']).status_code, 404)
+
+    def test_unchanged_data_reuses_the_job(self):
+        first = self.client.post('/api/exports/', {}, content_type='application/json').json()
+        self.assertEqual(self.client.post('/api/exports/', {}, content_type='application/json').json()['id'], first['id'])
+        compressed = self.client.post('/api/exports/', {'compress': True}, content_type='application/json').json()
+        self.assertNotEqual(compressed['id'], first['id'])
+        self._expense(date(2024, 5, 6))
+        self.assertNotEqual(self.client.post('/api/exports/', {}, content_type='application/json').json()['id'], first['id'])
+
+    def test_eager_export_runs_after_the_job_commits(self):
+        with mock.patch('expenses.exports.write_csv', side_effect=OSError('disk full')):
+            with self.captureOnCommitCallbacks() as callbacks:
+                response = self.client.post('/api/exports/', {}, content_type='application/json')
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(len(callbacks), 1)
+            with self.assertLogs('expenses.tasks', 'ERROR'):
+                callbacks[0]()
+        failed = self.client.get(f"/api/exports/{response.json()['id']}/").json()
+        self.assertEqual((failed['status'], failed['error']), ('failed', 'disk full'))
+
+    @override_settings(TASKS_EAGER=False)
+    def test_worker_writes_gzipped_file_with_progress(self):
+        response = self.client.post('/api/exports/', {'compress': True}, content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertEqual((job['status'], job['rows_total'], job['download_url']), ('queued', 5, None))
+        self.assertEqual(self.client.get(f"/api/exports/{job['id']}/download/").status_code, 409)
+
+        progress = []
+        exports.write_csv(self.alice, StringIO(), timezone.now(), progress=progress.append)
+        self.assertEqual(progress, [2, 4])
+        tasks.work('w1', burst=True)
+        job = self.client.get(f"/api/exports/{job['id']}/").json()
+        self.assertEqual(job['status'], 'done')
+        self.assertTrue(job['filename'].endswith('.csv.gz'))
+        download = self.client.get(job['download_url'])
+        self.assertEqual(download['Content-Type'], 'application/gzip')
+        content = gzip.decompress(b''.join(download.streaming_content)).decode()
+        self.assertEqual(len(self._rows(content)), 1 + 5 + 2)
+
+        call_command('prune_exports', hours=0, stdout=StringIO())
+        self.assertFalse(ExportJob.objects.exists())
+        self.assertEqual(list(Path(settings.EXPORT_ROOT).iterdir()), [])
+
+    @override_settings(TASKS_EAGER=False, TASK_MAX_ATTEMPTS=2)
+    def test_job_fails_only_after_the_last_attempt(self):
+        job = self.client.post('/api/exports/', {}, content_type='application/json').json()
+        with mock.patch('expenses.exports.write_csv', side_effect=OSError('disk full')):
+            with self.assertLogs('expenses.tasks', 'ERROR'):
+                self.assertEqual(tasks.execute(tasks.claim('w1'), 'w1'), 'retried')
+            retrying = ExportJob.objects.get(id=job['id'])
+            self.assertEqual((retrying.status, retrying.error), (ExportJob.QUEUED, 'disk full'))
+            # The retrying job is still reused rather than duplicated
+            self.assertEqual(self.client.post('/api/exports/', {}, content_type='application/json').json()['id'], job['id'])
+
+            Task.objects.update(run_after=timezone.now())
+            with self.assertLogs('expenses.tasks', 'ERROR'):
+                self.assertEqual(tasks.execute(tasks.claim('w1'), 'w1'), 'failed')
+        failed = self.client.get(f"/api/exports/{job['id']}/").json()
+        self.assertEqual((failed['status'], failed['error']), ('failed', 'disk full'))
+        self.assertNotEqual(self.client.post('/api/exports/', {}, content_type='application/json').json()['id'], job['id'])
+
+
+@override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {
+    'contact_search.user': '2/min', 'login.ip': '2/min', 'settle_up.user': '1/hour',
+}})
+class ThrottleTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='testpass')
+        self.bob = User.objects.create_user(username='bob', password='testpass')
+        # Buckets outlive the test database; start and leave them empty
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_token_bucket_refills_at_the_rate(self):
+        self.client.force_login(self.alice)
+        throttled = metrics.registry.counter_value('fairkeep_throttled_total', scope='contact_search', kind='user')
+        for _ in range(2):
+            self.assertEqual(self.client.get('/api/contacts/search/?q=bo').status_code, 200)
+        response = self.client.get('/api/contacts/search/?q=bob')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(
+            metrics.registry.counter_value('fairkeep_throttled_total', scope='contact_search', kind='user'), throttled + 1,
+        )
+
+        # Buckets are per user
+        self.client.force_login(self.bob)
+        self.assertEqual(self.client.get('/api/contacts/search/?q=al').status_code, 200)
+        self.client.force_login(self.alice)
+        with mock.patch('expenses.throttling.time.time', return_value=throttling.time.time() + 30):
+            self.assertEqual(self.client.get('/api/contacts/search/?q=bob').status_code, 200)
+            self.assertEqual(self.client.get('/api/contacts/search/?q=bob').status_code, 429)
+
+    def test_racing_requests_cannot_spend_the_same_token(self):
+        request = AsyncRequestFactory().get('/api/contacts/search/?q=bo')
+        get = LocMemCache.get
+
+        def slow_get(self, *args, **kwargs):
+            value = get(self, *args, **kwargs)
+            time.sleep(0.01)
+            return value
+
+        with mock.patch.object(LocMemCache, 'get', slow_get), ThreadPoolExecutor(8) as pool:
+            waits = list(pool.map(lambda _: throttling.check(request, 'contact_search', self.alice.id), range(8)))
+        self.assertEqual(waits.count(0), 2)
+
+    @mock.patch('expenses.throttling.LOCK_ATTEMPTS', 2)
+    def test_busy_bucket_turns_requests_away(self):
+        self.client.force_login(self.alice)
+        cache.add(f'fairkeep:throttle:contact_search:user:{self.alice.id}:lock', 1)
+        response = self.client.get('/api/contacts/search/?q=bo')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+
+    @override_settings(PRODUCTION_PROFILE=True)
+    def test_production_warns_about_per_process_buckets(self):
+        with self.assertLogs('expenses.apps', 'WARNING'):
+            ExpensesConfig.warn_unshared_cache()
+
+    def test_settle_up_is_throttled(self):
+        self.client.force_login(self.alice)
+        self.client.post('/api/settle/', {'user_id': self.bob.id}, content_type='application/json')
+        response = self.client.post('/api/settle/', {'user_id': self.bob.id}, content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '3600')
+
+    def test_login_is_throttled_per_ip(self):
+        for username in ('alice', 'bob'):
+            response = self.client.post('/api/login/', {'username': username, 'password': 'wrong'},
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 401)
+        # Without trusted proxies a forged X-Forwarded-For does not change the IP
+        response = self.client.post('/api/login/', {'username': 'alice', 'password': 'testpass'},
+                                    content_type='application/json', REMOTE_ADDR='127.0.0.1',
+                                    HTTP_X_FORWARDED_FOR='203.0.113.7')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        response = self.client.post('/api/login/', {'username': 'alice', 'password': 'testpass'},
+                                    content_type='application/json', REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {
+        'login.user': '1/min', 'login.ip': '3/min',
+    }})
+    def test_denied_requests_spend_no_tokens(self):
+        request = AsyncRequestFactory().post('/api/login/', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(throttling.check(request, 'login', 'alice'), 0)
+        self.assertGreater(throttling.check(request, 'login', 'alice'), 0)
+        # The IP bucket kept the token the user bucket turned away
+        self.assertEqual(throttling.check(request, 'login', 'bob'), 0)
+        self.assertEqual(throttling.check(request, 'login', 'carol'), 0)
+        self.assertGreater(throttling.check(request, 'login', 'dave'), 0)
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'login.user': '1/min'}})
+    def test_failed_guesses_do_not_lock_the_account_out(self):
+        def login(password, ip):
+            return self.client.post('/api/login/', {'username': 'alice', 'password': password},
+                                    content_type='application/json', REMOTE_ADDR=ip).status_code
+
+        self.assertEqual(login('wrong', '203.0.113.7'), 401)
+        self.assertEqual(login('wrong', '203.0.113.7'), 429)
+        self.assertEqual(login('testpass', '10.0.0.2'), 200)
+
+    async def test_async_contact_search_shares_the_buckets(self):
+        await self.async_client.aforce_login(self.alice)
+        for _ in range(2):
+            self.assertEqual((await self.async_client.get('/api/contacts/search/?q=bo')).status_code, 200)
+        request = AsyncRequestFactory().get('/api/contacts/search/?q=bo')
+
+        async def auser():
+            return self.alice
+        request.auser = auser
+        response = await async_views.contact_search(request)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+
+
+class ExpenseSearchTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='testpass', first_name='Alicia')
+        self.bob = User.objects.create_user(username='bob', password='testpass', first_name='Bob')
+        self.carol = User.objects.create_user(username='carol', password='testpass')
+        ContactRequest.objects.create(from_user=self.alice, to_user=self.bob, status='accepted')
+        ContactRequest.objects.create(from_user=self.carol, to_user=self.bob, status='accepted')
+
+    def _create(self, user, other, name, expense_date, amount='30.00'):
+        self.client.force_login(user)
+        response = self.client.post('/api/expenses/', {
+            'name': name, 'amount': amount, 'category': 'Food', 'expense_date': expense_date,
+            'paid_by': user.id, 'split_method': 'equal', 'participants': [user.id, other.id],
+            'splits': [{'user': user.id}, {'user': other.id}],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def _search(self, user, q, **params):
+        self.client.force_login(user)
+        return self.client.get('/api/expenses/search/', {'q': q, **params}).json()
+
+    def _check_backend(self):
+        march = self._create(self.alice, self.bob, 'Supermercado Día', '2024-03-10')
+        self._create(self.alice, self.bob, 'Supermarket run', '2024-04-10', amount='1500.00')
+        self._create(self.carol, self.bob, 'Supermarket', '2024-03-12')
+
+        results = self._search(self.alice, 'supermercado marzo')['results']
+        self.assertEqual([r['id'] for r in results], [march])
+        self.assertEqual(len(self._search(self.alice, 'super')['results']), 2)
+        self.assertEqual(len(self._search(self.alice, '1500')['results']), 1)
+        self.assertEqual(len(self._search(self.bob, 'super')['results']), 3)
+        self.assertEqual(len(self._search(self.bob, 'alicia super')['results']), 2)
+        page = self._search(self.bob, 'super', page_size=2)
+        self.assertTrue(page['has_more'])
+
+        self.client.force_login(self.alice)
+        self.client.delete(f'/api/expenses/{march}/')
+        self.assertEqual(len(self._search(self.alice, 'super')['results']), 1)
+
+    def test_search_fts5(self):
+        if search.backend() != 'fts5':
+            self.skipTest("SQLite FTS5 not available")
+        self._check_backend()
+
+    @override_settings(SEARCH_BACKEND='tokens')
+    def test_search_token_table(self):
+        self._check_backend()
+        self.assertTrue(SearchToken.objects.filter(user=self.bob, token='supermarket').exists())
+
+    @override_settings(SEARCH_BACKEND='tokens')
+    def test_rebuild_search_index(self):
+        self._create(self.alice, self.bob, 'Taxi', '2024-03-10')
+        SearchToken.objects.all().delete()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(self._search(self.alice, 'taxi')['results']), 1)
+
+
+class ExpenseFilterTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='testpass')
+        self.bob = User.objects.create_user(username='bob', password='testpass')
+        for name, category, currency, payer, day in [
+            ('Rent', 'Periodic Expenses', 'ARS', self.alice, date(2024, 1, 1)),
+            ('Taxi', 'Transport', 'USD', self.bob, date(2024, 2, 10)),
+            ('Pizza', 'Food', 'ARS', self.bob, date(2024, 3, 5)),
+        ]:
+            expense = Expense.objects.create(
+                name=name, amount=1000, category=category, currency=currency, paid_by=payer,
+                added_by=payer, split_method='equal', expense_date=day,
+            )
+            ExpenseSplit.objects.create(expense=expense, user=self.alice, owed_amount=500)
+            ExpenseSplit.objects.create(expense=expense, user=self.bob, owed_amount=500)
+        self.client.login(username='alice', password='testpass')
+
+    def _names(self, response):
+        self.assertEqual(response.status_code, 200)
+        return sorted(e['name'] for e in response.json())
+
+    def test_filters_combine(self):
+        self.assertEqual(self._names(self.client.get('/api/expenses/', {'currency': 'ARS'})), ['Pizza', 'Rent'])
+        self.assertEqual(self._names(self.client.get('/api/expenses/', {
+            'date_from': '2024-02-01', 'paid_by': self.bob.id, 'category': 'Food,Transport',
+        })), ['Pizza', 'Taxi'])
+        self.assertEqual(self._names(self.client.get('/api/expenses/', {'date_to': '2024-01-31'})), ['Rent'])
+
+    def test_invalid_filter_is_rejected(self):
+        response = self.client.get('/api/expenses/', {'date_from': 'yesterday', 'currency': 'XXX'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'date_from', 'currency'})
+
+    async def test_async_list_applies_filters(self):
+        request = AsyncRequestFactory().get('/api/expenses/', {'currency': 'USD'})
+
+        async def auser():
+            return self.alice
+        request.auser = auser
+        response = await async_views.expense_list(request)
+        self.assertEqual([e['name'] for e in json.loads(response.content)], ['Taxi'])
+
+
+class SparseListTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='testpass')
+        self.bob = User.objects.create_user(username='bob', password='testpass')
+        self.carol = User.objects.create_user(username='carol', password='testpass')
+        self.dinner = Expense.objects.create(
+            name='Dinner', amount=3000, category='Food', paid_by=self.alice,
+            added_by=self.alice, split_method='equal', expense_date=date(2024, 3, 1),
+        )
+        for user in (self.alice, self.bob, self.carol):
+            ExpenseSplit.objects.create(expense=self.dinner, user=user, owed_amount=1000)
+        self.taxi = Expense.objects.create(
+            name='Taxi', amount=1250, category='Transport', paid_by=self.bob,
+            added_by=self.bob, split_method='equal', expense_date=date(2024, 3, 2),
+        )
+        ExpenseSplit.objects.create(expense=self.taxi, user=self.alice, owed_amount=625)
+        ExpenseSplit.objects.create(expense=self.taxi, user=self.bob, owed_amount=625)
+        self.client.login(username='alice', password='testpass')
+
+    def test_fields_subset(self):
+        response = self.client.get('/api/expenses/', {'fields': 'id,name,splits'})
+        self.assertEqual(response.status_code, 200)
+        by_name = {e['name']: e for e in response.json()}
+        self.assertEqual(set(by_name['Dinner']), {'id', 'name', 'splits'})
+        self.assertEqual(len(by_name['Dinner']['splits']), 3)
+
+    def test_compact_matches_full_serializer(self):
+        full = {e['id']: e for e in self.client.get('/api/expenses/').json()}
+        fields = 'id,name,amount,currency,expense_date,date,paid_by,added_by,group'
+        compact = self.client.get('/api/expenses/', {'fields': fields}).json()
+        for row in compact:
+            self.assertEqual(row, {name: full[row['id']][name] for name in fields.split(',')})
+
+    def test_compact_net_is_from_callers_side(self):
+        response = self.client.get('/api/expenses/', {'view': 'compact'})
+        self.assertEqual(response.status_code, 200)
+        net = {e['name']: e['net'] for e in response.json()}
+        self.assertEqual(net, {'Dinner': '20.00', 'Taxi': '-6.25'})
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/api/expenses/', {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_async_list_supports_fields(self):
+        request = AsyncRequestFactory().get('/api/expenses/', {'fields': 'name,net'})
+
+        async def auser():
+            return self.alice
+        request.auser = auser
+        response = await async_views.expense_list(request)
+        self.assertEqual(json.loads(response.content), [
+            {'name': 'Taxi', 'net': '-6.25'}, {'name': 'Dinner', 'net': '20.00'},
+        ])
+
+
+class RenderingTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='testpass')
+        for i in range(30):
+            expense = Expense.objects.create(
+                name=f'Groceries {i}', amount=1010, category='Food', paid_by=self.alice,
+                added_by=self.alice, split_method='equal', expense_date=date(2024, 3, 1),
+            )
+            ExpenseSplit.objects.create(expense=expense, user=self.alice, owed_amount=1010)
+        self.client.login(username='alice', password='testpass')
+
+    def test_decimals_and_dates_render_without_floats(self):
+        data = {'amount': Decimal('0.10'), 'day': date(2024, 3, 1)}
+        expected = b'{"amount":"0.10","day":"2024-03-01"}'
+        self.assertEqual(renderers.FastJSONRenderer().render(data), expected)
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(renderers.FastJSONRenderer().render(data), expected)
+
+    def test_large_response_is_gzipped_when_accepted(self):
+        plain = self.client.get('/api/expenses/')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+        response = self.client.get('/api/expenses/', HTTP_ACCEPT_ENCODING='gzip;q=1.0, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertLess(len(response.content), len(plain.content))
+        self.assertEqual(json.loads(gzip.decompress(response.content)), plain.json())
+
+    def test_html_with_csrf_tokens_is_not_compressed(self):
+        self.alice.is_staff = self.alice.is_superuser = True
+        self.alice.save()
+        response = self.client.get('/admin/expenses/expense/', {'q': 'Dinner'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_small_response_is_not_compressed(self):
+        response = self.client.get('/api/expenses/', {'fields': 'id', 'amount_min': '100'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+
+
+class MinorUnitTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='testpass')
+        self.bob = User.objects.create_user(username='bob', password='testpass')
+        self.carol = User.objects.create_user(username='carol', password='testpass')
+        for a, b in combinations([self.alice, self.bob, self.carol], 2):
+            ContactRequest.objects.create(from_user=a, to_user=b, status='accepted')
+        self.client.login(username='alice', password='testpass')
+
+    def _create(self, amount, currency, split_method='equal'):
+        users = [self.alice, self.bob, self.carol]
+        return self.client.post('/api/expenses/', {
+            'name': 'Dinner', 'amount': amount, 'category': 'Food', 'currency': currency,
+            'expense_date': '2024-05-01', 'paid_by': self.alice.id, 'split_method': split_method,
+            'participants': [u.id for u in users], 'splits': [{'user': u.id} for u in users],
+        }, content_type='application/json')
+
+    def test_allocate_is_exact(self):
+        self.assertEqual(money.allocate(1000, [1, 1, 1]), [334, 333, 333])
+        self.assertEqual(sum(money.allocate(99999, [Decimal('12.5'), 3, 7])), 99999)
+
+    def test_equal_split_adds_up_to_the_total(self):
+        response = self._create('10.00', 'USD')
+        self.assertEqual(response.status_code, 201, response.content)
+        expense = Expense.objects.get()
+        self.assertEqual(expense.amount, 1000)
+        self.assertEqual(sorted(s.owed_amount for s in expense.expensesplit_set.all()), [333, 333, 334])
+        self.assertEqual(response.json()['amount'], '10.00')
+
+    def test_zero_decimal_currency(self):
+        self.assertEqual(self._create('1500.50', 'JPY').status_code, 400)
+        response = self._create('1500', 'JPY')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(Expense.objects.get().amount, 1500)
+        self.assertEqual(response.json()['amount'], '1500')
+        self.assertEqual({s['owed_amount'] for s in response.json()['splits']}, {'500'})
+
+    def test_amounts_past_the_maximum_are_rejected(self):
+        response = self._create('1e20', 'USD')
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assertIn('amount', response.json())
+        self.assertEqual(self._create(str(money.MAX_AMOUNT), 'USD').status_code, 201)
+        response = self.client.post('/api/expenses/', {
+            'name': 'Dinner', 'amount': '10.00', 'category': 'Food', 'currency': 'USD',
+            'expense_date': '2024-05-01', 'paid_by': self.alice.id, 'split_method': 'manual',
+            'participants': [self.alice.id, self.bob.id],
+            'splits': [{'user': self.alice.id, 'owed_amount': '1e20'}, {'user': self.bob.id, 'owed_amount': '0'}],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400, response.content)
+
+    def test_amount_filter_scales_per_currency(self):
+        self._create('15.00', 'USD')
+        self._create('1500', 'JPY')
+        response = self.client.get('/api/expenses/', {'amount_min': '20', 'fields': 'currency'})
+        self.assertEqual(response.json(), [{'currency': 'JPY'}])
+
+
+class MinorUnitMigrationTests(TransactionTestCase):
+    before = [('expenses', '0021_list_filter_indexes')]
+    after = [('expenses', '0022_minor_units')]
+
+    def _migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_zero_decimal_splits_still_add_up(self):
+        apps = self._migrate(self.before)
+        OldUser = apps.get_model('auth', 'User')
+        users = [OldUser.objects.create(username=name) for name in ('alice', 'bob', 'carol')]
+        expense = apps.get_model('expenses', 'Expense').objects.create(
+            name='Dinner', amount=Decimal('1000'), category='Food', currency='JPY',
+            added_by=users[0], paid_by=users[0], split_method='equal',
+        )
+        for user in users:
+            apps.get_model('expenses', 'ExpenseSplit').objects.create(
+                expense=expense, user=user, owed_amount=Decimal('333.33'),
+                paid_amount=Decimal('1000') if user == users[0] else 0,
+            )
+
+        apps = self._migrate(self.after)
+        splits = apps.get_model('expenses', 'ExpenseSplit').objects.filter(expense_id=expense.pk).order_by('pk')
+        self.assertEqual([s.owed_amount for s in splits], [334, 333, 333])
+        self.assertEqual([s.paid_amount for s in splits], [1000, 0, 0])
+
+
+class SyncTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='testpass')
+        self.bob = User.objects.create_user(username='bob', password='testpass')
+        self.carol = User.objects.create_user(username='carol', password='testpass')
+        for a, b in combinations([self.alice, self.bob, self.carol], 2):
+            ContactRequest.objects.create(from_user=a, to_user=b, status='accepted')
+        self.client.login(username='alice', password='testpass')
+
+    def _expense(self, name, users, **overrides):
+        payload = {
+            'name': name, 'amount': '30.00', 'category': 'Food', 'currency': 'USD',
+            'expense_date': '2024-05-01', 'paid_by': self.alice.id, 'split_method': 'equal',
+            'participants': [u.id for u in users], 'splits': [{'user': u.id} for u in users],
+        }
+        payload.update(overrides)
+        return payload
+
+    def _create(self, name, users):
+        response = self.client.post('/api/expenses/', self._expense(name, users), content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()['id']
+
+    def _sync(self, since=None, client=None):
+        params = {'since': since} if since is not None else {}
+        response = (client or self.client).get('/api/sync/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_first_sync_is_a_full_snapshot(self):
+        expense_id = self._create('Lunch', [self.alice, self.bob])
+        data = self._sync()
+        self.assertTrue(data['reset'])
+        self.assertEqual([e['id'] for e in data['expenses']], [expense_id])
+        self.assertIsNone(data['balance_users'])
+        self.assertEqual(data['balances'], self.client.get('/api/balances/').json())
+
+    def test_delta_has_changes_tombstones_and_moved_balances(self):
+        kept = self._create('Lunch', [self.alice, self.bob])
+        gone = self._create('Taxi', [self.alice, self.bob])
+        token = self._sync()['token']
+        self.assertEqual(self._sync(token)['expenses'], [])
+
+        self._create('Cinema', [self.alice, self.carol])
+        self.client.put(
+            f'/api/expenses/{kept}/', self._expense('Brunch', [self.alice, self.bob]), content_type='application/json',
+        )
+        self.client.delete(f'/api/expenses/{gone}/')
+        data = self._sync(token)
+        self.assertFalse(data['reset'])
+        self.assertEqual({e['name'] for e in data['expenses']}, {'Brunch', 'Cinema'})
+        self.assertEqual(data['deleted'], [gone])
+        self.assertEqual(data['balance_users'], sorted([self.bob.id, self.carol.id]))
+        full = {row['user_id']: row for row in self.client.get('/api/balances/').json()}
+        self.assertEqual({row['user_id']: row for row in data['balances']}, full)
+        self.assertEqual(self._sync(data['token'])['expenses'], [])
+
+    def test_users_taken_off_an_expense_get_a_tombstone(self):
+        expense_id = self._create('Lunch', [self.alice, self.bob])
+        bob = Client()
+        bob.login(username='bob', password='testpass')
+        token = self._sync(client=bob)['token']
+        self.client.put(
+            f'/api/expenses/{expense_id}/', self._expense('Lunch', [self.alice, self.carol]),
+            content_type='application/json',
+        )
+        data = self._sync(token, client=bob)
+        self.assertEqual((data['expenses'], data['deleted']), ([], [expense_id]))
+
+    @override_settings(SYNC_MAX_CHANGES=1)
+    def test_has_more_pages_through_changes(self):
+        token = self._sync()['token']
+        first, second = self._create('Lunch', [self.alice, self.bob]), self._create('Taxi', [self.alice, self.bob])
+        page = self._sync(token)
+        self.assertTrue(page['has_more'])
+        self.assertEqual([e['id'] for e in page['expenses']], [first])
+        page = self._sync(page['token'])
+        self.assertFalse(page['has_more'])
+        self.assertEqual([e['id'] for e in page['expenses']], [second])
+
+    def test_pruned_token_resets(self):
+        self._create('Lunch', [self.alice, self.bob])
+        token = self._sync()['token']
+        self._create('Taxi', [self.alice, self.bob])
+        self._create('Cinema', [self.alice, self.bob])
+        ChangeEvent.objects.filter(id__lte=int(token) + 1).delete()
+        self.assertTrue(self._sync(token)['reset'])
+        self.assertEqual(self.client.get('/api/sync/', {'since': 'abc'}).status_code, 400)
+
+
+@skipUnless(connection.vendor == 'postgresql', "SQLite commits in id order with its single writer")
+class EventOrderTests(TransactionTestCase):
+    def test_later_events_wait_for_earlier_ones_to_commit(self):
+        alice = User.objects.create_user(username='alice', password='testpass')
+        first_emitted, release, second_done = threading.Event(), threading.Event(), threading.Event()
+
+        def slow_writer():
+            with transaction.atomic():
+                events.emit('expense_created', [alice.id], {'expense': 1})
+                first_emitted.set()
+                release.wait(5)
+            connection.close()
+
+        def fast_writer():
+            events.emit('expense_created', [alice.id], {'expense': 2})
+            second_done.set()
+            connection.close()
+
+        slow = threading.Thread(target=slow_writer)
+        slow.start()
+        first_emitted.wait(5)
+        fast = threading.Thread(target=fast_writer)
+        fast.start()
+        # The later writer cannot take an id, let alone commit, before the earlier one
+        self.assertFalse(second_done.wait(0.5))
+        self.assertEqual(events.visible_ceiling(), 0)
+        release.set()
+        slow.join()
+        fast.join()
+        ordered = ChangeEvent.objects.order_by('id').values_list('payload__expense', flat=True)
+        self.assertEqual(list(ordered), [1, 2])
+
+
+class RenderCacheTests(TestCase):
+    def setUp(self):
+        caches[settings.RENDER_CACHE_ALIAS].clear()
+        self.alice = User.objects.create_user(username='alice', password='testpass')
+        self.bob = User.objects.create_user(username='bob', password='testpass')
+        ContactRequest.objects.create(from_user=self.alice, to_user=self.bob, status='accepted')
+        self.client.login(username='alice', password='testpass')
+        for name in ('Lunch', 'Taxi', 'Cinema'):
+            response = self.client.post('/api/expenses/', {
+                'name': name, 'amount': '30.00', 'category': 'Food', 'currency': 'USD',
+                'expense_date': '2024-05-01', 'paid_by': self.alice.id, 'split_method': 'equal',
+                'participants': [self.alice.id, self.bob.id], 'splits': [{'user': self.alice.id}, {'user': self.bob.id}],
+            }, content_type='application/json')
+            self.assertEqual(response.status_code, 201, response.content)
+
+    def _hits(self):
+        return (
+            metrics.registry.counter_value('fairkeep_render_cache_total', result='hit'),
+            metrics.registry.counter_value('fairkeep_render_cache_total', result='miss'),
+        )
+
+    def test_lists_reuse_fragments_and_match_the_serializer(self):
+        expected = ExpenseSerializer(Expense.objects.order_by('-date'), many=True).data
+        hits, misses = self._hits()
+        with CaptureQueriesContext(connection) as cold:
+            first = self.client.get('/api/expenses/').json()
+        with CaptureQueriesContext(connection) as warm:
+            second = self.client.get('/api/expenses/').json()
+        self.assertEqual(first, json.loads(json.dumps(expected)))
+        self.assertEqual(second, first)
+        self.assertEqual(self._hits(), (hits + 3, misses + 3))
+        self.assertLess(len(warm), len(cold))
+
+    def test_saved_expense_and_renamed_user_are_fresh(self):
+        self.client.get('/api/expenses/')
+        lunch = Expense.objects.get(name='Lunch')
+        lunch.name = 'Brunch'
+        lunch.save()
+        self.alice.first_name = 'Alice'
+        self.alice.save()
+        hits, misses = self._hits()
+        data = self.client.get('/api/expenses/').json()
+        self.assertEqual({e['name'] for e in data}, {'Brunch', 'Taxi', 'Cinema'})
+        self.assertEqual({e['added_by_display'] for e in data}, {'Alice'})
+        self.assertEqual(self._hits(), (hits + 2, misses + 1))
+
+    def test_per_caller_net_is_not_cached(self):
+        params = {'fields': 'id,splits,net'}
+        mine = self.client.get('/api/expenses/', params).json()
+        self.client.login(username='bob', password='testpass')
+        theirs = self.client.get('/api/expenses/', params).json()
+        self.assertEqual({e['net'] for e in mine}, {'15.00'})
+        self.assertEqual({e['net'] for e in theirs}, {'-15.00'})
+        self.assertEqual([e['splits'] for e in mine], [e['splits'] for e in theirs])
+
+
+@override_settings(DB_REPLICAS=['default'])
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='alice', password='testpass')
+        self.bob = User.objects.create_user(username='bob', password='testpass')
+        ContactRequest.objects.create(from_user=self.alice, to_user=self.bob, status='accepted')
+        self.client.login(username='alice', password='testpass')
+
+    def _reads_replica(self, path):
+        with mock.patch('expenses.routing.choose_replica', return_value='default') as choose:
+            self.assertEqual(self.client.get(path).status_code, 200)
+        return choose.called
+
+    def test_read_only_endpoints_use_replicas(self):
+        for path in ('/api/balances/', '/api/activities/', '/api/expenses/', '/api/expenses/search/?q=x',
+                     '/api/export-expenses/'):
+            self.assertTrue(self._reads_replica(path), path)
+        self.assertFalse(self._reads_replica('/api/contacts/'))
+        self.assertFalse(self._reads_replica('/api/sync/'))
+        self.assertIsNone(routing.ReplicaRouter().db_for_read(Expense))
+        self.assertEqual(routing.ReplicaRouter().db_for_write(Expense), 'default')
+
+    def test_a_request_reads_from_one_replica(self):
+        with mock.patch('expenses.routing.choose_replica', return_value='default') as choose:
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.client.get('/api/expenses/').status_code, 200)
+        self.assertGreater(len(ctx.captured_queries), 1)
+        self.assertEqual(choose.call_count, 1)
+
+    def test_writers_read_from_primary_for_the_sticky_window(self):
+        with mock.patch('expenses.routing.choose_replica', return_value='default') as choose:
+            response = self.client.post('/api/expenses/', {
+                'name': 'Lunch', 'amount': '30.00', 'category': 'Food', 'currency': 'USD',
+                'expense_date': '2024-05-01', 'paid_by': self.alice.id, 'split_method': 'equal',
+                'participants': [self.alice.id, self.bob.id], 'splits': [{'user': self.alice.id}, {'user': self.bob.id}],
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertFalse(choose.called)
+        self.assertFalse(self._reads_replica('/api/balances/'))
+        self.client.login(username='bob', password='testpass')
+        self.assertTrue(self._reads_replica('/api/balances/'))
+        cache.delete(f'fairkeep:db:sticky:{self.alice.id}')
+        self.client.login(username='alice', password='testpass')
+        self.assertTrue(self._reads_replica('/api/balances/'))
+
+    def test_replicas_require_a_shared_cache(self):
+        env = {**os.environ, 'DJANGO_DB_REPLICAS': 'replica.sqlite3'}
+        env.pop('DJANGO_CACHE_BACKEND', None)
+        load = [sys.executable, '-c', 'import fairkeep.settings']
+        cwd = Path(__file__).resolve().parent.parent
+        result = subprocess.run(load, cwd=cwd, env=env, capture_output=True, text=True)
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn('ImproperlyConfigured', result.stderr)
+        env['DJANGO_CACHE_BACKEND'] = 'db'
+        subprocess.run(load, cwd=cwd, env=env, capture_output=True, check=True)
+
+
+class PostgresConnectionSettingsTests(TestCase):
+    def _conn_max_age(self, **env):
+        env = {**os.environ, 'POSTGRES_DB': 'fairkeep', 'DJANGO_PROFILE': 'production', 'DJANGO_DB_POOL': 'false', **env}
+        env.pop('DJANGO_CONN_MAX_AGE', None)
+        load = [sys.executable, '-c', "import fairkeep.settings as s; print(s.DATABASES['default']['CONN_MAX_AGE'])"]
+        cwd = Path(__file__).resolve().parent.parent
+        return int(subprocess.run(load, cwd=cwd, env=env, capture_output=True, text=True, check=True).stdout)
+
+    def test_persistent_connections_only_for_sync_workers(self):
+        self.assertEqual(self._conn_max_age(GUNICORN_WORKER_CLASS='uvicorn_worker.UvicornWorker'), 0)
+        self.assertEqual(self._conn_max_age(GUNICORN_WORKER_CLASS='gthread'), 600)
+
+
+class SQLiteProductionProfileTests(TestCase):
+    def test_connections_use_wal_and_immediate_transactions(self):
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+        options = getattr(settings, 'SQLITE_PRODUCTION_OPTIONS', None)
+        if options is None:
+            self.skipTest("Not running on SQLite")
+        with tempfile.TemporaryDirectory() as tmp:
+            db = DatabaseWrapper({
+                **connection.settings_dict, 'NAME': str(Path(tmp) / 'profile.sqlite3'), 'OPTIONS': options,
+            }, alias='sqlite_profile')
+            try:
+                with db.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'wal')
+                    cursor.execute('PRAGMA synchronous')
+                    self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+                self.assertEqual(db.transaction_mode, 'IMMEDIATE')
+                self.assertEqual(db.get_connection_params()['timeout'], options['timeout'])
+            finally:
+                db.close()
+
+
+class LargeTableAdminTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='testpass')
+        self.bob = User.objects.create_user(username='bob', password='testpass')
+        self.client.login(username='admin', password='testpass')
+
+    def _expenses(self, count, category='Food'):
+        expenses = []
+        for i in range(count):
+            expense = Expense.objects.create(
+                name=f'Expense {i}', amount=1000, category=category, paid_by=self.admin,
+                added_by=self.admin, split_method='equal', expense_date=date(2024, 5, 1),
+            )
+            ExpenseSplit.objects.create(expense=expense, user=self.bob, owed_amount=500)
+            expenses.append(expense)
+        return expenses
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=3)
+    def test_paginator_stops_counting_at_the_limit(self):
+        from expenses.admin import EstimatedCountPaginator
+        self._expenses(5)
+        self.assertGreaterEqual(EstimatedCountPaginator(Expense.objects.order_by('pk'), 2).count, 5)
+        self.assertEqual(EstimatedCountPaginator(Expense.objects.filter(category='Food').order_by('pk'), 2).count, 4)
+        self.assertEqual(EstimatedCountPaginator(Expense.objects.filter(name='Expense 1').order_by('pk'), 2).count, 1)
+
+    def test_split_changelist_queries_do_not_grow_with_rows(self):
+        self._expenses(2)
+        with CaptureQueriesContext(connection) as few:
+            self.assertEqual(self.client.get('/admin/expenses/expensesplit/').status_code, 200)
+        self._expenses(8)
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(self.client.get('/admin/expenses/expensesplit/').status_code, 200)
+        self.assertEqual(len(many), len(few))
+
+    @override_settings(ADMIN_BULK_BATCH_SIZE=2)
+    def test_recategorize_action_batches_and_logs(self):
+        expenses = self._expenses(5)
+        self._expenses(1, category='Health')
+        self.assertContains(self.client.get('/admin/expenses/expense/'), 'name="category"')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/admin/expenses/expense/', {
+                'action': 'recategorize_selected', 'category': 'Transport',
+                '_selected_action': [e.id for e in expenses[:4]],
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Expense.objects.filter(category='Transport').count(), 4)
+        self.assertEqual(Expense.objects.filter(category='Food').count(), 1)
+        self.assertEqual(Activity.objects.filter(action='updated').count(), 4)
+        self.assertEqual(FeedEntry.objects.filter(user=self.bob, action='updated').count(), 4)
+        self.assertEqual(sorted(search.search(self.bob, 'transport')), sorted(e.id for e in expenses[:4]))
+
+
+class StartupImportTests(TestCase):
+    """
+    A production worker boot must not import dev-only or lazily loaded modules.
+    The import-time budget itself is measured by benchmarks/bench_worker_startup.py.
+    """
+    DEV_ONLY = ('django_extensions', 'werkzeug', 'OpenSSL', 'cProfile', 'pstats')
+    BOOT = (
+        "import sys; "
+        "from fairkeep.wsgi import application; "
+        "from django.urls import get_resolver; get_resolver().url_patterns; "
+        "print(' '.join(sys.modules))"
+    )
+
+    def test_production_boot_skips_dev_modules(self):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'fairkeep.settings', 'DJANGO_DEBUG': 'False'}
+        env.pop('DJANGO_DEV_APPS', None)
+        result = subprocess.run(
+            [sys.executable, '-c', self.BOOT],
+            cwd=Path(__file__).resolve().parent.parent, env=env, capture_output=True, text=True, check=True,
+        )
+        imported_dev = [name for name in result.stdout.split() if name.split('.')[0] in self.DEV_ONLY]
+        self.assertEqual(imported_dev, [])
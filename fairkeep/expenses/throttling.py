@@ -0,0 +1,205 @@
+"""
+Token-bucket throttles for expensive or abuse-prone endpoints.
+
+REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] gives each scope a per-user
+("<scope>.user") and/or per-IP ("<scope>.ip") rate "N/period". A bucket holds
+up to N tokens and refills at N per period; each request takes one. Clients
+can therefore burst N requests, then sustain the rate. The IP is DRF's
+client ident: REMOTE_ADDR, or with NUM_PROXIES > 0 the address that many
+hops back in X-Forwarded-For.
+
+Buckets live in the default cache. It must be shared between workers
+(redis/memcached) for a limit to hold across them; the production profile
+logs a warning at startup when it is not (expenses/apps.py). A request
+takes a token from all of its buckets or from none: they are read and written
+under short locks taken with cache.add(), which is atomic on every backend
+but `file`, so racing requests cannot spend the same token, and a request
+the user bucket turns away does not spend the IP's. A denied request gets 429
+with Retry-After and is counted as fairkeep_throttled_total.
+"""
+import asyncio
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from . import metrics
+from .renderers import FastJsonResponse as JsonResponse
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+# A bucket's lock is held for one cache read and write; a holder that died
+# releases it after LOCK_TIMEOUT
+LOCK_TIMEOUT = 1
+LOCK_ATTEMPTS = 20
+LOCK_RETRY_SECONDS = 0.005
+
+
+def parse_rate(rate):
+    """(capacity, tokens per second) for "N/period", e.g. "30/min"."""
+    count, period = rate.split('/')
+    return int(count), int(count) / PERIODS[period[0]]
+
+
+def client_ip(request):
+    """The client IP the `ip` buckets are keyed on."""
+    return BaseThrottle().get_ident(request)
+
+
+def _buckets(request, scope, user_key):
+    """(kind, cache key, rate) of the buckets that apply to `request`, IP first."""
+    rates = api_settings.DEFAULT_THROTTLE_RATES or {}
+    idents = [('ip', client_ip(request)), ('user', user_key)]
+    return [
+        (kind, f"fairkeep:throttle:{scope}:{kind}:{ident}", rates[f"{scope}.{kind}"])
+        for kind, ident in idents
+        if ident is not None and rates.get(f"{scope}.{kind}")
+    ]
+
+
+def _take(state, rate, now):
+    """(new state, 0) when a token is available, else (None, seconds until one is)."""
+    capacity, per_second = parse_rate(rate)
+    tokens, stamp = state or (capacity, now)
+    tokens = min(capacity, tokens + (now - stamp) * per_second)
+    if tokens < 1:
+        return None, (1 - tokens) / per_second
+    return (tokens - 1, now), 0
+
+
+def _timeout(rate):
+    # Once a bucket would be full again it can be forgotten
+    capacity, per_second = parse_rate(rate)
+    return math.ceil(capacity / per_second)
+
+
+def _denied(scope, kind, wait):
+    metrics.registry.increment('fairkeep_throttled_total', scope=scope, kind=kind)
+    return wait
+
+
+def _lock(key):
+    for _ in range(LOCK_ATTEMPTS):
+        if cache.add(f"{key}:lock", 1, timeout=LOCK_TIMEOUT):
+            return True
+        time.sleep(LOCK_RETRY_SECONDS)
+    return False
+
+
+async def _alock(key):
+    for _ in range(LOCK_ATTEMPTS):
+        if await cache.aadd(f"{key}:lock", 1, timeout=LOCK_TIMEOUT):
+            return True
+        await asyncio.sleep(LOCK_RETRY_SECONDS)
+    return False
+
+
+def _take_all(buckets, states):
+    """
+    (new states by key, None) when every bucket has a token, else
+    (None, (kind, seconds to wait)) for the first one that has none.
+    """
+    now = time.time()
+    taken = {}
+    for kind, key, rate in buckets:
+        state, wait = _take(states.get(key), rate, now)
+        if state is None:
+            return None, (kind, wait)
+        taken[key] = state
+    return taken, None
+
+
+def _spend(buckets):
+    """
+    Take a token from every bucket in `buckets`, or from none, under their
+    locks (taken in order). Returns (kind, seconds to wait) of the bucket
+    that denied the request, or None when it is allowed.
+    """
+    locked = []
+    try:
+        for kind, key, _rate in buckets:
+            if not _lock(key):
+                # Requests for this bucket keep queueing up: turn this one away briefly
+                return kind, LOCK_TIMEOUT
+            locked.append(key)
+        taken, denied = _take_all(buckets, cache.get_many(locked))
+        if taken:
+            for _kind, key, rate in buckets:
+                cache.set(key, taken[key], timeout=_timeout(rate))
+        return denied
+    finally:
+        cache.delete_many([f"{key}:lock" for key in locked])
+
+
+async def _aspend(buckets):
+    """Async variant of _spend()."""
+    locked = []
+    try:
+        for kind, key, _rate in buckets:
+            if not await _alock(key):
+                return kind, LOCK_TIMEOUT
+            locked.append(key)
+        taken, denied = _take_all(buckets, await cache.aget_many(locked))
+        if taken:
+            for _kind, key, rate in buckets:
+                await cache.aset(key, taken[key], timeout=_timeout(rate))
+        return denied
+    finally:
+        await cache.adelete_many([f"{key}:lock" for key in locked])
+
+
+def check(request, scope, user_key=None):
+    """
+    Take a token from each of `request`'s buckets for `scope`; `user_key`
+    identifies the user (their id, or e.g. the username tried at login).
+    Returns 0 when allowed, else the seconds to wait.
+    """
+    if not settings.THROTTLE_ENABLED:
+        return 0
+    denied = _spend(_buckets(request, scope, user_key))
+    return _denied(scope, *denied) if denied else 0
+
+
+async def acheck(request, scope, user_key=None):
+    """Async variant of check()."""
+    if not settings.THROTTLE_ENABLED:
+        return 0
+    denied = await _aspend(_buckets(request, scope, user_key))
+    return _denied(scope, *denied) if denied else 0
+
+
+def throttled_response(wait):
+    """429 for views outside DRF, matching DRF's Throttled response."""
+    seconds = math.ceil(wait)
+    response = JsonResponse(
+        {"detail": f"Request was throttled. Expected available in {seconds} seconds."}, status=429,
+    )
+    response['Retry-After'] = str(seconds)
+    return response
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Throttles a DRF view by check(); subclasses set `scope`."""
+    scope = None
+
+    def allow_request(self, request, view):
+        user = request.user
+        self.wait_seconds = check(request, self.scope, user.id if user.is_authenticated else None)
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class ContactSearchThrottle(TokenBucketThrottle):
+    scope = 'contact_search'
+
+
+class ExportThrottle(TokenBucketThrottle):
+    scope = 'export'
+
+
+class SettleUpThrottle(TokenBucketThrottle):
+    scope = 'settle_up'
@@ -1,25 +1,54 @@
 from django.db import transaction, models
 from django.db.models.functions import Concat
 from django.db.models import Value
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth import authenticate, login, logout
+from django.contrib.auth import authenticate, login, logout, update_session_auth_hash, SESSION_KEY
+from django.contrib.auth.views import redirect_to_login
 from django.contrib.auth.models import User
 from decimal import Decimal
-from datetime import timedelta
 from django.utils import timezone
 import json
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.middleware.csrf import get_token
 from rest_framework import viewsets, serializers, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes, action
 from rest_framework.exceptions import ValidationError
 from django.views.decorators.csrf import csrf_protect, ensure_csrf_cookie
-from .models import Expense, ExpenseSplit, Activity, ContactRequest, UserAvatar
-from .serializers import ExpenseSerializer, ActivitySerializer, ContactRequestSerializer, UserPublicSerializer
-import csv
+from django.utils.decorators import method_decorator
+from .models import (
+    Expense,
+    ExpenseSplit,
+    Activity,
+    ContactRequest,
+    UserAvatar,
+    ExpenseGroup,
+    RecurringExpense,
+    ExportJob,
+    FeedEntry,
+)
+from .serializers import (
+    ExpenseSerializer,
+    CompactExpenseSerializer,
+    FeedEntrySerializer,
+    ContactRequestSerializer,
+    UserPublicSerializer,
+    ExpenseGroupSerializer,
+    ExpenseBulkItemSerializer,
+    RecurringExpenseSerializer,
+    ExportJobSerializer,
+)
+from .recurring import schedule
+from .debts import simplify_group
+from .filters import ExpenseFilterBackend
+from . import checkpoints, events, exports, metrics, money, render_cache, search, tasks, throttling
+from . import sync as sync_changes
+from .activity import log_activity, log_activities
+from .routing import replica_reads
+from .throttling import ContactSearchThrottle, ExportThrottle, SettleUpThrottle
 
 # User detail (GET/PATCH) for profile updates
 @api_view(['GET', 'PATCH'])
@@ -54,6 +83,7 @@ def user_detail(request, user_id):
         if len(display_parts) >= 2 and not user.last_name:
             user.last_name = " ".join(display_parts[1:])
     user.save()
+    _store_session_profile(request, user)
 
     return Response({
         "id": user.id,
@@ -84,83 +114,104 @@ def change_password(request):
 
     user.set_password(new1)
     user.save()
+    update_session_auth_hash(request, user)
     return Response({"detail": "Password updated successfully."})
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([ExportThrottle])
+@replica_reads
 def export_expenses(request):
     user = request.user
-    expenses = Expense.objects.filter(
-        models.Q(participants=user)
-        | models.Q(added_by=user)
-        | models.Q(paid_by=user)
-        | models.Q(expensesplit__user=user)
-    ).distinct().order_by('expense_date', 'date', 'id').prefetch_related('expensesplit_set__user', 'paid_by', 'added_by')
-
-    # collect involved users
-    user_ids = {user.id}
-    for exp in expenses:
-        for s in exp.expensesplit_set.all():
-            user_ids.add(s.user_id)
-        user_ids.add(exp.added_by_id)
-        user_ids.add(exp.paid_by_id)
-    users_map = {u.id: u for u in User.objects.filter(id__in=user_ids)}
-
-    def display_name(u):
-        full = u.get_full_name()
-        return full if full else u.username
-
-    other_ids = sorted([uid for uid in user_ids if uid != user.id], key=lambda uid: display_name(users_map[uid]).lower())
-    ordered_user_ids = [user.id] + other_ids
-    ordered_user_names = [display_name(users_map[uid]) for uid in ordered_user_ids]
-
-    tz_offset = 0
-    try:
-        tz_offset = int(request.GET.get("tz_offset", "0"))
-    except ValueError:
-        tz_offset = 0
-    now_utc = timezone.now()
-    # getTimezoneOffset is minutes to add to local to get UTC, so local = UTC - offset
-    now_ts = now_utc - timedelta(minutes=tz_offset)
+    now_ts = exports.local_now(_tz_offset(request))
     response = HttpResponse(content_type='text/csv')
-    filename = f"{user.username}_{now_ts.strftime('%Y-%m-%dT%H-%M-%S')}.csv"
-    response['Content-Disposition'] = f'attachment; filename=\"{filename}\"'
-    writer = csv.writer(response)
-    header = ["Date", "Description", "Category", "Amount", "Currency", "CreatedBy", "PaidBy", "SplitMethod", "SplitOptions"] + ordered_user_names
-    writer.writerow(header)
-
-    for exp in expenses:
-        splits = list(exp.expensesplit_set.all())
-        net_by_user = {}
-        for s in splits:
-            net_by_user[s.user_id] = net_by_user.get(s.user_id, 0) + float(s.paid_amount) - float(s.owed_amount)
-
-        split_options = {}
-        if exp.split_method != 'equal':
-            for s in splits:
-                split_options[display_name(s.user)] = float(s.owed_amount)
-
-        row = [
-            exp.expense_date.isoformat(),
-            exp.name,
-            exp.category,
-            float(exp.amount),
-            exp.currency,
-            display_name(exp.added_by),
-            display_name(exp.paid_by),
-            exp.split_method.title() if exp.split_method else "",
-            json.dumps(split_options) if split_options else "",
-        ]
-        for uid in ordered_user_ids:
-            row.append(net_by_user.get(uid, 0))
-        writer.writerow(row)
+    response['Content-Disposition'] = f'attachment; filename=\"{exports.export_filename(user, now_ts)}\"'
+    exports.write_csv(user, response, now_ts)
+    return response
+
+
+def _tz_offset(request):
+    try:
+        return int(request.data.get("tz_offset", request.GET.get("tz_offset", "0")))
+    except (TypeError, ValueError):
+        return 0
 
-    # Append download timestamp row (and a spacer)
-    writer.writerow([])
-    writer.writerow([])
-    writer.writerow([now_ts.strftime("%Y-%m-%d %H:%M:%S")] + [""] * (len(header) - 1))
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([ExportThrottle])
+def export_jobs(request):
+    """
+    Queue an export of the caller's expenses (`compress` for a gzipped file).
+    An export with the same options while nothing has changed reuses the
+    earlier job.
+    """
+    user = request.user
+    compress = str(request.data.get("compress", "")).lower() in ("1", "true", "yes")
+    tz_offset = _tz_offset(request)
+    fingerprint, rows_total = exports.fingerprint(user, compress, tz_offset)
+    job = exports.reusable_job(user, fingerprint)
+    if job is None:
+        # Committed before it is queued, so an eager run is not inside this
+        # write and its failure cannot roll the job back
+        job = ExportJob.objects.create(
+            user=user, compress=compress, tz_offset=tz_offset, fingerprint=fingerprint, rows_total=rows_total,
+        )
+        tasks.enqueue('expenses.exports.run_export', {'job_id': job.id})
+        job.refresh_from_db()
+    code = status.HTTP_200_OK if job.status == ExportJob.DONE else status.HTTP_202_ACCEPTED
+    return Response(ExportJobSerializer(job).data, status=code)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_job_detail(request, pk):
+    job = ExportJob.objects.filter(pk=pk, user=request.user).first()
+    if job is None:
+        return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+    return Response(ExportJobSerializer(job).data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_job_download(request, pk):
+    """The finished file; a single-range Range header resumes a download."""
+    job = ExportJob.objects.filter(pk=pk, user=request.user).first()
+    if job is None:
+        return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+    if job.status != ExportJob.DONE:
+        return Response({"detail": "Export is not ready."}, status=status.HTTP_409_CONFLICT)
+    path = exports.file_path(job)
+    try:
+        size = path.stat().st_size
+    except FileNotFoundError:
+        return Response({"detail": "Export has expired."}, status=status.HTTP_410_GONE)
+
+    etag = f'"{job.fingerprint[:32]}-{job.id}"'
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range != etag:
+        # The client's partial copy is of another file: send it whole
+        range_header = None
+    try:
+        byte_range = exports.parse_range(range_header, size)
+    except ValueError:
+        response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    start, end = byte_range or (0, size - 1)
+    response = StreamingHttpResponse(
+        exports.read_file(path, start, end - start + 1),
+        status=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK,
+        content_type='application/gzip' if job.compress else 'text/csv',
+    )
+    response['Content-Length'] = str(end - start + 1)
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Content-Disposition'] = f'attachment; filename=\"{job.filename}\"'
     return response
 
 
@@ -182,39 +233,48 @@ def contacts_list(request):
     return Response(UserPublicSerializer(users, many=True).data)
 
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def contact_search(request):
-    q = request.GET.get("q", "").strip()
-    if not q:
-        return Response([], status=status.HTTP_200_OK)
-    contact_ids = _contact_ids(request.user)
-    pending_pairs = set()
-    for req in ContactRequest.objects.filter(
-        models.Q(from_user=request.user) | models.Q(to_user=request.user),
+def _pending_contact_requests(user):
+    return ContactRequest.objects.filter(
+        models.Q(from_user=user) | models.Q(to_user=user),
         status='pending'
-    ):
-        pending_pairs.add(req.from_user_id)
-        pending_pairs.add(req.to_user_id)
+    ).values_list('from_user_id', 'to_user_id')
+
 
-    qs = User.objects.exclude(id=request.user.id).exclude(id__in=contact_ids)
+def _contact_search_queryset(user, q, contact_ids):
+    qs = User.objects.exclude(id=user.id).exclude(id__in=contact_ids)
     qs = qs.annotate(full_name=Concat('first_name', Value(' '), 'last_name'))
-    qs = qs.filter(
+    return qs.filter(
         models.Q(username__icontains=q)
         | models.Q(first_name__icontains=q)
         | models.Q(last_name__icontains=q)
         | models.Q(full_name__icontains=q)
     ).order_by('username')[:20]
 
-    results = []
-    for u in qs:
-        results.append({
-            "id": u.id,
-            "username": u.username,
-            "display_name": (u.get_full_name() or u.username).strip(),
-            "pending": u.id in pending_pairs,
-        })
-    return Response(results)
+
+def _contact_search_result(u, pending_pairs):
+    return {
+        "id": u.id,
+        "username": u.username,
+        "display_name": (u.get_full_name() or u.username).strip(),
+        "pending": u.id in pending_pairs,
+    }
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([ContactSearchThrottle])
+def contact_search(request):
+    q = request.GET.get("q", "").strip()
+    if not q:
+        return Response([], status=status.HTTP_200_OK)
+    contact_ids = _contact_ids(request.user)
+    pending_pairs = set()
+    for from_id, to_id in _pending_contact_requests(request.user):
+        pending_pairs.add(from_id)
+        pending_pairs.add(to_id)
+
+    qs = _contact_search_queryset(request.user, q, contact_ids)
+    return Response([_contact_search_result(u, pending_pairs) for u in qs])
 
 
 @api_view(['POST'])
@@ -265,8 +325,13 @@ def contact_request_accept(request, pk):
         return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
     if req.status != 'pending':
         return Response({"detail": "Request is not pending."}, status=status.HTTP_400_BAD_REQUEST)
-    req.status = 'accepted'
-    req.save()
+    with transaction.atomic():
+        req.status = 'accepted'
+        req.save()
+        events.emit('contact_accepted', [req.from_user_id, req.to_user_id], {
+            "request": req.id,
+            "users": [req.from_user_id, req.to_user_id],
+        })
     return Response(ContactRequestSerializer(req).data)
 
 
@@ -311,85 +376,187 @@ import logging
 logger = logging.getLogger(__name__)
 from itertools import combinations
 
-def _log_activity(action, expense, actor, splits_data, participants_ids, payer_id):
-    try:
-        activity = Activity.objects.create(
-            expense=expense if action != 'deleted' else None,
-            actor=actor,
-            action=action,
-            expense_name=expense.name,
-            expense_amount=expense.amount,
-            split_method=expense.split_method,
-            expense_date=expense.expense_date,
-            currency=expense.currency,
-            participants_snapshot=[int(p) for p in participants_ids],
+def _check_group(group, user, participants_ids):
+    if group is None:
+        return
+    member_ids = set(group.members.values_list('id', flat=True))
+    if user.id not in member_ids:
+        raise ValidationError("You are not a member of this group.")
+    if not set(participants_ids) <= member_ids:
+        raise ValidationError("All participants must be members of the group.")
+
+def _check_open_period(dates, closed):
+    if closed and any(d is not None and d <= closed for d in dates):
+        raise ValidationError({"expense_date": [f"Expenses up to {closed} are closed by a balance checkpoint."]})
+
+
+def _normalize_splits(splits_data, currency):
+    # Normalize splits by user to avoid duplicates; amounts become minor units
+    normalized = {}
+    for split in splits_data:
+        uid = int(split['user'])
+        entry = normalized.get(uid, {"user": uid, "paid_amount": 0, "owed_amount": 0, "value": Decimal('0')})
+        try:
+            entry["paid_amount"] += money.to_minor(split.get('paid_amount') or 0, currency)
+            entry["owed_amount"] += money.to_minor(split.get('owed_amount') or 0, currency)
+        except ValueError as e:
+            raise ValidationError({"splits": [str(e)]})
+        entry["value"] += Decimal(str(split.get('value', 0)))
+        normalized[uid] = entry
+    return list(normalized.values())
+
+
+def _validate_participants(user_id, participants, splits_data, payer_id, contact_ids):
+    """Check everyone involved is the user or a contact; returns all participant ids."""
+    for uid in participants:
+        if int(uid) != user_id and int(uid) not in contact_ids:
+            raise ValidationError("All participants must be your contacts.")
+    for split in splits_data:
+        uid = int(split['user'])
+        if uid != user_id and uid not in contact_ids:
+            raise ValidationError("All participants must be your contacts.")
+    if payer_id != user_id and payer_id not in contact_ids:
+        raise ValidationError("Paid By must be you or one of your contacts.")
+
+    # Ensure participants include payer, request user, and all split users
+    participants_ids = set(int(p) for p in participants)
+    participants_ids.add(payer_id)
+    participants_ids.add(user_id)
+    for split in splits_data:
+        participants_ids.add(int(split['user']))
+    return participants_ids
+
+
+def _check_mutual_contacts(participants_ids, accepted_edges, name_map):
+    missing_pairs = []
+    for a, b in combinations(participants_ids, 2):
+        if frozenset((a, b)) not in accepted_edges:
+            missing_pairs.append(f"{name_map.get(a, a)} and {name_map.get(b, b)}")
+    if missing_pairs:
+        raise ValidationError({"detail": f"These pairs are not contacts: {', '.join(missing_pairs)}"})
+
+
+def _compute_split_amounts(split_method, total_amount, splits_data, participants, currency):
+    """
+    Validate splits for the split method and fill in owed amounts, in minor
+    units. Computed shares always add up to `total_amount` exactly.
+    """
+    if split_method == 'manual':
+        total_owed = sum(split['owed_amount'] for split in splits_data)
+        if total_owed != total_amount:
+            raise ValidationError("The total owed amounts must equal the expense amount.")
+    elif split_method in ['full_owed', 'full_owe']:
+        total_owed = sum(split['owed_amount'] for split in splits_data)
+        if total_owed != total_amount:
+            raise ValidationError("The total owed amounts must equal the expense amount.")
+
+    elif split_method == 'percentage':
+        total_percentage = sum(split['value'] for split in splits_data)
+        if abs(total_percentage - Decimal('100')) > Decimal('0.0001'):
+            raise ValidationError("The total percentages must equal 100%.")
+        shares = money.allocate(total_amount, [split['value'] for split in splits_data])
+        for split, owed in zip(splits_data, shares):
+            split['owed_amount'] = owed
+
+    elif split_method == 'equal':
+        if len(splits_data) != len(participants):
+            raise ValidationError("Participants count must match splits count for equal split.")
+        for split, owed in zip(splits_data, money.allocate(total_amount, [1] * len(splits_data))):
+            split['owed_amount'] = owed
+
+    elif split_method == 'personal':
+        if len(participants) != 1 or len(splits_data) == 0:
+            raise ValidationError("Personal expenses must have exactly one participant.")
+        split = splits_data[0]
+        split['owed_amount'] = total_amount
+        split['paid_amount'] = total_amount
+        splits_data = [split]
+
+    elif split_method == 'shares':
+        if sum(split['value'] for split in splits_data) == 0:
+            raise ValidationError("Total shares must be greater than 0.")
+        shares = money.allocate(total_amount, [split['value'] for split in splits_data])
+        for split, owed in zip(splits_data, shares):
+            split['owed_amount'] = owed
+
+    elif split_method == 'excess':
+        try:
+            excesses = [money.to_minor(split.get('value', 0), currency) for split in splits_data]
+        except ValueError as e:
+            raise ValidationError({"splits": [str(e)]})
+        # The remainder after everyone's excess is shared equally among all participants
+        base = money.allocate(total_amount - sum(excesses), [1] * len(participants))
+        for split, excess, owed in zip(splits_data, excesses, base):
+            split['owed_amount'] = owed + excess
+    return splits_data
+
+
+class _ContactSnapshot:
+    """Accepted contact edges around a user, loaded once to validate many expenses."""
+
+    def __init__(self, user):
+        self.contact_ids = _contact_ids(user)
+        members = self.contact_ids | {user.id}
+        self.edges = set(
+            frozenset(pair)
+            for pair in ContactRequest.objects.filter(
+                status='accepted',
+                from_user_id__in=members,
+                to_user_id__in=members,
+            ).values_list('from_user_id', 'to_user_id')
         )
-        involved = set(participants_ids)
-        involved.add(payer_id)
-        involved.add(expense.added_by_id)
-        for split in splits_data:
-            involved.add(int(split['user']))
-        activity.involved_users.set(User.objects.filter(id__in=involved))
-    except Exception as e:
-        logger.error(f"Failed to log activity: {e}")
+        self.names = {u.id: (u.get_full_name() or u.username) for u in User.objects.filter(id__in=members)}
+
+
+def _resolve_splits(user_id, snapshot, participants, splits, payer_id, split_method, amount, currency):
+    """
+    Validate an expense's participants against a contact snapshot and compute
+    its splits (`amount` in minor units). Returns (split_method, splits_data,
+    participants_ids).
+    """
+    splits_data = _normalize_splits(splits, currency)
+    participants_ids = _validate_participants(user_id, participants, splits_data, payer_id, snapshot.contact_ids)
+    _check_mutual_contacts(participants_ids, snapshot.edges, snapshot.names)
+    if len(participants_ids) == 1:
+        split_method = 'personal'
+    splits_data = _compute_split_amounts(split_method, amount, splits_data, list(participants_ids), currency)
+    # Participants without a split still get a zero row, as participants.set() does
+    split_users = {split['user'] for split in splits_data}
+    splits_data += [{"user": uid} for uid in participants_ids - split_users]
+    return split_method, splits_data, participants_ids
+
 
 class ExpenseViewSet(viewsets.ModelViewSet):
     queryset = Expense.objects.all().order_by('-date')
     serializer_class = ExpenseSerializer
+    filter_backends = [ExpenseFilterBackend]
 
     def get_queryset(self):
-        user = self.request.user
-        return Expense.objects.filter(
-            models.Q(participants=user)
-            | models.Q(added_by=user)
-            | models.Q(paid_by=user)
-            | models.Q(expensesplit__user=user)
-        ).distinct().order_by('-date')
+        return _visible_expenses(self.request.user).order_by('-date')
+
+    @method_decorator(replica_reads)
+    def list(self, request, *args, **kwargs):
+        fields = _list_fields(request.query_params)
+        qs = self.filter_queryset(_visible_expenses(request.user).order_by('-date'))
+        qs, serialize = _sparse_list(qs, fields, request.user)
+        page = self.paginate_queryset(qs)
+        if page is not None:
+            return self.get_paginated_response(serialize(page))
+        return Response(serialize(list(qs)))
 
     def perform_create(self, serializer):
-        logger.debug(f"Incoming data: {self.request.data}")
+        logger.debug("Incoming data: %s", self.request.data)
 
         data = self.request.data
-        print("Incoming Data:", data)  # Debugging
-        splits_data = data.get('splits', [])
-        print("Splits Data:", splits_data)  # Debugging
         participants = data.get('participants', [])
         split_method = data.get('split_method') or 'equal'
-        print("Split Method:", split_method)  # Debugging
-        total_amount = Decimal(str(data['amount']))
-        print("Total Amount:", total_amount)  # Debugging
+        total_amount = serializer.validated_data['amount']
+        currency = serializer.validated_data.get('currency', 'ARS')
         payer_id = int(data.get('paid_by'))
-        currency = data.get('currency', 'ARS')
 
-        # Normalize splits by user to avoid duplicates
-        normalized = {}
-        for split in splits_data:
-            uid = int(split['user'])
-            entry = normalized.get(uid, {"user": uid, "paid_amount": Decimal('0'), "owed_amount": Decimal('0'), "value": Decimal('0')})
-            entry["paid_amount"] += Decimal(str(split.get('paid_amount', 0)))
-            entry["owed_amount"] += Decimal(str(split.get('owed_amount', 0)))
-            entry["value"] += Decimal(str(split.get('value', 0)))
-            normalized[uid] = entry
-        splits_data = list(normalized.values())
-
-        # Ensure all participants (except self) are contacts
+        splits_data = _normalize_splits(data.get('splits', []), currency)
         contact_ids = _contact_ids(self.request.user)
-        for uid in participants:
-            if int(uid) != self.request.user.id and int(uid) not in contact_ids:
-                raise ValidationError("All participants must be your contacts.")
-        for split in splits_data:
-            uid = int(split['user'])
-            if uid != self.request.user.id and uid not in contact_ids:
-                raise ValidationError("All participants must be your contacts.")
-        if payer_id != self.request.user.id and payer_id not in contact_ids:
-            raise ValidationError("Paid By must be you or one of your contacts.")
-
-        # Ensure participants include payer, request user, and all split users
-        participants_ids = set(int(p) for p in participants)
-        participants_ids.add(payer_id)
-        participants_ids.add(self.request.user.id)
-        for split in splits_data:
-            participants_ids.add(int(split['user']))
+        participants_ids = _validate_participants(self.request.user.id, participants, splits_data, payer_id, contact_ids)
         participants = list(participants_ids)
 
         # Ensure all participants have mutual contact relationships
@@ -404,82 +571,29 @@ class ExpenseViewSet(viewsets.ModelViewSet):
                     to_user_id__in=participants_ids
                 )
             )
-            missing_pairs = []
-            for a, b in combinations(participants_ids, 2):
-                if frozenset((a, b)) not in accepted_edges:
-                    missing_pairs.append(f"{name_map.get(a, a)} and {name_map.get(b, b)}")
-            if missing_pairs:
-                raise ValidationError({"detail": f"These pairs are not contacts: {', '.join(missing_pairs)}"})
+            _check_mutual_contacts(participants_ids, accepted_edges, name_map)
 
-        # Personal expense (only self)
-        if len(participants) == 1:
-            split_method = 'personal'
+        _check_group(serializer.validated_data.get('group'), self.request.user, participants_ids)
 
-        # Validate splits based on the selected method
+        # Personal expense (only self)
         if len(participants) == 1:
             split_method = 'personal'
 
-        if split_method == 'manual':
-            total_owed = sum(Decimal(str(split['owed_amount'])) for split in splits_data)
-            if total_owed != total_amount:
-                raise ValidationError("The total owed amounts must equal the expense amount.")
-        elif split_method in ['full_owed', 'full_owe']:
-            total_owed = sum(Decimal(str(split['owed_amount'])) for split in splits_data)
-            if total_owed != total_amount:
-                raise ValidationError("The total owed amounts must equal the expense amount.")
-
-        elif split_method == 'percentage':
-            total_percentage = sum(Decimal(str(split['value'])) for split in splits_data)
-            if abs(total_percentage - Decimal('100')) > Decimal('0.0001'):
-                raise ValidationError("The total percentages must equal 100%.")
-            for split in splits_data:
-                split['owed_amount'] = (total_amount * Decimal(str(split.get('value', 0))) / Decimal('100')).quantize(Decimal('0.01'))
-
-        elif split_method == 'equal':
-            if len(splits_data) != len(participants):
-                raise ValidationError("Participants count must match splits count for equal split.")
-            for split in splits_data:
-                split['owed_amount'] = (total_amount / Decimal(len(participants))).quantize(Decimal('0.01'))
-        elif split_method == 'personal':
-            if len(participants) != 1 or len(splits_data) == 0:
-                raise ValidationError("Personal expenses must have exactly one participant.")
-            split = splits_data[0]
-            split['owed_amount'] = total_amount
-            split['paid_amount'] = total_amount
-            splits_data = [split]
-
-        elif split_method == 'personal':
-            if len(participants) != 1 or len(splits_data) == 0:
-                raise ValidationError("Personal expenses must have exactly one participant.")
-            split = splits_data[0]
-            split['owed_amount'] = total_amount
-            split['paid_amount'] = total_amount
-            splits_data = [split]
-
-        elif split_method == 'shares':
-            total_shares = Decimal(sum(Decimal(str(split['value'])) for split in splits_data))
-            if total_shares == 0:
-                raise ValidationError("Total shares must be greater than 0.")
-            for split in splits_data:
-                split['owed_amount'] = (Decimal(str(split['value'])) / total_shares * total_amount).quantize(Decimal('0.01'))
-
-        elif split_method == 'excess':
-            total_excess = sum(Decimal(str(split.get('value', 0))) for split in splits_data)
-            base_amount = (total_amount - total_excess) / Decimal(len(participants))
-            for split in splits_data:
-                split['owed_amount'] = (base_amount + Decimal(str(split.get('value', 0)))).quantize(Decimal('0.01'))
+        splits_data = _compute_split_amounts(split_method, total_amount, splits_data, participants, currency)
 
         with transaction.atomic():
+            _check_open_period([serializer.validated_data.get('expense_date')], checkpoints.lock_open_period())
             expense = serializer.save(added_by=self.request.user)
             for split in splits_data:
                 ExpenseSplit.objects.create(
                     expense=expense,
                     user=User.objects.get(id=split['user']),
-                    paid_amount=Decimal(str(split.get('paid_amount', 0))),
-                    owed_amount=Decimal(str(split.get('owed_amount', 0))),
+                    paid_amount=split.get('paid_amount', 0),
+                    owed_amount=split.get('owed_amount', 0),
                 )
             expense.participants.set(User.objects.filter(id__in=participants_ids))
-            _log_activity('created', expense, self.request.user, splits_data, participants, payer_id)
+            log_activity('created', expense, self.request.user, splits_data, participants, payer_id)
+            search.index_expenses([expense.id])
 
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop('partial', False)
@@ -489,22 +603,13 @@ class ExpenseViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
 
         data = serializer.validated_data
-        splits_data = list(request.data.get('splits', []))
         participants = request.data.get('participants', [])
         split_method = request.data.get('split_method')
-        total_amount = Decimal(str(request.data.get('amount')))
+        total_amount = data.get('amount', instance.amount)
+        currency = data.get('currency', instance.currency)
         payer_id = int(request.data.get('paid_by'))
-        currency = request.data.get('currency', instance.currency)
 
-        normalized = {}
-        for split in splits_data:
-            uid = int(split['user'])
-            entry = normalized.get(uid, {"user": uid, "paid_amount": Decimal('0'), "owed_amount": Decimal('0'), "value": Decimal('0')})
-            entry["paid_amount"] += Decimal(str(split.get('paid_amount', 0)))
-            entry["owed_amount"] += Decimal(str(split.get('owed_amount', 0)))
-            entry["value"] += Decimal(str(split.get('value', 0)))
-            normalized[uid] = entry
-        splits_data = list(normalized.values())
+        splits_data = _normalize_splits(list(request.data.get('splits', [])), currency)
 
         # Ensure participants include payer, request user, and all split users
         participants_ids = set(int(p) for p in participants)
@@ -514,52 +619,173 @@ class ExpenseViewSet(viewsets.ModelViewSet):
             participants_ids.add(int(split['user']))
         participants = list(participants_ids)
 
-        if split_method == 'manual':
-            total_owed = sum(Decimal(str(split['owed_amount'])) for split in splits_data)
-            if total_owed != total_amount:
-                raise ValidationError("The total owed amounts must equal the expense amount.")
-        elif split_method in ['full_owed', 'full_owe']:
-            total_owed = sum(Decimal(str(split['owed_amount'])) for split in splits_data)
-            if total_owed != total_amount:
-                raise ValidationError("The total owed amounts must equal the expense amount.")
-        elif split_method == 'percentage':
-            total_percentage = sum(Decimal(str(split['value'])) for split in splits_data)
-            if abs(total_percentage - Decimal('100')) > Decimal('0.0001'):
-                raise ValidationError("The total percentages must equal 100%.")
-            for split in splits_data:
-                split['owed_amount'] = (total_amount * Decimal(str(split.get('value', 0))) / Decimal('100')).quantize(Decimal('0.01'))
-        elif split_method == 'equal':
-            if len(splits_data) != len(participants):
-                raise ValidationError("Participants count must match splits count for equal split.")
-            for split in splits_data:
-                split['owed_amount'] = (total_amount / Decimal(len(participants))).quantize(Decimal('0.01'))
-        elif split_method == 'shares':
-            total_shares = Decimal(sum(Decimal(str(split['value'])) for split in splits_data))
-            if total_shares == 0:
-                raise ValidationError("Total shares must be greater than 0.")
-            for split in splits_data:
-                split['owed_amount'] = (Decimal(str(split['value'])) / total_shares * total_amount).quantize(Decimal('0.01'))
-        elif split_method == 'excess':
-            total_excess = sum(Decimal(str(split.get('value', 0))) for split in splits_data)
-            base_amount = (total_amount - total_excess) / Decimal(len(participants))
-            for split in splits_data:
-                split['owed_amount'] = (base_amount + Decimal(str(split.get('value', 0)))).quantize(Decimal('0.01'))
+        _check_group(data.get('group', instance.group), request.user, participants_ids)
+
+        splits_data = _compute_split_amounts(split_method, total_amount, splits_data, participants, currency)
+        # Users dropped from the expense are notified too, so their synced copies go away
+        previous_ids = set(instance.expensesplit_set.values_list('user_id', flat=True)) | {instance.paid_by_id}
 
         with transaction.atomic():
+            _check_open_period([instance.expense_date, data.get('expense_date')], checkpoints.lock_open_period())
             serializer.save()
             ExpenseSplit.objects.filter(expense=instance).delete()
             for split in splits_data:
                 ExpenseSplit.objects.create(
                     expense=instance,
                     user=User.objects.get(id=split['user']),
-                    paid_amount=Decimal(str(split.get('paid_amount', 0))),
-                    owed_amount=Decimal(str(split.get('owed_amount', 0))),
+                    paid_amount=split.get('paid_amount', 0),
+                    owed_amount=split.get('owed_amount', 0),
                 )
             instance.participants.set(User.objects.filter(id__in=participants_ids))
-            _log_activity('updated', instance, request.user, splits_data, participants, payer_id)
+            log_activity('updated', instance, request.user, splits_data, participants_ids | previous_ids, payer_id)
+            search.index_expenses([instance.id])
 
         return Response(serializer.data)
 
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """
+        Create many expenses in one request and one transaction. Items are
+        validated independently against a single snapshot of the caller's
+        contacts; valid items are saved, invalid ones are reported by index.
+        """
+        items = request.data.get('expenses') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response({"detail": "Expected a non-empty list of expenses."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.BULK_EXPENSE_MAX_ITEMS:
+            return Response(
+                {"detail": f"At most {settings.BULK_EXPENSE_MAX_ITEMS} expenses per request."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        user = request.user
+        snapshot = _ContactSnapshot(user)
+        results = []
+        valid = []
+        for index, item in enumerate(items):
+            serializer = ExpenseBulkItemSerializer(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results.append({"index": index, "status": 400, "errors": serializer.errors})
+
+        # Validated first, so only integer group ids reach the query
+        group_ids = {data['group'] for _index, data in valid if data.get('group') is not None}
+        groups = {}
+        if group_ids:
+            Membership = ExpenseGroup.members.through
+            for group_id, member_id in Membership.objects.filter(
+                expensegroup_id__in=group_ids
+            ).values_list('expensegroup_id', 'user_id'):
+                groups.setdefault(group_id, set()).add(member_id)
+
+        prepared = []
+        for index, data in valid:
+            try:
+                prepared.append((index, self._prepare_bulk_item(data, snapshot, groups)))
+            except ValidationError as e:
+                results.append({"index": index, "status": 400, "errors": e.detail})
+            except (KeyError, TypeError, ValueError, ArithmeticError):
+                results.append({"index": index, "status": 400, "errors": ["Invalid splits."]})
+
+        if prepared:
+            with transaction.atomic():
+                # Checked under the lock, so no checkpoint can close these dates before commit
+                closed = checkpoints.lock_open_period()
+                still_open = []
+                for index, data in prepared:
+                    try:
+                        _check_open_period([data['expense_date']], closed)
+                        still_open.append((index, data))
+                    except ValidationError as e:
+                        results.append({"index": index, "status": 400, "errors": e.detail})
+                prepared = still_open
+                expenses = Expense.objects.bulk_create([
+                    Expense(
+                        name=data['name'],
+                        amount=data['amount'],
+                        category=data['category'],
+                        expense_date=data['expense_date'],
+                        currency=data['currency'],
+                        paid_by_id=data['paid_by'],
+                        split_method=data['split_method'],
+                        group_id=data.get('group'),
+                        added_by=user,
+                    )
+                    for _index, data in prepared
+                ])
+                ExpenseSplit.objects.bulk_create([
+                    ExpenseSplit(
+                        expense=expense,
+                        user_id=split['user'],
+                        paid_amount=split.get('paid_amount', 0),
+                        owed_amount=split.get('owed_amount', 0),
+                    )
+                    for expense, (_index, data) in zip(expenses, prepared)
+                    for split in data['splits']
+                ])
+                log_activities('created', [
+                    (expense, data['participants']) for expense, (_index, data) in zip(expenses, prepared)
+                ], user)
+                search.index_expenses([expense.id for expense in expenses])
+            for expense, (index, _data) in zip(expenses, prepared):
+                results.append({"index": index, "status": 201, "id": expense.id})
+
+        results.sort(key=lambda r: r['index'])
+        created = len(prepared)
+        if created == len(items):
+            response_status = status.HTTP_201_CREATED
+        elif created:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response(
+            {"created": created, "failed": len(items) - created, "results": results},
+            status=response_status,
+        )
+
+    @action(detail=False, methods=['get'], url_path='search')
+    @method_decorator(replica_reads)
+    def search_expenses(self, request):
+        """Ranked full-text search over the caller's expenses (`?q=`, `page`, `page_size`)."""
+        query = request.query_params.get('q', '').strip()
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+            page_size = min(max(int(request.query_params.get('page_size', settings.SEARCH_PAGE_SIZE)), 1), 100)
+        except ValueError:
+            return Response({"detail": "page and page_size must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # One extra id tells whether another page exists without counting all matches
+        ids = search.search(request.user, query, offset=(page - 1) * page_size, limit=page_size + 1)
+        has_more = len(ids) > page_size
+        ids = ids[:page_size]
+        by_id = {expense.id: expense for expense in _with_list_relations(Expense.objects.filter(id__in=ids))}
+        results = [by_id[expense_id] for expense_id in ids if expense_id in by_id]
+        return Response({
+            "query": query,
+            "page": page,
+            "has_more": has_more,
+            "results": self.get_serializer(results, many=True).data,
+        })
+
+    def _prepare_bulk_item(self, data, snapshot, groups):
+        user_id = self.request.user.id
+        split_method, splits_data, participants_ids = _resolve_splits(
+            user_id, snapshot, data['participants'], data['splits'], data['paid_by'], data['split_method'],
+            data['amount'], data['currency'],
+        )
+
+        group_id = data.get('group')
+        if group_id is not None:
+            member_ids = groups.get(group_id)
+            if member_ids is None:
+                raise ValidationError({"group": ["Invalid group."]})
+            if user_id not in member_ids:
+                raise ValidationError("You are not a member of this group.")
+            if not participants_ids <= member_ids:
+                raise ValidationError("All participants must be members of the group.")
+        return {**data, "split_method": split_method, "splits": splits_data, "participants": participants_ids}
+
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
         splits = list(instance.expensesplit_set.all())
@@ -570,10 +796,170 @@ class ExpenseViewSet(viewsets.ModelViewSet):
             for s in splits
         ]
         with transaction.atomic():
+            _check_open_period([instance.expense_date], checkpoints.lock_open_period())
+            # Log first: the instance loses its pk once deleted
+            log_activity('deleted', instance, request.user, splits_data, participants_ids, payer_id)
+            search.remove_expenses([instance.id])
             response = super().destroy(request, *args, **kwargs)
-            _log_activity('deleted', instance, request.user, splits_data, participants_ids, payer_id)
         return response
 
+class RecurringExpenseViewSet(viewsets.ModelViewSet):
+    """
+    Recurring expense templates owned by the caller. Splits are resolved when
+    the template is saved; `materialize_recurring` creates the occurrences.
+    """
+    queryset = RecurringExpense.objects.all()
+    serializer_class = RecurringExpenseSerializer
+    SPLIT_FIELDS = ('amount', 'paid_by', 'split_method', 'participants', 'splits', 'group')
+    SCHEDULE_FIELDS = ('frequency', 'interval', 'start_date', 'end_date')
+
+    def get_queryset(self):
+        return RecurringExpense.objects.filter(added_by=self.request.user).order_by('next_date', 'id')
+
+    def _resolve(self, data, instance=None):
+        user = self.request.user
+
+        def value(field, default=None):
+            return data.get(field, getattr(instance, field, default) if instance else default)
+
+        splits = value('splits', [])
+        participants = data.get('participants', [int(split['user']) for split in splits])
+        paid_by = value('paid_by')
+        group = value('group')
+        split_method, splits_data, participants_ids = _resolve_splits(
+            user.id, _ContactSnapshot(user), participants, splits, paid_by.id,
+            value('split_method') or 'equal', value('amount'), value('currency', 'ARS'),
+        )
+        _check_group(group, user, participants_ids)
+        return split_method, [
+            {
+                "user": split['user'],
+                "paid_amount": split.get('paid_amount', 0),
+                "owed_amount": split.get('owed_amount', 0),
+            }
+            for split in splits_data
+        ]
+
+    def perform_create(self, serializer):
+        split_method, splits = self._resolve(serializer.validated_data)
+        start = serializer.validated_data['start_date']
+        serializer.save(added_by=self.request.user, split_method=split_method, splits=splits, next_date=start)
+
+    def perform_update(self, serializer):
+        data = serializer.validated_data
+        extra = {}
+        if any(field in data for field in self.SPLIT_FIELDS):
+            extra['split_method'], extra['splits'] = self._resolve(data, serializer.instance)
+        template = serializer.save(**extra)
+        if any(field in data for field in self.SCHEDULE_FIELDS):
+            # Periods before today were covered by the previous schedule
+            schedule(template, not_before=timezone.localdate())
+            template.active = template.active and data.get('active', True)
+            template.save(update_fields=['occurrence_count', 'next_date', 'active'])
+
+
+class ExpenseGroupViewSet(viewsets.ModelViewSet):
+    queryset = ExpenseGroup.objects.all().order_by('name')
+    serializer_class = ExpenseGroupSerializer
+
+    def get_queryset(self):
+        return ExpenseGroup.objects.filter(
+            members=self.request.user
+        ).prefetch_related('members').order_by('name')
+
+    def _check_members(self, member_ids, allowed=()):
+        contact_ids = _contact_ids(self.request.user)
+        for uid in member_ids:
+            if uid != self.request.user.id and uid not in contact_ids and uid not in allowed:
+                raise ValidationError("All members must be your contacts.")
+
+    def perform_create(self, serializer):
+        member_ids = {u.id for u in serializer.validated_data.get('members', [])}
+        self._check_members(member_ids)
+        member_ids.add(self.request.user.id)
+        serializer.save(created_by=self.request.user, members=list(member_ids))
+
+    def perform_update(self, serializer):
+        if 'members' in serializer.validated_data:
+            current = set(serializer.instance.members.values_list('id', flat=True))
+            self._check_members({u.id for u in serializer.validated_data['members']}, allowed=current)
+        serializer.save()
+
+    def destroy(self, request, *args, **kwargs):
+        group = self.get_object()
+        if group.created_by_id != request.user.id:
+            return Response({"detail": "Only the creator can delete a group."}, status=status.HTTP_403_FORBIDDEN)
+        return super().destroy(request, *args, **kwargs)
+
+    @staticmethod
+    def _plan_payload(plan):
+        user_ids = {uid for transfers in plan.values() for d, c, _amount in transfers for uid in (d, c)}
+        names = {u.id: u.get_full_name() or u.username for u in User.objects.filter(id__in=user_ids)}
+        return [
+            {
+                "from_user": debtor,
+                "from_display": names.get(debtor, debtor),
+                "to_user": creditor,
+                "to_display": names.get(creditor, creditor),
+                "amount": money.format_amount(amount, currency),
+                "currency": currency,
+            }
+            for currency, transfers in sorted(plan.items())
+            for debtor, creditor, amount in transfers
+        ]
+
+    @action(detail=True, methods=['get'])
+    def simplify(self, request, pk=None):
+        group = self.get_object()
+        plan = simplify_group(group, request.GET.get('currency'))
+        return Response(self._plan_payload(plan))
+
+    @action(detail=True, methods=['post'])
+    def settle(self, request, pk=None):
+        group = self.get_object()
+        currency = request.data.get('currency')
+        with transaction.atomic():
+            # Lock the group so concurrent settles cannot apply the same plan twice
+            group = ExpenseGroup.objects.select_for_update().get(pk=group.pk)
+            plan = simplify_group(group, currency)
+            transfers = [
+                (cur, debtor, creditor, amount)
+                for cur, items in plan.items()
+                for debtor, creditor, amount in items
+            ]
+            if not transfers:
+                return Response({"message": "Nothing to settle"}, status=200)
+
+            user_ids = {uid for _cur, d, c, _amount in transfers for uid in (d, c)}
+            names = {u.id: u.get_full_name() or u.username for u in User.objects.filter(id__in=user_ids)}
+            today = timezone.now().date()
+            settlements = Expense.objects.bulk_create([
+                Expense(
+                    name=f"Settle {names[debtor]} → {names[creditor]}"[:50],
+                    amount=amount,
+                    category="Other",
+                    expense_date=today,
+                    paid_by_id=debtor,
+                    split_method="manual",
+                    added_by=request.user,
+                    currency=cur,
+                    group=group,
+                )
+                for cur, debtor, creditor, amount in transfers
+            ])
+            splits = []
+            for settlement, (_cur, debtor, creditor, amount) in zip(settlements, transfers):
+                splits.append(ExpenseSplit(expense=settlement, user_id=debtor, paid_amount=amount, owed_amount=0))
+                splits.append(ExpenseSplit(expense=settlement, user_id=creditor, paid_amount=0, owed_amount=amount))
+            ExpenseSplit.objects.bulk_create(splits)
+            log_activities('settled', [
+                (settlement, {debtor, creditor})
+                for settlement, (_cur, debtor, creditor, _amount) in zip(settlements, transfers)
+            ], request.user)
+            search.index_expenses([settlement.id for settlement in settlements])
+
+        return Response({"message": "Settled", "transfers": self._plan_payload(plan)})
+
 @login_required
 def calculate_balances(request):
     balances = {}
@@ -581,79 +967,213 @@ def calculate_balances(request):
     for split in splits:
         other_user = split.expense.added_by if split.expense.added_by != request.user else None
         if other_user:
-            balances[other_user.username] = balances.get(other_user.username, 0) + split.owed_amount - split.paid_amount
+            net = money.to_major(split.owed_amount - split.paid_amount, split.expense.currency)
+            balances[other_user.username] = balances.get(other_user.username, 0) + net
     return JsonResponse(balances)
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def balances(request):
-    current_user = request.user
-    balances_map = {}
-
-    expenses = Expense.objects.filter(
-        models.Q(participants=current_user)
-        | models.Q(added_by=current_user)
-        | models.Q(paid_by=current_user)
-        | models.Q(expensesplit__user=current_user)
-    ).prefetch_related('expensesplit_set__user', 'paid_by').distinct()
-    for expense in expenses:
-        payer = expense.paid_by
-        splits = list(expense.expensesplit_set.all())
+def _visible_expenses(user):
+    # participants and splits share the ExpenseSplit table, so one indexed
+    # subquery covers both and no DISTINCT over a join is needed
+    return Expense.objects.filter(
+        models.Q(added_by=user)
+        | models.Q(paid_by=user)
+        | models.Q(id__in=ExpenseSplit.objects.filter(user=user).values('expense_id'))
+    )
+
+
+def _with_list_relations(qs):
+    return qs.select_related('added_by', 'paid_by').prefetch_related('expensesplit_set', 'participants')
+
+
+def _annotate_net(qs, user):
+    """Annotate the caller's net per expense: positive when owed, as in balances."""
+    others_owed = ExpenseSplit.objects.filter(expense=models.OuterRef('pk')).exclude(user=user).values(
+        'expense'
+    ).annotate(total=models.Sum('owed_amount')).values('total')
+    own_owed = ExpenseSplit.objects.filter(expense=models.OuterRef('pk'), user=user).values(
+        'expense'
+    ).annotate(total=models.Sum('owed_amount')).values('total')
+    output = models.BigIntegerField()
+    zero = Value(0, output_field=output)
+    return qs.annotate(net=models.Case(
+        models.When(paid_by=user, then=Coalesce(models.Subquery(others_owed, output_field=output), zero)),
+        default=-Coalesce(models.Subquery(own_owed, output_field=output), zero),
+        output_field=output,
+    ))
+
+
+def _list_fields(params):
+    """
+    Field names requested with `?fields=a,b` (or `?view=compact` for the
+    compact default set), or None for the full representation.
+    """
+    if params.get('fields'):
+        fields = [f.strip() for f in params['fields'].split(',') if f.strip()]
+        known = set(ExpenseSerializer.Meta.fields) | {'net'}
+        unknown = [f for f in fields if f not in known]
+        if unknown:
+            raise ValidationError({"fields": [f"Unknown fields: {', '.join(unknown)}"]})
+        return fields
+    if params.get('view') == 'compact':
+        return list(CompactExpenseSerializer.DEFAULT_FIELDS)
+    return None
+
+
+def _sparse_list(qs, fields, user):
+    """
+    (queryset, serialize) for a list of `fields` (None for the full
+    representation): the compact fast path when every field is a plain
+    column, else the render cache. `serialize` takes the evaluated rows.
+    """
+    if fields is not None and 'net' in fields:
+        qs = _annotate_net(qs, user)
+    if fields is not None and CompactExpenseSerializer.supports(fields):
+        compact = CompactExpenseSerializer(fields)
+        return compact.values(qs), compact.to_representation
+    return render_cache.rows(qs, fields), lambda rows: render_cache.render(rows, fields)
+
+
+def _balance_expenses(user, after=None):
+    qs = _visible_expenses(user)
+    if after is not None:
+        # Older expenses are covered by the balance checkpoint
+        qs = qs.filter(expense_date__gt=after)
+    return qs.prefetch_related('expensesplit_set__user', 'paid_by')
+
+
+def _balance_entry(balances_map, user, currency):
+    return balances_map.setdefault(
+        (user.id, currency),
+        {
+            "user_id": user.id,
+            "username": user.username,
+            "display_name": user.get_full_name() or user.username,
+            "amount": 0,
+            "currency": currency,
+        },
+    )
+
+
+def _add_checkpoint_balances(balances_map, rows, current_user):
+    for row in rows:
+        other = row.user_b if row.user_a_id == current_user.id else row.user_a
+        _balance_entry(balances_map, other, row.currency)["amount"] += checkpoints.signed_amount(row, current_user.id)
+
+
+def _add_to_balances(balances_map, expense, current_user):
+    payer = expense.paid_by
+    splits = list(expense.expensesplit_set.all())
+
+    # Normalizar: agrupar por usuario para evitar duplicados
+    split_totals = {}
+    for s in splits:
+        entry = split_totals.setdefault(
+            s.user.id,
+            {
+                "user": s.user,
+                "owed": 0,
+                "paid": 0,
+            },
+        )
+        entry["owed"] += s.owed_amount
+        entry["paid"] += s.paid_amount
+
+    if payer == current_user:
+        for uid, entry in split_totals.items():
+            if uid == current_user.id:
+                continue
+            _balance_entry(balances_map, entry["user"], expense.currency)["amount"] += entry["owed"]
+    else:
+        my_entry = split_totals.get(current_user.id)
+        if my_entry:
+            _balance_entry(balances_map, payer, expense.currency)["amount"] -= my_entry["owed"]
 
-        # Normalizar: agrupar por usuario para evitar duplicados
-        split_totals = {}
-        for s in splits:
-            entry = split_totals.setdefault(
-                s.user.id,
-                {
-                    "user": s.user,
-                    "owed": Decimal('0'),
-                    "paid": Decimal('0'),
-                },
-            )
-            entry["owed"] += Decimal(str(s.owed_amount))
-            entry["paid"] += Decimal(str(s.paid_amount))
-
-        if payer == current_user:
-            for uid, entry in split_totals.items():
-                if uid == current_user.id:
-                    continue
-                u = entry["user"]
-                key = (uid, expense.currency)
-                dest = balances_map.setdefault(
-                    key,
-                    {
-                        "user_id": uid,
-                        "username": u.username,
-                        "display_name": u.get_full_name() or u.username,
-                        "amount": Decimal('0'),
-                        "currency": expense.currency,
-                    },
-                )
-                dest["amount"] += entry["owed"]
-        else:
-            my_entry = split_totals.get(current_user.id)
-            if my_entry:
-                key = (payer.id, expense.currency)
-                dest = balances_map.setdefault(
-                    key,
-                    {
-                        "user_id": payer.id,
-                        "username": payer.username,
-                        "display_name": payer.get_full_name() or payer.username,
-                        "amount": Decimal('0'),
-                        "currency": expense.currency,
-                    },
-                )
-                dest["amount"] -= my_entry["owed"]
 
-    # Convertir Decimals a float
+def _balances_result(balances_map):
+    # Minor units to major; the balances payload has always carried numbers
     result = []
     for v in balances_map.values():
-        v["amount"] = float(v["amount"])
+        v["amount"] = float(money.to_major(v["amount"], v["currency"]))
         result.append(v)
+    return result
+
+
+def _user_balances(current_user, counterparty_ids=None):
+    """
+    The caller's balances_map, or only the entries for `counterparty_ids`,
+    in which case only the expenses shared with them are read.
+    """
+    balances_map = {}
+    checkpoint = checkpoints.latest_checkpoint()
+    expenses = _balance_expenses(current_user, after=checkpoint.as_of if checkpoint else None)
+    if counterparty_ids is not None:
+        expenses = expenses.filter(
+            models.Q(paid_by_id__in=counterparty_ids)
+            | models.Q(
+                paid_by=current_user,
+                id__in=ExpenseSplit.objects.filter(user_id__in=counterparty_ids).values('expense_id'),
+            )
+        )
+    if checkpoint:
+        rows = checkpoints.user_balances(checkpoint, current_user)
+        if counterparty_ids is not None:
+            rows = rows.filter(models.Q(user_a_id__in=counterparty_ids) | models.Q(user_b_id__in=counterparty_ids))
+        _add_checkpoint_balances(balances_map, rows, current_user)
+    for expense in expenses:
+        _add_to_balances(balances_map, expense, current_user)
+    if counterparty_ids is not None:
+        balances_map = {key: entry for key, entry in balances_map.items() if key[0] in counterparty_ids}
+    return balances_map
 
-    return Response(result)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@replica_reads
+def balances(request):
+    return Response(_balances_result(_user_balances(request.user)))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def sync(request):
+    """
+    Changes since `?since=<token>` (see expenses/sync.py):
+    - `expenses`: expenses to add or replace, with their splits
+    - `deleted`: ids of expenses to drop
+    - `balances`: the balance rows for `balance_users`, replacing the
+      client's rows for those users; when `balance_users` is null they are
+      every balance row
+    Without a token, or with an expired one, `reset` is true and the response
+    is a full snapshot. While `has_more` is true, call again with the new
+    `token`. Always reads the primary: replicas lag by different amounts, so
+    a token from one could be ahead of the next one's data.
+    """
+    try:
+        since = sync_changes.parse_token(request.query_params.get('since'))
+    except ValueError:
+        raise ValidationError({"since": ["Invalid sync token."]})
+    user = request.user
+    changes = sync_changes.changes_since(user, since, settings.SYNC_MAX_CHANGES)
+    expenses = _visible_expenses(user)
+    deleted = changes.deleted
+    if not changes.reset:
+        expenses = expenses.filter(id__in=changes.changed)
+    expenses = list(_with_list_relations(expenses.order_by('id')))
+    if not changes.reset:
+        # Changed but no longer visible: the user was taken off the expense
+        visible = {expense.id for expense in expenses}
+        deleted = sorted(set(deleted) | {expense_id for expense_id in changes.changed if expense_id not in visible})
+    counterparties = changes.counterparties
+    balance_rows = _balances_result(_user_balances(user, counterparties)) if counterparties != set() else []
+    return Response({
+        "token": str(changes.token),
+        "reset": changes.reset,
+        "has_more": changes.has_more,
+        "expenses": ExpenseSerializer(expenses, many=True).data,
+        "deleted": deleted,
+        "balances": balance_rows,
+        "balance_users": None if counterparties is None else sorted(counterparties),
+    })
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -666,16 +1186,22 @@ def user_list(request):
     } for user in users]
     return Response(user_data)
 
+def _activity_feed(user):
+    return FeedEntry.objects.filter(user=user).order_by('-created_at', '-id')[:100]
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def activities(request):
     user = request.user
-    qs = Activity.objects.filter(involved_users=user).order_by('-created_at')[:100]
-    serializer = ActivitySerializer(qs, many=True)
+    qs = _activity_feed(user)
+    serializer = FeedEntrySerializer(qs, many=True)
     return Response(serializer.data)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([SettleUpThrottle])
 def settle_up(request):
     current_user = request.user
     target_id = request.data.get('user_id')
@@ -697,7 +1223,14 @@ def settle_up(request):
         | models.Q(expensesplit__user=current_user)
     ).prefetch_related('expensesplit_set__user', 'paid_by').distinct()
 
-    net = Decimal('0')
+    net = 0
+    checkpoint = checkpoints.latest_checkpoint()
+    if checkpoint:
+        for row in checkpoints.user_balances(checkpoint, current_user).filter(
+            models.Q(user_a=target_user) | models.Q(user_b=target_user), currency=currency
+        ):
+            net += checkpoints.signed_amount(row, current_user.id)
+        expenses = expenses.filter(expense_date__gt=checkpoint.as_of)
     for expense in expenses:
         splits = list(expense.expensesplit_set.all())
 
@@ -705,10 +1238,10 @@ def settle_up(request):
         for s in splits:
             entry = split_totals.setdefault(
                 s.user.id,
-                {"owed": Decimal('0'), "paid": Decimal('0')},
+                {"owed": 0, "paid": 0},
             )
-            entry["owed"] += Decimal(str(s.owed_amount))
-            entry["paid"] += Decimal(str(s.paid_amount))
+            entry["owed"] += s.owed_amount
+            entry["paid"] += s.paid_amount
 
         payer_id = expense.paid_by_id
         if payer_id == current_user.id:
@@ -743,13 +1276,14 @@ def settle_up(request):
                 added_by=current_user,
                 currency=currency,
             )
-            ExpenseSplit.objects.create(expense=settlement, user=target_user, paid_amount=amount, owed_amount=Decimal('0'))
-            ExpenseSplit.objects.create(expense=settlement, user=current_user, paid_amount=Decimal('0'), owed_amount=amount)
+            ExpenseSplit.objects.create(expense=settlement, user=target_user, paid_amount=amount, owed_amount=0)
+            ExpenseSplit.objects.create(expense=settlement, user=current_user, paid_amount=0, owed_amount=amount)
             settlement.participants.set([current_user.id, target_user.id])
-            _log_activity('settled', settlement, current_user, [
-                {"user": target_user.id, "paid_amount": amount, "owed_amount": Decimal('0')},
-                {"user": current_user.id, "paid_amount": Decimal('0'), "owed_amount": amount},
+            log_activity('settled', settlement, current_user, [
+                {"user": target_user.id, "paid_amount": amount, "owed_amount": 0},
+                {"user": current_user.id, "paid_amount": 0, "owed_amount": amount},
             ], [current_user.id, target_user.id], target_user.id)
+            search.index_expenses([settlement.id])
         else:
             # current_user owes target; current_user pays
             settlement = Expense.objects.create(
@@ -762,43 +1296,83 @@ def settle_up(request):
                 added_by=current_user,
                 currency=currency,
             )
-            ExpenseSplit.objects.create(expense=settlement, user=current_user, paid_amount=amount, owed_amount=Decimal('0'))
-            ExpenseSplit.objects.create(expense=settlement, user=target_user, paid_amount=Decimal('0'), owed_amount=amount)
+            ExpenseSplit.objects.create(expense=settlement, user=current_user, paid_amount=amount, owed_amount=0)
+            ExpenseSplit.objects.create(expense=settlement, user=target_user, paid_amount=0, owed_amount=amount)
             settlement.participants.set([current_user.id, target_user.id])
-            _log_activity('settled', settlement, current_user, [
-                {"user": current_user.id, "paid_amount": amount, "owed_amount": Decimal('0')},
-                {"user": target_user.id, "paid_amount": Decimal('0'), "owed_amount": amount},
+            log_activity('settled', settlement, current_user, [
+                {"user": current_user.id, "paid_amount": amount, "owed_amount": 0},
+                {"user": target_user.id, "paid_amount": 0, "owed_amount": amount},
             ], [current_user.id, target_user.id], current_user.id)
+            search.index_expenses([settlement.id])
+
+    return Response({"message": "Settled", "amount": money.format_amount(amount, currency), "with": target_user.id})
 
-    return Response({"message": "Settled", "amount": str(amount), "with": target_user.id})
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    if token:
+        if request.headers.get("Authorization", "") != f"Bearer {token}":
+            return HttpResponse(status=401)
+    elif not (request.user.is_authenticated and request.user.is_staff):
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 @ensure_csrf_cookie
 def csrf_token_view(request):
     return JsonResponse({"message": "CSRF cookie set"})
 
-@login_required
+SESSION_PROFILE_KEY = '_fairkeep_profile'
+
+
+def _store_session_profile(request, user):
+    request.session[SESSION_PROFILE_KEY] = {
+        "id": user.id,
+        "username": user.username,
+        "display_name": user.get_full_name() or user.username,
+        "checked_at": int(timezone.now().timestamp()),
+    }
+
+
 def check_session_view(request):
+    # Answer from the session itself: touching request.user costs a User
+    # lookup. The cached profile is re-validated against the user every
+    # SESSION_PROFILE_MAX_AGE seconds (password changes, deactivation).
+    session = request.session
+    profile = session.get(SESSION_PROFILE_KEY)
+    fresh = (
+        profile is not None
+        and str(profile.get("id")) == str(session.get(SESSION_KEY))
+        and timezone.now().timestamp() - profile.get("checked_at", 0) < settings.SESSION_PROFILE_MAX_AGE
+    )
+    if not fresh:
+        if session.get(SESSION_KEY) is None or not request.user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        _store_session_profile(request, request.user)
+        profile = session[SESSION_PROFILE_KEY]
     return JsonResponse({
         "authenticated": True,
-        "id": request.user.id,
-        "username": request.user.username,
-        "display_name": request.user.get_full_name() or request.user.username,
+        "id": profile["id"],
+        "username": profile["username"],
+        "display_name": profile["display_name"],
     }, status=200)
 
 @csrf_protect
 def login_view(request):
     if request.method == "POST":
-        if settings.DEBUG:
-            print("CSRF Headers:", request.headers)  # Debugging: Check for Origin and CSRF headers
-            print("CSRF Cookie:", request.COOKIES.get("csrftoken"))
+        logger.debug("Login CSRF origin=%s cookie=%s", request.headers.get("Origin"), bool(request.COOKIES.get("csrftoken")))
         try:
             body = json.loads(request.body)
             username = body.get("username")
             password = body.get("password")
-        
+
+            # Per name and IP, so others cannot lock an account out by guessing at it
+            user_key = f"name:{str(username).lower()}:{throttling.client_ip(request)}"
+            wait = throttling.check(request, 'login', user_key)
+            if wait:
+                return throttling.throttled_response(wait)
             user = authenticate(request, username=username, password=password)
             if user is not None:
                 login(request, user)
+                _store_session_profile(request, user)
                 # Generate a CSRF token
                 csrf_token = get_token(request)
                 return JsonResponse({"message": "Login successful", "csrftoken": csrf_token})
@@ -1,10 +1,13 @@
 """
 Django settings for FairKeep project.
 """
+import importlib.util
 import os
 from pathlib import Path
 from datetime import timedelta
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -33,18 +36,28 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'corsheaders',
     'rest_framework',
-    'django_extensions',
     'expenses',
 ]
 
+# Development-only apps (shell_plus, runserver_plus) from requirements-dev.txt.
+# Production installs requirements.txt only, so they load with DEBUG (or
+# DJANGO_DEV_APPS=True) and only when installed.
+DEV_APPS = ['django_extensions']
+if os.environ.get('DJANGO_DEV_APPS', str(DEBUG)).lower() in ('1', 'true', 'yes'):
+    INSTALLED_APPS += [app for app in DEV_APPS if importlib.util.find_spec(app)]
+
 MIDDLEWARE = [
+    'expenses.middleware.RequestTimingMiddleware',  # Outermost, to time the whole stack
     'corsheaders.middleware.CorsMiddleware',  # Must be at the top
     'django.middleware.security.SecurityMiddleware',
+    'expenses.middleware.CompressionMiddleware',  # Before anything that reads the body
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'expenses.routing.PrimaryStickinessMiddleware',
+    'expenses.middleware.RequestProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -69,10 +82,17 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'fairkeep.wsgi.application'
 
+# Serve the read-heavy endpoints from expenses.async_views (use with an ASGI server)
+ASYNC_READ_VIEWS = os.environ.get('DJANGO_ASYNC_VIEWS', 'False').lower() in ('1', 'true', 'yes')
+
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# DJANGO_PROFILE=production turns on the tuned server profile: pooled (or
+# persistent, health-checked) database connections; see also gunicorn.conf.py.
+PRODUCTION_PROFILE = os.environ.get('DJANGO_PROFILE', '').lower() == 'production'
+
 if os.environ.get('POSTGRES_DB'):
     DATABASES = {
         'default': {
@@ -82,15 +102,132 @@ if os.environ.get('POSTGRES_DB'):
             'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
             'HOST': os.environ.get('POSTGRES_HOST', 'db'),
             'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_HEALTH_CHECKS': True,
         }
     }
+    DB_POOL = os.environ.get('DJANGO_DB_POOL')
+    if DB_POOL is None:
+        DB_POOL = PRODUCTION_PROFILE
+    else:
+        DB_POOL = DB_POOL.lower() in ('1', 'true', 'yes')
+    if DB_POOL:
+        # psycopg_pool keeps connections per worker process; pooling and
+        # CONN_MAX_AGE are mutually exclusive in Django.
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.environ.get('DJANGO_DB_POOL_MIN', '2')),
+                'max_size': int(os.environ.get('DJANGO_DB_POOL_MAX', '10')),
+                'timeout': float(os.environ.get('DJANGO_DB_POOL_TIMEOUT', '10')),
+            },
+        }
+    else:
+        # Django does not reuse persistent connections under ASGI (each request
+        # gets its own thread context), so with gunicorn.conf.py's default
+        # uvicorn workers they would only pile up: close them per request.
+        asgi_worker = 'uvicorn' in os.environ.get('GUNICORN_WORKER_CLASS', 'uvicorn_worker.UvicornWorker')
+        DATABASES['default']['CONN_MAX_AGE'] = int(
+            os.environ.get('DJANGO_CONN_MAX_AGE', '600' if PRODUCTION_PROFILE and not asgi_worker else '0')
+        )
 else:
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': BASE_DIR / 'db.sqlite3',
+            'NAME': os.environ.get('DJANGO_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
         }
     }
+    # Concurrent workers on one file: WAL lets reads run alongside the writer,
+    # the busy timeout makes writers queue instead of failing with "database is
+    # locked", and BEGIN IMMEDIATE takes the write lock up front so a
+    # transaction never has to upgrade a read lock (which fails without waiting).
+    SQLITE_PRODUCTION_OPTIONS = {
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': int(os.environ.get('DJANGO_SQLITE_BUSY_TIMEOUT', '20')),
+        'init_command': ';'.join([
+            'PRAGMA journal_mode=WAL',
+            'PRAGMA synchronous=NORMAL',
+            f"PRAGMA mmap_size={int(os.environ.get('DJANGO_SQLITE_MMAP_MB', '256')) * 1024 * 1024}",
+            # Negative: KiB, per connection
+            f"PRAGMA cache_size=-{int(os.environ.get('DJANGO_SQLITE_CACHE_MB', '32')) * 1024}",
+            'PRAGMA temp_store=MEMORY',
+        ]),
+    }
+    if os.environ.get('DJANGO_SQLITE_PRODUCTION', str(PRODUCTION_PROFILE)).lower() in ('1', 'true', 'yes'):
+        DATABASES['default']['OPTIONS'] = SQLITE_PRODUCTION_OPTIONS
+
+# Read replicas for the read-only endpoints (expenses/routing.py): a
+# comma-separated list of hosts (host or host:port) for PostgreSQL, or of
+# database files for SQLite (see `refresh_sqlite_replicas`). Each becomes a
+# `replica_<n>` alias with the primary's other settings.
+DB_REPLICAS = []
+for index, location in enumerate(filter(None, os.environ.get('DJANGO_DB_REPLICAS', '').split(','))):
+    replica = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    if replica['ENGINE'] == 'django.db.backends.sqlite3':
+        replica['NAME'] = BASE_DIR / location.strip()
+    else:
+        host, _, port = location.strip().partition(':')
+        replica.update(HOST=host, PORT=port or replica['PORT'])
+    DATABASES[f'replica_{index}'] = replica
+    DB_REPLICAS.append(f'replica_{index}')
+DATABASE_ROUTERS = ['expenses.routing.ReplicaRouter']
+# Seconds a user's reads stay on the primary after they write
+DB_STICKY_SECONDS = int(os.environ.get('DJANGO_DB_STICKY_SECONDS', '10'))
+
+
+# Cache
+# Shared by all workers for cross-process state (event fan-out hints, etc.).
+# The default is per-process memory; use db/file/redis/memcached in production.
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'db': 'django.core.cache.backends.db.DatabaseCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+    'dummy': 'django.core.cache.backends.dummy.DummyCache',
+}
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[os.environ.get('DJANGO_CACHE_BACKEND', 'locmem')],
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', 'fairkeep_cache'),
+    }
+}
+if DB_REPLICAS and os.environ.get('DJANGO_CACHE_BACKEND', 'locmem') in ('locmem', 'dummy'):
+    # The read-your-writes mark (expenses/routing.py) must reach every worker
+    raise ImproperlyConfigured("DJANGO_DB_REPLICAS needs a shared DJANGO_CACHE_BACKEND (db, file, redis or memcached).")
+
+# Rendered expense fragments (expenses/render_cache.py); `dummy` turns it off.
+# Bounded by MAX_ENTRIES for locmem/db/file; give redis/memcached a maxmemory
+# eviction policy instead.
+RENDER_CACHE_ALIAS = 'render'
+RENDER_CACHE_BACKEND = os.environ.get('DJANGO_RENDER_CACHE_BACKEND', 'locmem')
+CACHES[RENDER_CACHE_ALIAS] = {
+    'BACKEND': CACHE_BACKENDS[RENDER_CACHE_BACKEND],
+    'LOCATION': os.environ.get('DJANGO_RENDER_CACHE_LOCATION', 'fairkeep_render'),
+    'TIMEOUT': 7 * 24 * 3600,
+}
+if RENDER_CACHE_BACKEND in ('locmem', 'db', 'file'):
+    CACHES[RENDER_CACHE_ALIAS]['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.environ.get('DJANGO_RENDER_CACHE_MAX_ENTRIES', '20000')),
+    }
+
+
+# Sessions
+# db (Django default), cached_db (reads served from the cache above, writes go
+# through to the DB), cache (cache only) or signed_cookies (no server storage).
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_ENGINE = SESSION_ENGINES[os.environ.get('DJANGO_SESSION_MODE', 'db')]
+if os.environ.get('DJANGO_SESSION_MODE', 'db') in ('cache', 'cached_db') and (
+    os.environ.get('DJANGO_CACHE_BACKEND', 'locmem') in ('locmem', 'dummy')
+):
+    # A per-process cache would lose sessions, or keep serving logged-out ones,
+    # on every worker but the one that wrote them
+    raise ImproperlyConfigured("DJANGO_SESSION_MODE=cache/cached_db needs a shared DJANGO_CACHE_BACKEND (db, file, redis or memcached).")
+# check-session/ answers from a profile cached in the session for this long
+SESSION_PROFILE_MAX_AGE = int(os.environ.get('DJANGO_SESSION_PROFILE_MAX_AGE', '300'))
 
 
 # Password validation
@@ -145,7 +282,97 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'expenses.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    # Token buckets per scope (expenses/throttling.py): "<scope>.user" and
+    # "<scope>.ip", each "N/period" = bursts of N, refilled at N per period
+    'DEFAULT_THROTTLE_RATES': {
+        'contact_search.user': os.environ.get('DJANGO_THROTTLE_CONTACT_SEARCH_USER', '60/min'),
+        'contact_search.ip': os.environ.get('DJANGO_THROTTLE_CONTACT_SEARCH_IP', '240/min'),
+        'export.user': os.environ.get('DJANGO_THROTTLE_EXPORT_USER', '20/hour'),
+        'export.ip': os.environ.get('DJANGO_THROTTLE_EXPORT_IP', '100/hour'),
+        'settle_up.user': os.environ.get('DJANGO_THROTTLE_SETTLE_UP_USER', '30/min'),
+        'login.user': os.environ.get('DJANGO_THROTTLE_LOGIN_USER', '10/min'),
+        'login.ip': os.environ.get('DJANGO_THROTTLE_LOGIN_IP', '30/min'),
+    },
+    # Reverse proxies in front of the app. 0 uses REMOTE_ADDR as the client IP
+    # and ignores X-Forwarded-For, which any client can set.
+    'NUM_PROXIES': int(os.environ.get('DJANGO_NUM_PROXIES', '0')),
 }
+THROTTLE_ENABLED = os.environ.get('DJANGO_THROTTLE_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+
+# Response compression (expenses.middleware.CompressionMiddleware): brotli when
+# installed and accepted, else gzip, for responses of at least COMPRESSION_MIN_SIZE bytes
+COMPRESSION_MIN_SIZE = int(os.environ.get('DJANGO_COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5
+# No text/html: admin pages carry CSRF tokens next to reflected input (BREACH);
+# they are left to the proxy's policy.
+COMPRESSION_CONTENT_TYPES = {'application/json', 'text/plain', 'text/csv'}
+
+# Expense search: 'auto' uses SQLite FTS5 when available, else the token table
+SEARCH_BACKEND = os.environ.get('DJANGO_SEARCH_BACKEND', 'auto')
+SEARCH_PAGE_SIZE = 20
+
+# Admin changelists count exactly up to this many rows, then estimate
+ADMIN_EXACT_COUNT_LIMIT = int(os.environ.get('DJANGO_ADMIN_EXACT_COUNT_LIMIT', '10000'))
+# Expenses per transaction in admin bulk actions
+ADMIN_BULK_BATCH_SIZE = 1000
+
+# POST /api/expenses/bulk/
+BULK_EXPENSE_MAX_ITEMS = int(os.environ.get('DJANGO_BULK_EXPENSE_MAX_ITEMS', '500'))
+
+# Server-Sent Events (api/events/stream/)
+SSE_POLL_INTERVAL = float(os.environ.get('DJANGO_SSE_POLL_INTERVAL', '1.0'))
+SSE_DB_POLL_INTERVAL = float(os.environ.get('DJANGO_SSE_DB_POLL_INTERVAL', '15'))
+SSE_HEARTBEAT_INTERVAL = 15
+SSE_MAX_DURATION = int(os.environ.get('DJANGO_SSE_MAX_DURATION', '300'))
+SSE_RETRY_MS = 3000
+SSE_LATEST_TIMEOUT = 24 * 3600
+CHANGE_EVENT_RETENTION_DAYS = int(os.environ.get('DJANGO_CHANGE_EVENT_RETENTION_DAYS', '7'))
+# Change events folded into one GET /api/sync/ response
+SYNC_MAX_CHANGES = int(os.environ.get('DJANGO_SYNC_MAX_CHANGES', '500'))
+
+# Full months before the current one that create_balance_checkpoint leaves
+# open by default; 0 closes everything up to the end of last month
+CHECKPOINT_OPEN_MONTHS = int(os.environ.get('DJANGO_CHECKPOINT_OPEN_MONTHS', '1'))
+
+# Activity feed retention (prune_feed)
+FEED_RETENTION_DAYS = int(os.environ.get('DJANGO_FEED_RETENTION_DAYS', '365'))
+
+# Background tasks (expenses/tasks.py, run_worker). Eager mode runs them inline
+# in the request, after it commits; exports too, so they only run in the
+# background with a worker. It stays the default, production included, since
+# nothing runs a worker unless one is deployed; set False once run_worker is running.
+TASKS_EAGER = os.environ.get('DJANGO_TASKS_EAGER', 'True').lower() in ('1', 'true', 'yes')
+TASK_LEASE_SECONDS = int(os.environ.get('DJANGO_TASK_LEASE_SECONDS', '300'))
+TASK_MAX_ATTEMPTS = int(os.environ.get('DJANGO_TASK_MAX_ATTEMPTS', '5'))
+TASK_RETRY_BACKOFF_SECONDS = 10
+TASK_POLL_INTERVAL = float(os.environ.get('DJANGO_TASK_POLL_INTERVAL', '1.0'))
+TASK_RETENTION_DAYS = int(os.environ.get('DJANGO_TASK_RETENTION_DAYS', '7'))
+
+# Export jobs (POST /api/exports/): files live under EXPORT_ROOT until prune_exports
+EXPORT_ROOT = os.environ.get('DJANGO_EXPORT_ROOT', str(BASE_DIR / 'exports'))
+EXPORT_RETENTION_HOURS = int(os.environ.get('DJANGO_EXPORT_RETENTION_HOURS', '24'))
+# Rows read per query, and between progress updates
+EXPORT_CHUNK_SIZE = 500
+
+# Request timing: Server-Timing header and /metrics (Prometheus text format).
+# When METRICS_TOKEN is set, scrapers authenticate with "Authorization: Bearer <token>";
+# otherwise /metrics is staff-only.
+SERVER_TIMING_HEADER = os.environ.get('DJANGO_SERVER_TIMING', 'True').lower() in ('1', 'true', 'yes')
+METRICS_TOKEN = os.environ.get('DJANGO_METRICS_TOKEN', '')
+
+# Request profiling: staff can send "X-Profile: 1" (or ?_profile=1) to capture a
+# request's cProfile output, SQL log and peak allocation sites. Requests slower
+# than DJANGO_SLOW_REQUEST_MS (0 disables) get their SQL log captured too, plus a
+# full profile when DJANGO_SLOW_REQUEST_PROFILE is set (costly: profiles every request).
+REQUEST_PROFILE_DIR = os.environ.get('DJANGO_REQUEST_PROFILE_DIR', str(BASE_DIR / 'profiles'))
+REQUEST_PROFILE_MAX_ENTRIES = int(os.environ.get('DJANGO_REQUEST_PROFILE_MAX_ENTRIES', '50'))
+SLOW_REQUEST_THRESHOLD_MS = int(os.environ.get('DJANGO_SLOW_REQUEST_MS', '0'))
+SLOW_REQUEST_PROFILE = os.environ.get('DJANGO_SLOW_REQUEST_PROFILE', 'False').lower() in ('1', 'true', 'yes')
 
 LOGGING = {
     'version': 1,
@@ -157,7 +384,7 @@ LOGGING = {
     },
     'root': {
         'handlers': ['console'],
-        'level': 'DEBUG',
+        'level': os.environ.get('DJANGO_LOG_LEVEL', 'INFO'),
     },
 }
 
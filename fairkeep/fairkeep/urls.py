@@ -14,11 +14,14 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from expenses.views import (
     ExpenseViewSet,
+    ExpenseGroupViewSet,
+    RecurringExpenseViewSet,
     login_view,
     logout_view,
     csrf_token_view,
@@ -30,6 +33,9 @@ from expenses.views import (
     user_detail,
     change_password,
     export_expenses,
+    export_jobs,
+    export_job_detail,
+    export_job_download,
     avatar_view,
     contacts_list,
     contact_search,
@@ -37,23 +43,33 @@ from expenses.views import (
     contact_requests,
     contact_request_accept,
     contact_delete,
+    metrics_view,
+    sync,
 )
+from expenses import async_views
 
 router = DefaultRouter()
 router.register(r'expenses', ExpenseViewSet)
+router.register(r'groups', ExpenseGroupViewSet)
+router.register(r'recurring-expenses', RecurringExpenseViewSet)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/', include(router.urls)),  # API endpoints
     path('api/login/', login_view, name='login'),  # Login endpoint
     path('api/logout/', logout_view, name='logout'),  # Logout endpoint
     path('api/csrf/', csrf_token_view, name='csrf_token'),
     path('api/check-session/', check_session_view, name='check_session'),
     path('api/balances/', balances, name='balances'),
+    path('api/sync/', sync, name='sync'),
     path('api/users/', user_list, name='user_list'),
     path('api/users/<int:user_id>/', user_detail, name='user_detail'),
     path('api/change-password/', change_password, name='change_password'),
     path('api/export-expenses/', export_expenses, name='export_expenses'),
+    path('api/exports/', export_jobs, name='export_jobs'),
+    path('api/exports/<int:pk>/', export_job_detail, name='export_job_detail'),
+    path('api/exports/<int:pk>/download/', export_job_download, name='export_job_download'),
     path('api/activities/', activities, name='activities'),
     path('api/settle/', settle_up, name='settle_up'),
     path('api/contacts/', contacts_list, name='contacts_list'),
@@ -63,4 +79,14 @@ urlpatterns = [
     path('api/contacts/requests/<int:pk>/accept/', contact_request_accept, name='contact_request_accept'),
     path('api/contacts/delete/', contact_delete, name='contact_delete'),
     path('api/avatar/', avatar_view, name='avatar_view'),
+    path('api/events/stream/', async_views.event_stream, name='event_stream'),
 ]
+
+if settings.ASYNC_READ_VIEWS:
+    # Listed first so they shadow the sync DRF views for the same paths
+    urlpatterns = [
+        path('api/expenses/', async_views.expense_list, name='expense-list'),
+        path('api/balances/', async_views.balances, name='balances'),
+        path('api/activities/', async_views.activities, name='activities'),
+        path('api/contacts/search/', async_views.contact_search, name='contact_search'),
+    ] + urlpatterns
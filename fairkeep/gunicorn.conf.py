@@ -0,0 +1,72 @@
+"""
+Gunicorn production profile.
+
+Gunicorn loads ./gunicorn.conf.py automatically, so running `gunicorn` from
+this directory picks it up. Every value can be overridden from the
+environment (GUNICORN_*); worker counts default to values derived from the
+CPUs available to the process.
+"""
+import gc
+import os
+
+os.environ.setdefault('DJANGO_PROFILE', 'production')
+
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def _cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+_cpus = _cpu_count()
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'uvicorn_worker.UvicornWorker')
+_asgi = 'uvicorn' in worker_class
+
+wsgi_app = os.environ.get('GUNICORN_APP', 'fairkeep.asgi:application' if _asgi else 'fairkeep.wsgi:application')
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# Async workers multiplex requests on an event loop, so one per core (+1 to
+# cover I/O stalls) is enough; sync workers use the classic 2n+1 with threads.
+workers = int(os.environ.get('GUNICORN_WORKERS', _cpus + 1 if _asgi else 2 * _cpus + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', '1' if _asgi else '4'))
+if not _asgi and threads > 1 and worker_class == 'sync':
+    worker_class = 'gthread'
+
+preload_app = _env_bool('GUNICORN_PRELOAD', True)
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+# Recycle workers periodically to bound memory growth; jitter avoids all of
+# them restarting at once.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', '200'))
+accesslog = os.environ.get('GUNICORN_ACCESSLOG', '-') or None
+
+
+def when_ready(server):
+    # Runs in the master after the preloaded app is imported and before any
+    # worker is forked. Freezing moves every object so far into a permanent
+    # generation the cyclic GC never scans, so the workers' collections do not
+    # write to (and un-share) the copy-on-write pages inherited from the master.
+    if preload_app and _env_bool('GUNICORN_GC_FREEZE', True):
+        gc.collect()
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    # With preload the app is imported in the master; never share its
+    # database connections (or a pool) with the forked workers. Without it
+    # Django is not set up yet and there is nothing to close.
+    if not preload_app:
+        return
+    from django.db import connections
+    connections.close_all()
@@ -151,10 +151,17 @@ const UserProfile = ({ logout }) => {
         setExporting(true);
         try {
             const offset = new Date().getTimezoneOffset();
-            const res = await api.get("export-expenses/", {
-                responseType: "blob",
-                params: { tz_offset: offset },
-            });
+            // Large histories are exported by a background job; poll until the file is ready
+            let { data: job } = await api.post("exports/", { tz_offset: offset });
+            while (job.status === "queued" || job.status === "running") {
+                setExportMessage(`Preparing export... ${Math.round(job.progress * 100)}%`);
+                await new Promise((resolve) => setTimeout(resolve, 1000));
+                ({ data: job } = await api.get(`exports/${job.id}/`));
+            }
+            if (job.status !== "done") {
+                throw new Error(job.error || "Export failed");
+            }
+            const res = await api.get(`exports/${job.id}/download/`, { responseType: "blob" });
             const blob = new Blob([res.data], { type: "text/csv" });
             const stamp = new Date();
             const pad = (n) => String(n).padStart(2, "0");